@@ -0,0 +1,185 @@
+"""
+Admission control: per-key rate limits and per-endpoint concurrency limits.
+
+Runs before anything reads or parses the request body, so a client flooding
+the integration gets a cheap 429 (with `Retry-After`) instead of taking
+worker time from everyone else. Callers are identified by the `keyId` of
+their signature once the signed headers check out (an HMAC, without reading
+the body; the digest and the date are verified later, by `auth`). Requests
+without a valid signature are limited by remote address, so a forged `keyId`
+can't use up a real client's bucket.
+
+With `ADMISSION_STATE_DIR` set the limits hold across all workers on the
+host: token buckets live in a SQLite file, and concurrency slots are lock
+files, so a slot is released by the OS even if its worker dies. Otherwise
+each worker process enforces them on its own.
+"""
+
+import fcntl
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from flask import Response, g, request
+
+from app.auth import auth
+from app.local_store import LocalStore
+from app.startup import admission_burst, admission_concurrency, admission_rate, admission_state_dir
+
+BUCKETS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS token_buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+) WITHOUT ROWID;
+'''
+
+
+class TokenBuckets:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _take(self, tokens: float, updated: float, now: float) -> Tuple[float, Optional[float]]:
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, None
+        return tokens, (1 - tokens) / self.rate
+
+    def acquire(self, key: str) -> Optional[float]:
+        """ Takes a token for `key`, or returns how many seconds until one is available. """
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens, retry_after = self._take(tokens, updated, now)
+            self._buckets[key] = (tokens, now)
+        return retry_after
+
+
+class SharedTokenBuckets(TokenBuckets):
+    def __init__(self, rate: float, burst: float, path: str):
+        super().__init__(rate, burst)
+        self.store = LocalStore(path, BUCKETS_SCHEMA)
+
+    def acquire(self, key: str) -> Optional[float]:
+        with self.store.transaction() as db:
+            now = time.time()
+            row = db.execute('SELECT tokens, updated FROM token_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, retry_after = self._take(*(row or (self.burst, now)), now)
+            db.execute('INSERT OR REPLACE INTO token_buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                       (key, tokens, now))
+        return retry_after
+
+
+class ConcurrencySlots:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, endpoint: str):
+        """ Returns a slot to pass to `release`, or None if the endpoint is at its limit. """
+        with self._lock:
+            semaphore = self._semaphores.setdefault(endpoint, threading.BoundedSemaphore(self.limit))
+        return semaphore if semaphore.acquire(blocking=False) else None
+
+    def release(self, slot):
+        slot.release()
+
+
+class SharedConcurrencySlots(ConcurrencySlots):
+    def __init__(self, limit: int, directory: str):
+        super().__init__(limit)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # Files opened per process; each holds one flock'd slot while in use
+        self._files: Dict[str, List] = {}
+        self._pid = os.getpid()
+
+    def acquire(self, endpoint: str):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._files, self._pid = {}, os.getpid()
+            files = self._files.setdefault(endpoint, [])
+            for i in range(self.limit):
+                if i == len(files):
+                    files.append([open(os.path.join(self.directory, f'{endpoint}.{i}.slot'), 'w'), False])
+                slot = files[i]
+                # Threads of this process share the open file, so they have to
+                # be kept apart here: flock only excludes other processes.
+                if slot[1]:
+                    continue
+                try:
+                    fcntl.flock(slot[0], fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                slot[1] = True
+                return slot
+        return None
+
+    def release(self, slot):
+        with self._lock:
+            fcntl.flock(slot[0], fcntl.LOCK_UN)
+            slot[1] = False
+
+
+def _bucket_key() -> str:
+    header = request.headers.get('Authorization', '')
+    scheme, _, token = header.partition(' ')
+    key_id = auth.verified_key_id(token) if scheme.lower() == 'signature' else None
+    if key_id is not None:
+        return f'key:{key_id}'
+    return f'addr:{request.remote_addr}'
+
+
+def _too_many_requests(retry_after: float) -> Response:
+    return Response('Too many requests', status=429, headers={'Retry-After': str(math.ceil(retry_after))})
+
+
+class AdmissionControl:
+    def __init__(self, buckets: Optional[TokenBuckets], slots: Optional[ConcurrencySlots]):
+        self.buckets = buckets
+        self.slots = slots
+
+    def before_request(self) -> Optional[Response]:
+        if self.buckets is not None:
+            retry_after = self.buckets.acquire(_bucket_key())
+            if retry_after is not None:
+                return _too_many_requests(retry_after)
+
+        if self.slots is not None and request.endpoint is not None:
+            slot = self.slots.acquire(request.endpoint)
+            if slot is None:
+                return _too_many_requests(1)
+            g.admission_slot = slot
+
+        return None
+
+    def teardown_request(self, _exc):
+        slot = g.pop('admission_slot', None)
+        if slot is not None:
+            self.slots.release(slot)
+
+
+def _from_config() -> AdmissionControl:
+    buckets = slots = None
+    if admission_rate:
+        burst = admission_burst or admission_rate
+        if admission_state_dir:
+            os.makedirs(admission_state_dir, exist_ok=True)
+            buckets = SharedTokenBuckets(admission_rate, burst, os.path.join(admission_state_dir, 'buckets.db'))
+        else:
+            buckets = TokenBuckets(admission_rate, burst)
+    if admission_concurrency:
+        if admission_state_dir:
+            slots = SharedConcurrencySlots(admission_concurrency, os.path.join(admission_state_dir, 'slots'))
+        else:
+            slots = ConcurrencySlots(admission_concurrency)
+    return AdmissionControl(buckets, slots)
+
+
+admission = _from_config()
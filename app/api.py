@@ -1,7 +1,9 @@
 import inspect
+import json
 from functools import wraps
-from typing import Iterable, TypeVar, Optional, Type, List
+from typing import BinaryIO, Iterable, TypeVar, Optional, Type, List
 
+import msgpack
 from flask import abort, request, Response, jsonify
 from schematics import Model
 from schematics.common import NOT_NONE
@@ -12,6 +14,10 @@ from schematics.types import (
 from schematics.exceptions import DataError
 from schematics.types.base import TypeMeta
 from schematics.types.serializable import serializable
+from werkzeug.wsgi import wrap_file
+
+from app import tracing
+from app.countries import normalize_country
 
 # Validation
 T = TypeVar('T')
@@ -36,12 +42,48 @@ def _get_input_annotation(signature: inspect.signature) -> Optional[Type[Model]]
     return first_param.annotation
 
 
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ['application/msgpack', 'application/vnd.msgpack', 'application/x-msgpack']
+
+
+def response_mimetype() -> str:
+    """
+    The encoding of the response, from the request's `Accept` header: JSON,
+    unless the client prefers MessagePack.
+    """
+    if not request.accept_mimetypes:
+        return JSON_MIMETYPE
+    return request.accept_mimetypes.best_match([JSON_MIMETYPE, *MSGPACK_MIMETYPES], default=JSON_MIMETYPE)
+
+
+def encode_response(data, mimetype: str) -> Response:
+    """
+    A response of `data`, the serialised form of a model. Both encodings
+    carry the same primitives, so dates and UUIDs are the same strings.
+    """
+    if mimetype == JSON_MIMETYPE:
+        return jsonify(data)
+    return Response(msgpack.packb(data), mimetype=mimetype)
+
+
+def transcode_response(response: Response, mimetype: str) -> Response:
+    """ Re-encodes a JSON response that was serialised ahead of time. """
+    if mimetype == JSON_MIMETYPE or response.mimetype != JSON_MIMETYPE:
+        return response
+    # Pass-through bodies (see `passthrough_response`) are only iterable
+    body = b''.join(response.response) if response.direct_passthrough else response.get_data()
+    response.close()
+    data = json.loads(body)
+    return Response(msgpack.packb(data), status=response.status_code, mimetype=mimetype)
+
+
 def validate_models(fn):
     """
     Creates a Schematics Model from the request data and validates it.
 
     Throws DataError if invalid.
-    Otherwise, it passes the validated request data to the wrapped function.
+    Otherwise, it passes the validated request data to the wrapped function,
+    and encodes its result as the client asked (see `response_mimetype`).
     """
 
     signature = inspect.signature(fn)
@@ -54,24 +96,64 @@ def validate_models(fn):
     @wraps(fn)
     def wrapped_fn(*args, **kwargs):
         if input_model is None:
-            res = fn(*args, **kwargs)
+            with tracing.span('handler', handler=fn.__name__):
+                res = fn(*args, **kwargs)
         else:
             model = None
-            try:
-                model = input_model().import_data(request.json, apply_defaults=True)
-                model.validate()
-            except DataError as e:
-                abort(Response(str(e), status=400))
+            with tracing.span('validate_models', model=input_model.__name__):
+                try:
+                    model = input_model().import_data(request.json, apply_defaults=True)
+                    model.validate()
+                except DataError as e:
+                    abort(Response(str(e), status=400))
 
-            res = fn(model, *args, **kwargs)
+            with tracing.span('handler', handler=fn.__name__):
+                res = fn(model, *args, **kwargs)
 
-        assert isinstance(res, output_model)
+        mimetype = response_mimetype()
 
-        return jsonify(res.serialize())
+        with tracing.span('encode_response', mimetype=mimetype):
+            # Handlers may return an already serialised body (see `json_response`)
+            if isinstance(res, Response):
+                return transcode_response(res, mimetype)
+
+            assert isinstance(res, output_model)
+
+            return encode_response(res.serialize(), mimetype)
 
     return wrapped_fn
 
 
+def serialize_json(model: Model) -> bytes:
+    """ Serialises `model` the way `jsonify` does, without needing an app context. """
+    return json.dumps(model.serialize(), separators=(',', ':'), sort_keys=True).encode() + b'\n'
+
+
+def json_response(body: bytes, mimetype: str = JSON_MIMETYPE) -> Response:
+    return Response(body, mimetype=mimetype)
+
+
+def passthrough_response(*chunks: bytes) -> Response:
+    """
+    A JSON response whose body is `chunks`, handed to the WSGI server as
+    they are: nothing joins, re-encodes or (in the logging hooks) decodes them.
+    """
+    response = Response(chunks, mimetype='application/json', direct_passthrough=True)
+    response.content_length = sum(len(chunk) for chunk in chunks)
+    return response
+
+
+def file_response(file: BinaryIO, length: int) -> Response:
+    """
+    A JSON response of the next `length` bytes of `file`, through the
+    server's `wsgi.file_wrapper`: gunicorn sends it with sendfile(2), without
+    copying it into the worker at all.
+    """
+    response = Response(wrap_file(request.environ, file), mimetype='application/json', direct_passthrough=True)
+    response.content_length = length
+    return response
+
+
 class BaseModel(Model):
     class Options:
         export_level = NOT_NONE
@@ -168,9 +250,17 @@ class Flag(BaseModel):
     label = StringType(default=None)
 
 
+class CountryCodeType(StringType):
+    """ An ISO 3166-1 alpha-3 code. Other codes and names of countries are converted to it. """
+
+    def to_native(self, value, context=None):
+        value = super().to_native(value, context)
+        return normalize_country(value) or value
+
+
 class CountryMatch(BaseModel):
     type = CountryMatchType(required=True)
-    country_code = StringType(min_length=3, max_length=3, required=True)
+    country_code = CountryCodeType(min_length=3, max_length=3, required=True)
     label = StringType()
 
 
@@ -311,18 +401,57 @@ class ScreeningHit(BaseModel):
     data = ModelType(HitData, default=dict, required=True)
 
 
+class FullName(BaseModel):
+    given_names = ListType(StringType, default=list)
+    family_name = StringType(default=None)
+
+
+class PersonalDetails(BaseModel):
+    name = ModelType(FullName, default=None)
+    dob = StringType(default=None)
+    nationality = StringType(default=None)
+
+
+class CompanyMetadata(BaseModel):
+    name = StringType(default=None)
+    number = StringType(default=None)
+    country_of_incorporation = StringType(default=None)
+
+
 class EntityData(BaseModel):
     entity_type = EntityType(required=True)
-    
+
+    personal_details = ModelType(PersonalDetails, default=None)
+    metadata = ModelType(CompanyMetadata, default=None)
+
     screening_hits = ListType(ModelType(ScreeningHit))
 
+    def search_name(self) -> Optional[str]:
+        if self.entity_type == EntityType.INDIVIDUAL:
+            if self.personal_details is None or self.personal_details.name is None:
+                return None
+            name = self.personal_details.name
+            return ' '.join([*name.given_names, name.family_name or '']).strip() or None
+
+        if self.metadata is None:
+            return None
+        return self.metadata.name
+
+    def input_country(self) -> Optional[str]:
+        """ The nationality or country of incorporation, as given. """
+        if self.entity_type == EntityType.INDIVIDUAL:
+            return self.personal_details.nationality if self.personal_details is not None else None
+        return self.metadata.country_of_incorporation if self.metadata is not None else None
+
 
 class AddressType(StringType, metaclass=EnumMeta):
     STRUCTURED = 'STRUCTURED'
 
 
 class ProviderConfig(BaseModel):
-    ...
+    ongoing_monitoring = BooleanType(default=False)
+    # Send the hits found so far with pending polls (see `app.hit_log`)
+    partial_results = BooleanType(default=False)
 
 
 class ProviderCredentials(BaseModel):
@@ -332,6 +461,8 @@ class ProviderCredentials(BaseModel):
 # Local field names (for errors)
 class Field(StringType):
     COUNTRY_OF_INCORPORATION = 'COUNTRY_OF_INCORPORATION'
+    COMPANY_NAME = 'COMPANY_NAME'
+    NAME = 'NAME'
 
 class Warning(BaseModel):
     ...
@@ -360,6 +491,13 @@ class Error(BaseModel):
             'message': f'Missing required field ({field})',
         })
 
+    @staticmethod
+    def provider_connection(message: str):
+        return Error({
+            'type': ErrorType.PROVIDER_CONNECTION,
+            'message': message,
+        })
+
 
 
 class Warn(BaseModel):
@@ -374,8 +512,17 @@ class Charge(BaseModel):
     sku = StringType(default=None)
 
 
+class ScreeningQuery(BaseModel):
+    name = StringType(required=True)
+    dob = StringType(default=None)
+
+
 class CustomData(BaseModel):
     counter = IntType(required=True)
+    # Only set for real (non-demo) checks, so the poll can run the search
+    query = ModelType(ScreeningQuery, default=None)
+    # Hits already sent to the client, with partial results
+    cursor = IntType(default=None)
 
 class StartCheckRequest(BaseModel):
     id = UUIDType(required=True)
@@ -1,6 +1,13 @@
-from flask import Flask, request
+import logging
+
+from flask import Flask, jsonify, request
 from flask.logging import create_logger
 
+from app import deadlines, metrics, tracing
+from app.admission import admission
+from app.api import MSGPACK_MIMETYPES
+from app.auth import auth
+from app.capture import capture
 from app.company import blueprint as company_blueprint
 from app.individual import blueprint as individual_blueprint
 
@@ -9,8 +16,62 @@ from app.individual import blueprint as individual_blueprint
 app = Flask(__name__)
 logger = create_logger(app)
 
+# Registered first, so the trace covers the whole request (and its teardown
+# last, as teardown hooks run in reverse)
+@app.before_request
+def start_trace():
+    tracing.before_request()
+
+
+@app.teardown_request
+def end_trace(exc):
+    tracing.teardown_request(exc)
+
+
+@app.after_request
+def trace_response(response):
+    return tracing.after_request(response)
+
+
+# Registered early: shedding load must not wait for the body to be read
+@app.before_request
+def admit_request():
+    return admission.before_request()
+
+
+@app.teardown_request
+def release_admission(exc):
+    admission.teardown_request(exc)
+
+
+@app.before_request
+def start_capture():
+    capture.before_request()
+
+
+# Registered before the logging: after-request hooks run in reverse, and this
+# one must be the last, as it hands the response body over to the server
+@app.after_request
+def end_capture(response):
+    return capture.after_request(response)
+
+
 @app.before_request
+def start_deadline():
+    deadlines.before_request()
+
+
+@app.teardown_request
+def end_deadline(exc):
+    deadlines.teardown_request(exc)
+
+
+@app.before_request
+@tracing.traced('log_request')
 def pre_request_logging():
+    if not logger.isEnabledFor(logging.INFO):
+        return
+
     request_data = '\n' + request.data.decode('utf8')
     request_data = request_data.replace('\n', '\n    ')
 
@@ -18,9 +79,17 @@ def pre_request_logging():
 
 
 @app.after_request
+@tracing.traced('log_response')
 def post_request_logging(response):
-    if response.direct_passthrough:
-        response_data = '\n(direct pass-through)'
+    if not logger.isEnabledFor(logging.INFO):
+        return response
+
+    # Pass-through bodies (files, precomputed payloads) go to the server
+    # untouched: reading them here would buffer and decode them
+    if response.direct_passthrough or response.is_streamed:
+        response_data = f'\n({response.content_length} bytes, passed through)'
+    elif response.mimetype in MSGPACK_MIMETYPES:
+        response_data = f'\n({response.content_length} bytes of {response.mimetype})'
     else:
         response_data = '\n' + response.data.decode('utf8')
     response_data = response_data.replace('\n', '\n    ')
@@ -28,5 +97,12 @@ def post_request_logging(response):
     logger.info(f'{response.status} {request.url}{response_data}')
     return response
 
+
+@app.route('/metrics')
+@auth.login_required
+def get_metrics():
+    return jsonify(metrics.snapshot())
+
+
 app.register_blueprint(company_blueprint)
 app.register_blueprint(individual_blueprint)
\ No newline at end of file
@@ -1,7 +1,6 @@
-from requests_http_signature import HTTPSignatureAuth as OutboundSignatureAuth
-
 from app.http_signature import HTTPSignatureAuth
-from app.startup import integration_key_store, integration_key_id
+from app import startup
+from app.startup import integration_key_store
 
 auth = HTTPSignatureAuth()
 
@@ -11,8 +10,12 @@ def resolve_key(key_id):
 
 
 def outbound_auth(headers=None):
+    # Imported on first use: `requests` is a large share of import time, and
+    # only requests to providers need it
+    from requests_http_signature import HTTPSignatureAuth as OutboundSignatureAuth
+
     return OutboundSignatureAuth(
-        key=resolve_key(integration_key_id),
-        key_id=integration_key_id,
+        key=resolve_key(startup.integration_key_id),
+        key_id=startup.integration_key_id,
         headers=['(request-target)', 'date'] if headers is None else headers
     )
\ No newline at end of file
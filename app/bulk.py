@@ -0,0 +1,210 @@
+"""
+Offline batch screening of a JSON lines file.
+
+    python -m app.bulk checks.jsonl results.jsonl --processes 8
+
+Each input line is a `StartCheckRequest`; the matching output line is the
+final `PollCheckResponse`. Checks go through the app itself, in-process:
+each request is signed with the integration key and sent through the
+blueprints, so they are validated and screened exactly as over HTTP.
+
+Lines are screened in batches by a pool of processes. Only a few batches per
+process are in flight at a time, so memory stays bounded whatever the size
+of the input. Output lines are written in input order, so a run that was
+interrupted resumes after the last complete line of the output.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
+
+from app import jobs
+from app.api import Error, ErrorType, PollCheckResponse
+
+# Polls of a check before giving up on it
+MAX_POLLS = 1000
+# Seconds between polls of a check that is waiting for a background job
+POLL_INTERVAL = 0.05
+
+_PATHS = {'INDIVIDUAL': 'individual', 'COMPANY': 'company'}
+
+# Set in each pool process by `_init_worker`
+_client = None
+
+
+def _error_line(error_type: str, message: str) -> bytes:
+    response = PollCheckResponse.error([Error({'type': error_type, 'message': message})])
+    return json.dumps(response.serialize(), separators=(',', ':')).encode()
+
+
+def _init_worker(verbose: bool):
+    global _client
+    from app.application import app, logger
+
+    if not verbose:
+        # The request logging would write every check to stderr
+        logger.setLevel(logging.WARNING)
+    _client = app.test_client()
+
+
+def _post(path: str, body: dict):
+    # Signed like PassFort signs its requests, so they pass `auth` as any other
+    from requests import Request
+
+    from app.auth import outbound_auth
+
+    signed = Request('POST', f'http://localhost{path}', json=body, auth=outbound_auth()).prepare()
+    return _client.post(path, data=signed.body, headers=dict(signed.headers))
+
+
+def screen_line(line: bytes) -> Tuple[bytes, bool]:
+    """ Runs the check of one input line. Returns the output line and whether it has errors. """
+    try:
+        req = json.loads(line)
+        path = _PATHS[req['check_input']['entity_type']]
+    except ValueError as e:
+        return _error_line(ErrorType.INVALID_CHECK_INPUT, f'Invalid JSON: {e}'), True
+    except (KeyError, TypeError):
+        return _error_line(ErrorType.INVALID_CHECK_INPUT, 'Missing or unsupported check_input.entity_type'), True
+
+    r = _post(f'/{path}/checks', req)
+    if r.status_code != 200:
+        return _error_line(ErrorType.INVALID_CHECK_INPUT, r.get_data(as_text=True)), True
+    start = r.get_json()
+    if start.get('errors'):
+        return json.dumps({**start, 'pending': False}, separators=(',', ':')).encode(), True
+
+    poll = {
+        'id': req['id'],
+        'provider_id': start['provider_id'],
+        'reference': start['reference'],
+        'demo_result': req.get('demo_result'),
+        'commercial_relationship': req['commercial_relationship'],
+        'provider_config': req['provider_config'],
+        'custom_data': start['custom_data'],
+    }
+    for _ in range(MAX_POLLS):
+        r = _post(f"/{path}/checks/{req['id']}/poll", poll)
+        if r.status_code != 200:
+            return _error_line(ErrorType.PROVIDER_CONNECTION, r.get_data(as_text=True)), True
+        body = r.get_data()
+        result = json.loads(body)
+        if not result.get('pending'):
+            body = body.strip()
+            if b'\n' in body:
+                body = json.dumps(result, separators=(',', ':')).encode()
+            return body, bool(result.get('errors'))
+
+        if result['custom_data'] == poll['custom_data']:
+            time.sleep(POLL_INTERVAL)
+        poll['custom_data'] = result['custom_data']
+
+    return _error_line(ErrorType.PROVIDER_CONNECTION, f'Check still pending after {MAX_POLLS} polls'), True
+
+
+def screen_batch(lines: List[bytes]) -> List[Tuple[bytes, bool]]:
+    # Interactive checks go first in a shared job queue
+    with jobs.priority(jobs.PRIORITY_BULK):
+        return [screen_line(line) for line in lines]
+
+
+def _resume(output_path: str) -> int:
+    # Drops a partly written last line, and returns how many complete lines there are
+    if not os.path.exists(output_path):
+        return 0
+    lines = complete = offset = 0
+    with open(output_path, 'rb+') as file:
+        for block in iter(lambda: file.read(2 ** 20), b''):
+            lines += block.count(b'\n')
+            end = block.rfind(b'\n')
+            if end >= 0:
+                complete = offset + end + 1
+            offset += len(block)
+        file.truncate(complete)
+    return lines
+
+
+def _batches(path: str, skip: int, size: int) -> Iterator[List[bytes]]:
+    with open(path, 'rb') as file:
+        lines = islice((line for line in file if line.strip()), skip, None)
+        while True:
+            batch = list(islice(lines, size))
+            if not batch:
+                return
+            yield batch
+
+
+class Progress:
+    def __init__(self, done: int, every: float = 1.0, out=sys.stderr):
+        self.done = self.resumed = done
+        self.errors = 0
+        self.every = every
+        self.out = out
+        self.start = self._reported = time.monotonic()
+
+    def add(self, results: List[Tuple[bytes, bool]]):
+        self.done += len(results)
+        self.errors += sum(failed for _, failed in results)
+        if time.monotonic() - self._reported >= self.every:
+            self.report()
+
+    def rate(self) -> float:
+        return (self.done - self.resumed) / max(time.monotonic() - self.start, 1e-9)
+
+    def report(self, final: bool = False):
+        self._reported = time.monotonic()
+        prefix = 'Screened' if final else '...'
+        print(f'{prefix} {self.done} checks ({self.errors} with errors), {self.rate():.1f} checks/s', file=self.out)
+
+
+def run(input_path: str, output_path: str, processes: Optional[int] = None, batch_size: int = 50,
+        verbose: bool = False) -> Progress:
+    processes = processes or os.cpu_count()
+    done = _resume(output_path)
+    if done:
+        print(f'Resuming after {done} checks', file=sys.stderr)
+    progress = Progress(done)
+
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(verbose,)) as pool, \
+            open(output_path, 'ab') as output:
+        pending = deque()
+
+        def write_oldest():
+            results = pending.popleft().get()
+            output.writelines(line + b'\n' for line, _ in results)
+            output.flush()
+            progress.add(results)
+
+        for batch in _batches(input_path, done, batch_size):
+            pending.append(pool.apply_async(screen_batch, (batch,)))
+            # A few batches per process keep them busy; more would only use memory
+            if len(pending) >= 4 * processes:
+                write_oldest()
+        while pending:
+            write_oldest()
+
+    progress.report(final=True)
+    return progress
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.bulk', description=__doc__.split('\n\n')[0])
+    parser.add_argument('input', help='StartCheckRequest JSON lines')
+    parser.add_argument('output', help='PollCheckResponse JSON lines, appended to when resuming')
+    parser.add_argument('--processes', type=int, help='default: the number of CPUs')
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--verbose', action='store_true', help='log every request and response')
+    args = parser.parse_args(argv)
+
+    run(args.input, args.output, args.processes, args.batch_size, args.verbose)
+
+
+if __name__ == '__main__':
+    main()
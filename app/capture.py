@@ -0,0 +1,198 @@
+"""
+Opt-in capture of live traffic, for replaying it later (see `app.replay`).
+
+With `CAPTURE_PATH` set, a sample of the requests (`CAPTURE_SAMPLE_RATE`,
+default 0.1) is recorded with its response and timing, as one JSON line per
+request. Personal data is redacted first: the values of `REDACTED_FIELDS`
+become pseudonyms of the same shape (letters for letters, digits for digits),
+keyed with the integration key, so a value always gets the same pseudonym and
+replayed checks still validate and hit the caches like the originals did.
+Signatures and other credentials are not recorded.
+
+Records are written by a background thread in each process. If it falls
+behind, records are dropped (counted in `capture.dropped`) rather than
+slowing requests down.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import queue
+import random
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+
+from flask import Response, g, request
+
+from app import deadlines, metrics, startup
+from app.api import MSGPACK_MIMETYPES
+from app.startup import capture_path, capture_sample_rate
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Keys whose values (and everything in them) are personal data
+REDACTED_FIELDS = frozenset({
+    'aliases', 'apikey', 'date', 'dob', 'family_name', 'given_names', 'name', 'number', 'snippet', 'title', 'url',
+})
+# The only request headers recorded; the replay signs requests again
+RECORDED_HEADERS = ('Accept', 'Content-Type', deadlines.HEADER)
+
+
+def _pseudonym(value: str, key: bytes) -> str:
+    digest = hmac.new(key, value.encode(), hashlib.sha256).digest()
+    chars = []
+    for i, char in enumerate(value):
+        byte = digest[i % len(digest)]
+        if char.isdigit():
+            chars.append(str(byte % 10))
+        elif char.isalpha():
+            letter = chr(ord('a') + byte % 26)
+            chars.append(letter.upper() if char.isupper() else letter)
+        else:
+            chars.append(char)
+    return ''.join(chars)
+
+
+def _pseudonymize(value, key: bytes):
+    if isinstance(value, str):
+        return _pseudonym(value, key)
+    if isinstance(value, dict):
+        return {k: _pseudonymize(v, key) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_pseudonymize(v, key) for v in value]
+    return value
+
+
+def redact(value, key: bytes):
+    """ `value` (decoded JSON) with the values of `REDACTED_FIELDS` replaced by pseudonyms. """
+    if isinstance(value, dict):
+        return {k: _pseudonymize(v, key) if k in REDACTED_FIELDS else redact(v, key) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v, key) for v in value]
+    return value
+
+
+def decode_body(body: bytes, mimetype: str):
+    """ A JSON or MessagePack body, decoded; None if it is empty or neither. """
+    if not body:
+        return None
+    try:
+        if mimetype in MSGPACK_MIMETYPES:
+            return msgpack.unpackb(body) if msgpack is not None else None
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+class _Tee:
+    # Passes a response body on to the server, keeping a copy. The server
+    # closes it once the body is sent, which completes the record.
+    def __init__(self, body: Iterable[bytes], on_close: Callable[[bytes], None]):
+        self.body = body
+        self.on_close = on_close
+        self.chunks: List[bytes] = []
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.chunks.append(chunk)
+            yield chunk
+
+    def close(self):
+        if hasattr(self.body, 'close'):
+            self.body.close()
+        self.on_close(b''.join(self.chunks))
+
+
+class CaptureWriter:
+    """ Appends records to `path` from a background thread, one per process. """
+
+    def __init__(self, path: str, max_queued: int = 1000):
+        self.path = path
+        self.max_queued = max_queued
+        self._queue: Optional[queue.Queue] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _get_queue(self) -> queue.Queue:
+        # Started on first use in each process, like the pool in `app.workers`
+        with self._lock:
+            if self._queue is None or self._pid != os.getpid():
+                self._queue = queue.Queue(self.max_queued)
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, args=(self._queue,), name='capture', daemon=True).start()
+            return self._queue
+
+    def write(self, record: dict):
+        try:
+            self._get_queue().put_nowait(record)
+        except queue.Full:
+            metrics.increment('capture.dropped')
+
+    def flush(self):
+        """ Waits until the records written so far are in the file. """
+        self._get_queue().join()
+
+    def _run(self, records: queue.Queue):
+        # Each batch is one write to a file opened for appending, so the
+        # lines of the workers on a host don't interleave
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        while True:
+            batch = [records.get()]
+            while len(batch) < 100:
+                try:
+                    batch.append(records.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                os.write(fd, b''.join(json.dumps(record, separators=(',', ':')).encode() + b'\n'
+                                      for record in batch))
+                metrics.increment('capture.recorded', len(batch))
+            except OSError:
+                metrics.increment('capture.dropped', len(batch))
+            for _ in batch:
+                records.task_done()
+
+
+class TrafficCapture:
+    def __init__(self, writer: Optional[CaptureWriter], sample_rate: float):
+        self.writer = writer
+        self.sample_rate = sample_rate
+
+    def before_request(self):
+        if self.writer is not None and random.random() < self.sample_rate:
+            g.capture_start = (time.time(), time.perf_counter())
+
+    def after_request(self, response: Response) -> Response:
+        started = g.pop('capture_start', None)
+        if started is None:
+            return response
+
+        key = startup.integration_key_store.get(startup.integration_key_id, b'')
+        writer = self.writer
+        record = {
+            'time': started[0],
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'headers': {name: request.headers[name] for name in RECORDED_HEADERS if name in request.headers},
+            'body': redact(decode_body(request.get_data(), request.mimetype), key),
+            'status': response.status_code,
+            'mimetype': response.mimetype,
+        }
+
+        def complete(body: bytes):
+            # Timed until the whole body was handed to the server
+            record['duration_ms'] = round((time.perf_counter() - started[1]) * 1000, 3)
+            record['response'] = redact(decode_body(body, record['mimetype']), key)
+            writer.write(record)
+
+        # Nothing after this hook reads the body: it is only passed through
+        response.response = _Tee(response.response, complete)
+        return response
+
+
+capture = TrafficCapture(CaptureWriter(capture_path) if capture_path else None, capture_sample_rate)
@@ -0,0 +1,349 @@
+"""
+Countries: ISO 3166-1 codes, names and historical codes, as alpha-3 codes.
+
+Check input, watchlist exports and providers name countries in different
+ways: `GB`, `GBR`, `United Kingdom`, `UK`, or a code that has since been
+withdrawn (`SUN` for the Soviet Union). `normalize_country` turns all of them
+into the ISO 3166-1 alpha-3 code used in hits, with two lookups in tables that
+are built once, at import, and can't be changed afterwards.
+
+Withdrawn codes (ISO 3166-3) map to the country that took the code's place,
+or, where a country split, to the one that continued it.
+"""
+
+import re
+import unicodedata
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Mapping, Optional
+
+# alpha-3, alpha-2, ISO short name; other names in use, separated by `;`
+_ISO_3166 = '''
+AFG AF Afghanistan
+ALA AX Åland Islands
+ALB AL Albania
+DZA DZ Algeria
+ASM AS American Samoa
+AND AD Andorra
+AGO AO Angola
+AIA AI Anguilla
+ATA AQ Antarctica
+ATG AG Antigua and Barbuda
+ARG AR Argentina
+ARM AM Armenia
+ABW AW Aruba
+AUS AU Australia
+AUT AT Austria
+AZE AZ Azerbaijan
+BHS BS Bahamas; The Bahamas
+BHR BH Bahrain
+BGD BD Bangladesh
+BRB BB Barbados
+BLR BY Belarus; Byelorussia
+BEL BE Belgium
+BLZ BZ Belize
+BEN BJ Benin; Dahomey
+BMU BM Bermuda
+BTN BT Bhutan
+BOL BO Bolivia, Plurinational State of; Bolivia
+BES BQ Bonaire, Sint Eustatius and Saba; Caribbean Netherlands
+BIH BA Bosnia and Herzegovina
+BWA BW Botswana
+BVT BV Bouvet Island
+BRA BR Brazil
+IOT IO British Indian Ocean Territory
+BRN BN Brunei Darussalam; Brunei
+BGR BG Bulgaria
+BFA BF Burkina Faso; Upper Volta
+BDI BI Burundi
+CPV CV Cabo Verde; Cape Verde
+KHM KH Cambodia; Kampuchea
+CMR CM Cameroon
+CAN CA Canada
+CYM KY Cayman Islands
+CAF CF Central African Republic
+TCD TD Chad
+CHL CL Chile
+CHN CN China; People's Republic of China; PRC
+CXR CX Christmas Island
+CCK CC Cocos (Keeling) Islands; Cocos Islands
+COL CO Colombia
+COM KM Comoros
+COG CG Congo; Republic of the Congo; Congo-Brazzaville
+COD CD Congo, Democratic Republic of the; Democratic Republic of the Congo; DR Congo; DRC; Congo-Kinshasa; Zaire
+COK CK Cook Islands
+CRI CR Costa Rica
+CIV CI Côte d'Ivoire; Ivory Coast
+HRV HR Croatia
+CUB CU Cuba
+CUW CW Curaçao; Netherlands Antilles
+CYP CY Cyprus
+CZE CZ Czechia; Czech Republic; Czechoslovakia
+DNK DK Denmark
+DJI DJ Djibouti
+DMA DM Dominica
+DOM DO Dominican Republic
+ECU EC Ecuador
+EGY EG Egypt
+SLV SV El Salvador
+GNQ GQ Equatorial Guinea
+ERI ER Eritrea
+EST EE Estonia
+SWZ SZ Eswatini; Swaziland
+ETH ET Ethiopia
+FLK FK Falkland Islands (Malvinas); Falkland Islands
+FRO FO Faroe Islands
+FJI FJ Fiji
+FIN FI Finland
+FRA FR France
+GUF GF French Guiana
+PYF PF French Polynesia
+ATF TF French Southern Territories
+GAB GA Gabon
+GMB GM Gambia; The Gambia
+GEO GE Georgia
+DEU DE Germany; East Germany; West Germany; German Democratic Republic
+GHA GH Ghana
+GIB GI Gibraltar
+GRC GR Greece
+GRL GL Greenland
+GRD GD Grenada
+GLP GP Guadeloupe
+GUM GU Guam
+GTM GT Guatemala
+GGY GG Guernsey
+GIN GN Guinea
+GNB GW Guinea-Bissau
+GUY GY Guyana
+HTI HT Haiti
+HMD HM Heard Island and McDonald Islands
+VAT VA Holy See; Vatican; Vatican City
+HND HN Honduras
+HKG HK Hong Kong
+HUN HU Hungary
+ISL IS Iceland
+IND IN India
+IDN ID Indonesia
+IRN IR Iran, Islamic Republic of; Iran
+IRQ IQ Iraq
+IRL IE Ireland
+IMN IM Isle of Man
+ISR IL Israel
+ITA IT Italy
+JAM JM Jamaica
+JPN JP Japan
+JEY JE Jersey
+JOR JO Jordan
+KAZ KZ Kazakhstan
+KEN KE Kenya
+KIR KI Kiribati
+PRK KP Korea, Democratic People's Republic of; North Korea; DPRK
+KOR KR Korea, Republic of; South Korea
+KWT KW Kuwait
+KGZ KG Kyrgyzstan
+LAO LA Lao People's Democratic Republic; Laos
+LVA LV Latvia
+LBN LB Lebanon
+LSO LS Lesotho
+LBR LR Liberia
+LBY LY Libya
+LIE LI Liechtenstein
+LTU LT Lithuania
+LUX LU Luxembourg
+MAC MO Macao; Macau
+MDG MG Madagascar
+MWI MW Malawi
+MYS MY Malaysia
+MDV MV Maldives
+MLI ML Mali
+MLT MT Malta
+MHL MH Marshall Islands
+MTQ MQ Martinique
+MRT MR Mauritania
+MUS MU Mauritius
+MYT YT Mayotte
+MEX MX Mexico
+FSM FM Micronesia, Federated States of; Micronesia
+MDA MD Moldova, Republic of; Moldova
+MCO MC Monaco
+MNG MN Mongolia
+MNE ME Montenegro
+MSR MS Montserrat
+MAR MA Morocco
+MOZ MZ Mozambique
+MMR MM Myanmar; Burma
+NAM NA Namibia
+NRU NR Nauru
+NPL NP Nepal
+NLD NL Netherlands; The Netherlands; Holland
+NCL NC New Caledonia
+NZL NZ New Zealand
+NIC NI Nicaragua
+NER NE Niger
+NGA NG Nigeria
+NIU NU Niue
+NFK NF Norfolk Island
+MKD MK North Macedonia; Macedonia
+MNP MP Northern Mariana Islands
+NOR NO Norway
+OMN OM Oman
+PAK PK Pakistan
+PLW PW Palau
+PSE PS Palestine, State of; Palestine
+PAN PA Panama
+PNG PG Papua New Guinea
+PRY PY Paraguay
+PER PE Peru
+PHL PH Philippines
+PCN PN Pitcairn
+POL PL Poland
+PRT PT Portugal
+PRI PR Puerto Rico
+QAT QA Qatar
+REU RE Réunion
+ROU RO Romania
+RUS RU Russian Federation; Russia; Soviet Union; USSR
+RWA RW Rwanda
+BLM BL Saint Barthélemy
+SHN SH Saint Helena, Ascension and Tristan da Cunha; Saint Helena
+KNA KN Saint Kitts and Nevis
+LCA LC Saint Lucia
+MAF MF Saint Martin (French part); Saint Martin
+SPM PM Saint Pierre and Miquelon
+VCT VC Saint Vincent and the Grenadines
+WSM WS Samoa
+SMR SM San Marino
+STP ST Sao Tome and Principe
+SAU SA Saudi Arabia
+SEN SN Senegal
+SRB RS Serbia; Serbia and Montenegro; Yugoslavia
+SYC SC Seychelles
+SLE SL Sierra Leone
+SGP SG Singapore
+SXM SX Sint Maarten (Dutch part); Sint Maarten
+SVK SK Slovakia
+SVN SI Slovenia
+SLB SB Solomon Islands
+SOM SO Somalia
+ZAF ZA South Africa
+SGS GS South Georgia and the South Sandwich Islands
+SSD SS South Sudan
+ESP ES Spain
+LKA LK Sri Lanka; Ceylon
+SDN SD Sudan
+SUR SR Suriname
+SJM SJ Svalbard and Jan Mayen
+SWE SE Sweden
+CHE CH Switzerland
+SYR SY Syrian Arab Republic; Syria
+TWN TW Taiwan, Province of China; Taiwan
+TJK TJ Tajikistan
+TZA TZ Tanzania, United Republic of; Tanzania
+THA TH Thailand
+TLS TL Timor-Leste; East Timor
+TGO TG Togo
+TKL TK Tokelau
+TON TO Tonga
+TTO TT Trinidad and Tobago
+TUN TN Tunisia
+TUR TR Türkiye; Turkey
+TKM TM Turkmenistan
+TCA TC Turks and Caicos Islands
+TUV TV Tuvalu
+UGA UG Uganda
+UKR UA Ukraine
+ARE AE United Arab Emirates; UAE
+GBR GB United Kingdom of Great Britain and Northern Ireland; United Kingdom; Great Britain; Britain
+USA US United States of America; United States; America
+UMI UM United States Minor Outlying Islands
+URY UY Uruguay
+UZB UZ Uzbekistan
+VUT VU Vanuatu; New Hebrides
+VEN VE Venezuela, Bolivarian Republic of; Venezuela
+VNM VN Viet Nam; Vietnam
+VGB VG Virgin Islands (British); British Virgin Islands
+VIR VI Virgin Islands (U.S.); US Virgin Islands
+WLF WF Wallis and Futuna
+ESH EH Western Sahara
+YEM YE Yemen
+ZMB ZM Zambia
+ZWE ZW Zimbabwe; Rhodesia
+'''
+
+# Codes ISO reserves for other uses but which are common in lists: the EU's
+# codes for the UK and Greece, and the code used for Kosovo (and its IOC code)
+_EXCEPTIONAL = {
+    'UK': 'GBR',
+    'EL': 'GRC',
+    'XK': 'XKX',
+    'XKX': 'XKX',
+    'KOS': 'XKX',
+}
+
+# Withdrawn codes (ISO 3166-3 and the old alpha-3 of Romania)
+_WITHDRAWN = {
+    'AN': 'CUW', 'ANT': 'CUW',  # Netherlands Antilles
+    'BU': 'MMR', 'BUR': 'MMR',  # Burma
+    'BYS': 'BLR',  # Byelorussian SSR
+    'CS': 'SRB', 'SCG': 'SRB',  # Serbia and Montenegro (CS was Czechoslovakia's before)
+    'CSK': 'CZE',  # Czechoslovakia
+    'DD': 'DEU', 'DDR': 'DEU',  # German Democratic Republic
+    'DY': 'BEN', 'DHY': 'BEN',  # Dahomey
+    'FX': 'FRA', 'FXX': 'FRA',  # Metropolitan France
+    'HV': 'BFA', 'HVO': 'BFA',  # Upper Volta
+    'NH': 'VUT', 'NHB': 'VUT',  # New Hebrides
+    'PZ': 'PAN', 'PCZ': 'PAN',  # Panama Canal Zone
+    'RH': 'ZWE', 'RHO': 'ZWE',  # Southern Rhodesia
+    'ROM': 'ROU',  # Romania
+    'SU': 'RUS', 'SUN': 'RUS',  # USSR
+    'TP': 'TLS', 'TMP': 'TLS',  # East Timor
+    'VD': 'VNM', 'VDR': 'VNM',  # North Vietnam
+    'YD': 'YEM', 'YMD': 'YEM',  # South Yemen
+    'YU': 'SRB', 'YUG': 'SRB',  # Yugoslavia
+    'ZR': 'COD', 'ZAR': 'COD',  # Zaire
+}
+
+_NOT_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
+
+
+def _name_key(name: str) -> str:
+    # Case, accents, punctuation and a leading "the" don't matter
+    name = unicodedata.normalize('NFKD', name.casefold())
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    name = _NOT_ALPHANUMERIC.sub(' ', name).strip()
+    return name[4:] if name.startswith('the ') else name
+
+
+def _build_tables():
+    codes: Dict[str, str] = {}
+    names: Dict[str, str] = {}
+    for line in _ISO_3166.strip().splitlines():
+        alpha_3, alpha_2, rest = line.split(' ', 2)
+        codes[alpha_3] = codes[alpha_2] = alpha_3
+        for name in rest.split(';'):
+            names[_name_key(name)] = alpha_3
+    names[_name_key('Kosovo')] = 'XKX'
+    for code, alpha_3 in {**_WITHDRAWN, **_EXCEPTIONAL}.items():
+        assert code not in codes, code
+        codes[code] = alpha_3
+    return MappingProxyType(codes), MappingProxyType(names)
+
+
+_CODES: Mapping[str, str]
+_NAMES: Mapping[str, str]
+_CODES, _NAMES = _build_tables()
+
+# Every code `normalize_country` returns
+COUNTRIES: FrozenSet[str] = frozenset(_CODES.values())
+
+
+def normalize_country(value: Optional[str]) -> Optional[str]:
+    """
+    The alpha-3 code for `value`: an ISO 3166-1 alpha-2 or alpha-3 code, a
+    withdrawn one, or the name of a country, in any case. None if it isn't one.
+    """
+    if not value:
+        return None
+    code = _CODES.get(value.strip().upper())
+    if code is not None:
+        return code
+    return _NAMES.get(_name_key(value))
@@ -0,0 +1,57 @@
+"""
+Deadlines for the work done on behalf of a request.
+
+A caller can say how long it will wait with an `X-Request-Timeout-Ms`
+header; otherwise requests get `REQUEST_TIMEOUT` seconds (if set). Calls to
+providers are then given only the time that is left, and pass what is left
+on in the same header, rather than running on after the caller gave up.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from flask import request
+
+from app.startup import request_timeout
+
+HEADER = 'X-Request-Timeout-Ms'
+
+# time.monotonic() by which the current request's work must be done
+_deadline: ContextVar[Optional[float]] = ContextVar('deadline', default=None)
+
+
+def remaining() -> Optional[float]:
+    """ Seconds left until the current deadline, or None if there is none. """
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+@contextmanager
+def within(seconds: Optional[float]):
+    """ Runs the block with a deadline `seconds` from now, or the current one if sooner. """
+    deadline = _deadline.get()
+    if seconds is not None:
+        deadline = min(time.monotonic() + seconds, deadline or float('inf'))
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def before_request():
+    seconds = request_timeout or None
+    header = request.headers.get(HEADER)
+    if header is not None:
+        try:
+            seconds = max(0.0, int(header) / 1000)
+        except ValueError:
+            pass
+    _deadline.set(None if seconds is None else time.monotonic() + seconds)
+
+
+def teardown_request(exc):
+    # Threads (and greenlets) serve one request after another
+    _deadline.set(None)
@@ -1,9 +1,14 @@
+import hashlib
 import json
 from json.decoder import JSONDecodeError
 import logging
 import os
 import re
+import sys
+import tempfile
+from typing import Dict, Iterator, Tuple
 
+from flask import Response, abort
 from schematics.exceptions import DataError
 
 from app.api import (
@@ -11,9 +16,19 @@ from app.api import (
     CommercialRelationshipType,
     DemoResultType,
     EntityType,
+    PollCheckRequest,
     PollCheckResponse,
+    file_response,
+    passthrough_response,
+    serialize_json,
 )
+from app import tracing
+from app.hit_log import hit_log
+from app.screening import partial_response, serialize_hits
+from app.shared_store import open_store
+from app.startup import shared_store_dir
 
+DEMO_RESULTS_DIR = '../static/demo_results'
 UNSUPPORTED_DEMO_RESULT_FILENAME = '../static/demo_results/UNSUPPORTED_DEMO_RESULT.json'
 
 def _sanitize_filename(value: str, program=re.compile('^[a-z0-9A-Z_]+$')):
@@ -22,16 +37,38 @@ def _sanitize_filename(value: str, program=re.compile('^[a-z0-9A-Z_]+$')):
     return value
 
 
+def _load_demo_files() -> Dict[str, dict]:
+    # Read once at import: with `gunicorn --preload` that happens in the
+    # master, and workers share the parsed results copy-on-write
+    directory = os.path.join(os.path.dirname(__file__), DEMO_RESULTS_DIR)
+    files = {}
+    for root, _dirs, names in os.walk(directory):
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            filepath = os.path.normpath(os.path.join(root, name))
+            try:
+                with open(filepath, 'r') as file:
+                    files[filepath] = json.load(file)
+            except JSONDecodeError as e:
+                logging.error(f"error reading '{filepath}': {e}")
+                raise
+    return files
+
+
+_demo_files = _load_demo_files()
+
+
 def _get_file_content(model, filename):
-    filepath = os.path.join(os.path.dirname(__file__), filename)
-    try:
-        # Load file relative to current script
-        with open(os.path.join(os.path.dirname(__file__), filename), 'r') as file:
-            demo_response = model().import_data(json.load(file), apply_defaults=True)
-    except FileNotFoundError:
+    filepath = os.path.normpath(os.path.join(os.path.dirname(__file__), filename))
+    data = _demo_files.get(filepath)
+    if data is None:
         logging.error(f"No file found: '{filepath}'")
         return None
-    except (JSONDecodeError, DataError) as e:
+
+    try:
+        demo_response = model().import_data(data, apply_defaults=True)
+    except DataError as e:
         logging.error(f"error reading '{filepath}': {e}")
         raise
 
@@ -73,11 +110,108 @@ def _try_load_result(entity_type: EntityType, commercial_relationship: Commercia
     return demo_response
 
 
-def try_load_individual_result(commercial_relationship: CommercialRelationshipType, name: str):
-    return _try_load_result(EntityType.INDIVIDUAL, commercial_relationship, name)
-
-def try_load_company_result(commercial_relationship: CommercialRelationshipType, name: str):
-    return _try_load_result(EntityType.COMPANY, commercial_relationship, name)
+_DEMO_RESULT_DIRS = {
+    EntityType.INDIVIDUAL: 'individuals',
+    EntityType.COMPANY: 'companies',
+}
+_UNSUPPORTED_PAYLOAD = 'UNSUPPORTED_DEMO_RESULT'
+
+
+def _payload_key(entity_type: EntityType, commercial_relationship: CommercialRelationshipType, name: str) -> str:
+    return f'{entity_type}:{commercial_relationship}:{name}'
+
+
+def _demo_payloads() -> Iterator[Tuple[str, bytes]]:
+    # Every poll result a demo check can return, serialised ahead of time
+    for entity_type, directory in _DEMO_RESULT_DIRS.items():
+        path = os.path.join(os.path.dirname(__file__), DEMO_RESULTS_DIR, directory)
+        for filename in sorted(os.listdir(path)):
+            name, extension = os.path.splitext(filename)
+            if extension != '.json':
+                continue
+            for commercial_relationship in (CommercialRelationshipType.DIRECT, CommercialRelationshipType.PASSFORT):
+                demo_response = _try_load_result(entity_type, commercial_relationship, name)
+                yield _payload_key(entity_type, commercial_relationship, name), serialize_json(demo_response)
+
+    demo_response = _get_file_content(PollCheckResponse, UNSUPPORTED_DEMO_RESULT_FILENAME)
+    yield _UNSUPPORTED_PAYLOAD, serialize_json(demo_response)
+
+
+def _fingerprint() -> str:
+    # Changes with the demo files and with the code that serialises them
+    digest = hashlib.sha256(json.dumps(_demo_files, sort_keys=True).encode())
+    for module in (sys.modules[PollCheckResponse.__module__], sys.modules[__name__]):
+        with open(module.__file__, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:16]
+
+
+# Shared by the workers on a host (see `app.shared_store`)
+_payloads = open_store(shared_store_dir or tempfile.gettempdir(), 'demo_results', _fingerprint(), _demo_payloads)
+
+
+def _demo_name(name: str) -> str:
+    if name in {DemoResultType.ANY, DemoResultType.ANY_CHARGE}:
+        return DemoResultType.ALL_DATA
+    return _sanitize_filename(name)
+
+
+@tracing.traced('demo_result')
+def _try_load_payload(entity_type: EntityType, commercial_relationship: CommercialRelationshipType,
+                      name: str) -> Response:
+    name = _demo_name(name)
+    key = _payload_key(entity_type, commercial_relationship, name)
+    if key not in _payloads:
+        logging.error(f"No demo result '{name}' for {entity_type}")
+        key = _UNSUPPORTED_PAYLOAD
+
+    file = _payloads.open(key)
+    if file is None:
+        # The store file was replaced by a newer build: serve from the mapping
+        return passthrough_response(_payloads.get(key).tobytes())
+    return file_response(file, file.length)
+
+
+def try_load_individual_result(commercial_relationship: CommercialRelationshipType, name: str) -> Response:
+    return _try_load_payload(EntityType.INDIVIDUAL, commercial_relationship, name)
+
+def try_load_company_result(commercial_relationship: CommercialRelationshipType, name: str) -> Response:
+    return _try_load_payload(EntityType.COMPANY, commercial_relationship, name)
+
+@tracing.traced('partial_demo_result')
+def try_load_partial_result(entity_type: EntityType, provider_id: str, req: PollCheckRequest) -> Response:
+    """
+    The demo result a few hits at a time: each pending poll finds a share of
+    the hits not sent yet and sends them (through the check's hit log, as
+    real checks do), and the final poll sends the rest with the result.
+    """
+    name = _demo_name(req.demo_result)
+    if _payload_key(entity_type, req.commercial_relationship, name) not in _payloads:
+        return _try_load_payload(entity_type, req.commercial_relationship, name)
+    demo_response = _try_load_result(entity_type, req.commercial_relationship, name)
+    if demo_response.check_output is None:
+        # An error result: nothing to send early
+        return _try_load_payload(entity_type, req.commercial_relationship, name)
+
+    hits = serialize_hits(demo_response.check_output.screening_hits or [])
+    check_id, cursor = str(req.id), req.custom_data.cursor or 0
+    remaining_polls = req.custom_data.counter
+    if remaining_polls == 0:
+        hit_log.append(check_id, 0, hits)
+        return partial_response(demo_response, hit_log.read(check_id, cursor), cursor)
+
+    # Spread over the polls left, the final one included
+    found = cursor + -(-(len(hits) - cursor) // (remaining_polls + 1))
+    hit_log.append(check_id, 0, hits[:found])
+    response = PollCheckResponse({
+        'provider_id': provider_id,
+        'reference': req.reference,
+        'custom_data': {'counter': remaining_polls - 1},
+        'provider_data': 'Demo result. Did not make request to provider.',
+        'check_output': {'entity_type': entity_type},
+        'pending': True,
+    })
+    return partial_response(response, hit_log.read(check_id, cursor), cursor)
 
 def try_load_demo_error_result(response_model, name: str):
     filename = f'../static/demo_results/errors/{_sanitize_filename(name)}.json'
@@ -0,0 +1,95 @@
+"""
+Per-check logs of screening hits, for results delivered while a check runs.
+
+Whatever screens a check appends its hits to the check's log as it finds
+them, each at a fixed position; polls send the hits past the client's cursor
+(`custom_data.cursor`) and move the cursor on. So a pending poll can carry
+the hits found so far, and the final poll only the ones it hasn't seen.
+
+Appends are idempotent: a hit is stored at its position once, so a producer
+that is retried (e.g. a background job) can append the same hits again.
+
+With `HIT_LOG_PATH` (or else `JOB_QUEUE_PATH`) set the logs are in a SQLite
+file shared by all processes on the host, so background jobs can append to
+them; otherwise each process keeps the logs of its most recent checks, which
+only works with a single process (`app.serving` sets `HIT_LOG_PATH` for
+servers with several workers).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+from app.local_store import LocalStore
+from app.startup import hit_log_path, job_queue_path
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS hit_log (
+    check_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    hit BLOB NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (check_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS hit_log_created ON hit_log (created);
+'''
+
+
+class HitLog:
+    def __init__(self, max_checks: int = 10000):
+        self.max_checks = max_checks
+        self._logs: 'OrderedDict[str, List[bytes]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def append(self, check_id: str, position: int, hits: List[bytes]):
+        """ Stores `hits` (serialised) at `position` onwards, keeping any already stored there. """
+        with self._lock:
+            log = self._logs.setdefault(check_id, [])
+            self._logs.move_to_end(check_id)
+            if position > len(log):
+                raise ValueError(f'Hits appended at {position}, after the end of the log ({len(log)})')
+            log.extend(hits[len(log) - position:])
+            while len(self._logs) > self.max_checks:
+                self._logs.popitem(last=False)
+
+    def read(self, check_id: str, cursor: int = 0) -> List[bytes]:
+        with self._lock:
+            return self._logs.get(check_id, [])[cursor:]
+
+
+class SharedHitLog(HitLog):
+    # Logs are kept this long, then removed in batches
+    RETENTION = 24 * 60 * 60
+    EVICT_EVERY = 100
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.store = LocalStore(path, SCHEMA)
+        self._appends = 0
+
+    def append(self, check_id: str, position: int, hits: List[bytes]):
+        now = time.time()
+        with self.store.transaction() as db:
+            length = db.execute('SELECT COUNT(*) FROM hit_log WHERE check_id = ?', (check_id,)).fetchone()[0]
+            if position > length:
+                raise ValueError(f'Hits appended at {position}, after the end of the log ({length})')
+            db.executemany(
+                'INSERT OR IGNORE INTO hit_log (check_id, position, hit, created) VALUES (?, ?, ?, ?)',
+                ((check_id, position + i, hit, now) for i, hit in enumerate(hits)),
+            )
+
+            self._appends += 1
+            if self._appends % self.EVICT_EVERY == 0:
+                db.execute('DELETE FROM hit_log WHERE created < ?', (now - self.RETENTION,))
+
+    def read(self, check_id: str, cursor: int = 0) -> List[bytes]:
+        return [hit for hit, in self.store.execute(
+            'SELECT hit FROM hit_log WHERE check_id = ? AND position >= ? ORDER BY position', (check_id, cursor)
+        )]
+
+
+if hit_log_path or job_queue_path:
+    hit_log = SharedHitLog(hit_log_path or job_queue_path)
+else:
+    hit_log = HitLog()
@@ -4,11 +4,14 @@ import hmac
 import logging
 import time
 import calendar
+from typing import Optional
 
 from flask import request
 from flask_httpauth import HTTPAuth
 from email.utils import parsedate
 
+from app import tracing
+
 
 class HTTPSignatureAuth(HTTPAuth):
     def __init__(self, scheme='Signature', realm=None, required_headers=None, require_digest=True):
@@ -45,6 +48,28 @@ class HTTPSignatureAuth(HTTPAuth):
                 result.append(f'{header}: {value}')
         return '\n'.join(result).encode()
 
+    def _compute_signature(self, key: bytes, headers) -> bytes:
+        return hmac.new(key, self._get_bytes_to_sign(headers), digestmod=hashlib.sha256).digest()
+
+    def verified_key_id(self, token: str) -> Optional[str]:
+        """
+        The `keyId` of a signature whose signed headers check out, None for
+        any other. The body's digest and the date are left to `authenticate`.
+        """
+        try:
+            sig_dict = self._decode_signature(token)
+            key = self.key_resolver(key_id=sig_dict['keyId'])
+            if key is None:
+                return None
+            headers = [header.lower() for header in sig_dict.get('headers', 'date').split(' ')]
+            expected_signature = base64.b64decode(sig_dict['signature'])
+            if hmac.compare_digest(expected_signature, self._compute_signature(key, headers)):
+                return sig_dict['keyId']
+        except (IndexError, KeyError, ValueError):
+            pass
+        return None
+
+    @tracing.traced('authenticate')
     def authenticate(self, auth, _pw):
         # Get the current time as early as possible
         authentication_time = time.time()
@@ -102,13 +127,12 @@ class HTTPSignatureAuth(HTTPAuth):
 
         expected_signature = base64.b64decode(sig_dict['signature'])
 
-        bytes_to_sign = self._get_bytes_to_sign(headers)
         key = self.key_resolver(key_id=sig_dict['keyId'])
         if key is None:
             logging.warning(f'Unknown key ID `{sig_dict["keyId"]}` when verifying signature.')
             return False
 
-        computed_signature = hmac.new(key, bytes_to_sign, digestmod=hashlib.sha256).digest()
+        computed_signature = self._compute_signature(key, headers)
 
         signature_valid = hmac.compare_digest(expected_signature, computed_signature)
         if not signature_valid:
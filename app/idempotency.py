@@ -0,0 +1,123 @@
+"""
+Idempotent check starts.
+
+PassFort retries `POST /checks` when a request times out. A retry carries
+the same `StartCheckRequest.id`, so the first response for an id is cached
+and returned as-is for any retry, without validating the request again or
+starting another check. The cache is bounded; with `IDEMPOTENCY_CACHE_PATH`
+set it is a SQLite file shared by all workers on the host, otherwise an LRU
+per process.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Optional
+
+from flask import Response, request
+
+from app.api import JSON_MIMETYPE, json_response, response_mimetype
+from app.local_store import LocalStore
+from app.startup import idempotency_cache_path, idempotency_cache_size
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS start_responses (
+    key TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS start_responses_created ON start_responses (created);
+'''
+
+
+class ResponseCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def add(self, key: str, body: bytes) -> bytes:
+        """ Stores `body` unless `key` is already cached, returning the cached body. """
+        with self._lock:
+            body = self._entries.setdefault(key, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return body
+
+
+class SharedResponseCache(ResponseCache):
+    # Evict in batches, rather than counting rows on every insert
+    EVICT_EVERY = 100
+
+    def __init__(self, max_size: int, path: str):
+        super().__init__(max_size)
+        self.store = LocalStore(path, SCHEMA)
+        self._inserts = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self.store.execute('SELECT body FROM start_responses WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, key: str, body: bytes) -> bytes:
+        with self.store.transaction() as db:
+            db.execute('INSERT OR IGNORE INTO start_responses (key, body, created) VALUES (?, ?, ?)',
+                       (key, body, time.time()))
+            body = db.execute('SELECT body FROM start_responses WHERE key = ?', (key,)).fetchone()[0]
+
+            self._inserts += 1
+            if self._inserts % self.EVICT_EVERY == 0:
+                db.execute(
+                    'DELETE FROM start_responses WHERE created <= ('
+                    '    SELECT created FROM start_responses ORDER BY created DESC LIMIT 1 OFFSET ?'
+                    ')',
+                    (self.max_size,),
+                )
+        return body
+
+
+def idempotent_start(fn):
+    """
+    Returns the cached response for a start request whose `id` was seen
+    before. Goes between `auth.login_required` and `validate_models`, so only
+    authenticated requests are cached, and duplicates skip validation.
+    """
+
+    @wraps(fn)
+    def wrapped_fn(*args, **kwargs):
+        data = request.get_json(silent=True)
+        check_id = data.get('id') if isinstance(data, dict) else None
+        if not isinstance(check_id, str):
+            return fn(*args, **kwargs)
+
+        # Each encoding of the response is cached on its own (see `response_mimetype`)
+        mimetype = response_mimetype()
+        key = f'{request.blueprint}:{check_id}'
+        if mimetype != JSON_MIMETYPE:
+            key += f':{mimetype}'
+        body = cache.get(key)
+        if body is not None:
+            return json_response(body, mimetype)
+
+        res = fn(*args, **kwargs)
+        if not isinstance(res, Response) or res.status_code != 200:
+            return res
+
+        # Concurrent duplicates race to add: everyone returns the first response stored
+        return json_response(cache.add(key, res.get_data()), mimetype)
+
+    return wrapped_fn
+
+
+if idempotency_cache_path:
+    cache = SharedResponseCache(idempotency_cache_size, idempotency_cache_path)
+else:
+    cache = ResponseCache(idempotency_cache_size)
@@ -24,14 +24,14 @@ from app.api import (
     PollCheckRequest,
     validate_models,
 )
-from app.demo_results import (try_load_individual_result, try_load_demo_error_result)
+from app.demo_results import (try_load_individual_result, try_load_demo_error_result, try_load_partial_result)
 from app.http_signature import HTTPSignatureAuth
+from app.idempotency import idempotent_start
+from app.screening import poll_screening, start_screening
 from app.startup import integration_key_store
 
 blueprint = Blueprint('individual', __name__, url_prefix='/individual')
 
-SUPPORTED_COUNTRIES = ['GBR', 'USA', 'CAN', 'NLD']
-
 PROVIDER_ID = "6e15bc41-17a1-4568-8549-b5f828b13060"
 
 @blueprint.route('/')
@@ -46,8 +46,12 @@ def get_config():
 
 @blueprint.route('/checks', methods=['POST'])
 @auth.login_required
+@idempotent_start
 @validate_models
 def run_check(req: StartCheckRequest) -> StartCheckResponse:
+    if req.demo_result is None:
+        return start_screening(EntityType.INDIVIDUAL, PROVIDER_ID, req)
+
     if 'ERROR' in req.demo_result:
         return try_load_demo_error_result(StartCheckResponse, req.demo_result)
 
@@ -65,6 +69,12 @@ def run_check(req: StartCheckRequest) -> StartCheckResponse:
 @auth.login_required
 @validate_models
 def poll_check_result(req: PollCheckRequest, _check_id: UUID) -> PollCheckResponse:
+    if req.custom_data.query is not None:
+        return poll_screening(EntityType.INDIVIDUAL, PROVIDER_ID, req)
+
+    if req.provider_config.partial_results:
+        return try_load_partial_result(EntityType.INDIVIDUAL, PROVIDER_ID, req)
+
     remaining_polls = req.custom_data["counter"]
 
     if remaining_polls == 0:
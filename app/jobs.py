@@ -0,0 +1,303 @@
+"""
+Background jobs, so that a request only has to enqueue its work.
+
+Jobs live in a SQLite file (`JOB_QUEUE_PATH`) shared by the workers on a
+host. Every process that uses the queue runs a few worker threads, started
+on first use; `python -m app.jobs work` runs a dedicated worker process.
+
+Jobs are claimed in priority order (interactive checks before bulk
+re-screens), then by when they became due. A job whose handler raises is
+retried with exponential backoff, and dead-lettered after `max_attempts`.
+A claim is a lease: if the process running a job dies, the job becomes
+claimable again when the lease expires. The result of a job whose lease
+expired and which was claimed again is dropped, so that only the latest
+claim finishes it.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from app.local_store import LocalStore
+from app.startup import job_max_attempts, job_queue_path, job_workers
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# Priority of jobs enqueued in the current context (see `priority`)
+_priority: ContextVar[int] = ContextVar('job_priority', default=PRIORITY_INTERACTIVE)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+DEAD = 'dead'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL,
+    lease_until REAL,
+    result BLOB,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (priority, run_after) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS jobs_leased ON jobs (lease_until) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (updated) WHERE status IN ('done', 'dead');
+'''
+
+_handlers: Dict[str, Callable[[dict], bytes]] = {}
+
+
+def handler(kind: str):
+    """ Registers the function that runs jobs of `kind`: it takes the payload and returns the result. """
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+@contextmanager
+def priority(value: int):
+    """ Enqueues jobs at `value` rather than the interactive priority within the block. """
+    token = _priority.set(value)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    payload: dict
+    status: str
+    attempts: int
+    result: Optional[bytes] = None
+    error: Optional[str] = None
+    # When the claim this job was read under expires (None unless running)
+    lease_until: Optional[float] = None
+
+
+class JobQueue:
+    # Seconds a claimed job is reserved for the worker running it
+    LEASE = 60
+    # Delay before the first retry, doubled for every further attempt
+    RETRY_DELAY = 1.0
+    MAX_RETRY_DELAY = 300
+    # Finished jobs are kept this long for polls to read
+    RETENTION = 24 * 60 * 60
+
+    def __init__(self, path: str, max_attempts: int = 5):
+        self.store = LocalStore(path, SCHEMA)
+        self.max_attempts = max_attempts
+        # Wakes this process's workers when it enqueues something
+        self.enqueued = threading.Event()
+
+    def enqueue(self, job_id: str, kind: str, payload: dict, priority: int = PRIORITY_INTERACTIVE) -> bool:
+        """ Adds a job, unless one with `job_id` exists already. Returns whether it was added. """
+        now = time.time()
+        added = self.store.execute(
+            'INSERT OR IGNORE INTO jobs (id, kind, payload, priority, status, run_after, updated) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (job_id, kind, json.dumps(payload), priority, QUEUED, now, now),
+        ).rowcount == 1
+        if added:
+            self.enqueued.set()
+        return added
+
+    def get(self, job_id: str) -> Optional[Job]:
+        row = self.store.execute(
+            'SELECT id, kind, payload, status, attempts, result, error, lease_until FROM jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return Job(row[0], row[1], json.loads(row[2]), *row[3:])
+
+    def claim(self) -> Optional[Job]:
+        """ Takes the next due job, if any, and leases it to the caller. """
+        now = time.time()
+        with self.store.transaction() as db:
+            # Jobs whose worker died (or overran its lease) go back in the queue
+            db.execute(
+                f"UPDATE jobs SET status = '{QUEUED}', lease_until = NULL "
+                f"WHERE status = '{RUNNING}' AND lease_until < ?",
+                (now,),
+            )
+            row = db.execute(
+                f"SELECT id FROM jobs WHERE status = '{QUEUED}' AND run_after <= ? "
+                f"ORDER BY priority, run_after LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                f"UPDATE jobs SET status = '{RUNNING}', lease_until = ?, attempts = attempts + 1, updated = ? "
+                f"WHERE id = ?",
+                (now + self.LEASE, now, row[0]),
+            )
+        return self.get(row[0])
+
+    # Matches a job only while it is still held under the claim it was read with
+    _CLAIMED = f"WHERE id = ? AND status = '{RUNNING}' AND lease_until = ?"
+
+    def complete(self, job: Job, result: bytes) -> bool:
+        """
+        Stores the result of `job`. Returns False, dropping the result, if its
+        lease expired and it was claimed again (or finished) meanwhile.
+        """
+        return self.store.execute(
+            f"UPDATE jobs SET status = '{DONE}', result = ?, error = NULL, lease_until = NULL, updated = ? "
+            + self._CLAIMED,
+            (result, time.time(), job.id, job.lease_until),
+        ).rowcount == 1
+
+    def fail(self, job: Job, error: str) -> bool:
+        """
+        Schedules a retry of `job`, or dead-letters it once it has used all its
+        attempts. Returns False, like `complete`, if the claim is stale.
+        """
+        now = time.time()
+        if job.attempts >= self.max_attempts:
+            return self.store.execute(
+                f"UPDATE jobs SET status = '{DEAD}', error = ?, lease_until = NULL, updated = ? " + self._CLAIMED,
+                (error, now, job.id, job.lease_until),
+            ).rowcount == 1
+
+        delay = min(self.MAX_RETRY_DELAY, self.RETRY_DELAY * 2 ** (job.attempts - 1))
+        # Jittered, so that jobs failing together don't all retry together
+        delay *= random.uniform(0.5, 1.5)
+        return self.store.execute(
+            f"UPDATE jobs SET status = '{QUEUED}', error = ?, run_after = ?, lease_until = NULL, updated = ? "
+            + self._CLAIMED,
+            (error, now + delay, now, job.id, job.lease_until),
+        ).rowcount == 1
+
+    def retry(self, job_id: str) -> bool:
+        """ Puts a dead-lettered job back in the queue, with a fresh set of attempts. """
+        now = time.time()
+        return self.store.execute(
+            f"UPDATE jobs SET status = '{QUEUED}', attempts = 0, run_after = ?, updated = ? "
+            f"WHERE id = ? AND status = '{DEAD}'",
+            (now, now, job_id),
+        ).rowcount == 1
+
+    def purge(self, older_than: Optional[float] = None) -> int:
+        cutoff = time.time() - (self.RETENTION if older_than is None else older_than)
+        return self.store.execute(
+            f"DELETE FROM jobs WHERE status IN ('{DONE}', '{DEAD}') AND updated < ?", (cutoff,)
+        ).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self.store.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status'))
+
+    def run_one(self) -> bool:
+        """ Claims and runs one job. Returns False if none was due. """
+        job = self.claim()
+        if job is None:
+            return False
+
+        try:
+            result = _handlers[job.kind](job.payload)
+        except Exception as e:
+            logging.exception(f'Job {job.id} ({job.kind}) failed on attempt {job.attempts}')
+            recorded = self.fail(job, f'{type(e).__name__}: {e}')
+        else:
+            recorded = self.complete(job, result)
+        if not recorded:
+            logging.warning(f'Job {job.id} ({job.kind}) overran its lease: attempt {job.attempts} dropped')
+        return True
+
+
+class JobWorkers:
+    """ Threads running jobs from `queue` in this process; restarted after a fork. """
+
+    IDLE_WAIT = 0.5
+    PURGE_EVERY = 1000
+
+    def __init__(self, queue: JobQueue, threads: int):
+        self.queue = queue
+        self.threads = threads
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for i in range(self.threads):
+                threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True).start()
+
+    def _run(self):
+        runs = 0
+        while True:
+            try:
+                ran = self.queue.run_one()
+            except Exception:
+                logging.exception('Job worker failed to claim a job')
+                ran = False
+
+            if ran:
+                runs += 1
+                if runs % self.PURGE_EVERY == 0:
+                    self.queue.purge()
+            else:
+                self.queue.enqueued.wait(self.IDLE_WAIT)
+                self.queue.enqueued.clear()
+
+
+queue = JobQueue(job_queue_path, job_max_attempts) if job_queue_path else None
+workers = JobWorkers(queue, job_workers) if queue is not None else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.jobs', description=__doc__.split('\n\n')[0])
+    parser.add_argument('queue', help='Job queue database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    work = commands.add_parser('work', help='run jobs until interrupted')
+    work.add_argument('--threads', type=int, default=4)
+    commands.add_parser('status', help='count jobs by status')
+    retry = commands.add_parser('retry', help='re-queue dead-lettered jobs')
+    retry.add_argument('ids', nargs='+')
+    args = parser.parse_args(argv)
+
+    # Handlers register themselves with `app.jobs`, which isn't this module
+    # when it runs as `__main__`
+    import app.screening  # noqa: F401
+    from app import jobs
+
+    job_queue = jobs.JobQueue(args.queue, job_max_attempts)
+    if args.command == 'work':
+        jobs.JobWorkers(job_queue, args.threads).ensure_started()
+        while True:
+            time.sleep(60)
+            job_queue.purge()
+    elif args.command == 'status':
+        for status, count in sorted(job_queue.counts().items()):
+            print(f'{status}: {count}')
+    else:
+        for job_id in args.ids:
+            print(f"{job_id}: {'re-queued' if job_queue.retry(job_id) else 'not dead-lettered'}")
+
+
+if __name__ == '__main__':
+    main()
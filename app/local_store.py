@@ -0,0 +1,52 @@
+"""
+SQLite-backed state shared by the processes on one host.
+
+Gunicorn workers are separate processes, so state that has to be shared
+between them (and survive a worker being recycled) lives in a SQLite file
+opened in WAL mode, which lets readers proceed while one writer commits.
+"""
+
+import os
+import sqlite3
+import threading
+
+
+class LocalStore:
+    def __init__(self, path: str, schema: str = ''):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        # Connections can't be shared across threads, nor survive a fork
+        # (e.g. when the app is preloaded in the gunicorn master).
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            if self.schema:
+                connection.executescript(self.schema)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def execute(self, sql: str, parameters=()) -> sqlite3.Cursor:
+        return self.connection().execute(sql, parameters)
+
+    def transaction(self) -> 'Transaction':
+        return Transaction(self.connection())
+
+
+class Transaction:
+    """ `with store.transaction() as db:` takes the write lock up front and commits on exit. """
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc, tb):
+        self.connection.execute('COMMIT' if exc_type is None else 'ROLLBACK')
@@ -0,0 +1,37 @@
+"""
+Process-local metrics, served as JSON at `/metrics`.
+
+Each gunicorn worker reports its own values (tagged with its pid); sum or
+average them across workers when collecting.
+"""
+
+import os
+import threading
+from collections import defaultdict
+from typing import Callable, Dict
+
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, Callable[[], float]] = {}
+_lock = threading.Lock()
+
+
+def increment(name: str, value: float = 1):
+    with _lock:
+        _counters[name] += value
+
+
+def value(name: str) -> float:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def register_gauge(name: str, fn: Callable[[], float]):
+    """ Registers a value computed when metrics are collected. """
+    _gauges[name] = fn
+
+
+def snapshot() -> dict:
+    with _lock:
+        values = dict(_counters)
+    values.update((name, fn()) for name, fn in _gauges.items())
+    return {'pid': os.getpid(), 'metrics': dict(sorted(values.items()))}
@@ -0,0 +1,235 @@
+"""
+Ongoing monitoring: re-screening previously checked entities when lists change.
+
+Checks started with `provider_config.ongoing_monitoring` are kept in a
+registry, together with an inverted index from their name tokens to the
+entity. When a list delta is applied, only entities sharing enough tokens
+with a changed entry are re-screened, and only against the changed entries.
+Hits that weren't reported before are stored as alerts and returned by the
+next poll of the check.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.api import EntityType, PollCheckResponse, ScreeningHit, ScreeningQuery
+from app.local_store import LocalStore
+from app.screening import MATCH_THRESHOLD, screen
+from app.startup import monitoring_db_path
+from app.watchlist import WatchlistIndex, build_index, min_shared_tokens, token_hash, tokenize
+from app.watchlist_store import OP_REMOVE, WatchlistStore, load_delta
+
+ALERT_PROVIDER_DATA = 'Ongoing monitoring: new hits since the last screening.'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS monitored_entities (
+    id INTEGER PRIMARY KEY,
+    check_id TEXT NOT NULL UNIQUE,
+    entity_type TEXT NOT NULL,
+    provider_id TEXT NOT NULL,
+    query TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS monitored_tokens (
+    token_hash INTEGER NOT NULL,
+    entity_id INTEGER NOT NULL,
+    PRIMARY KEY (token_hash, entity_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS monitored_hits (
+    entity_id INTEGER NOT NULL,
+    hit_id TEXT NOT NULL,
+    PRIMARY KEY (entity_id, hit_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS monitoring_alerts (
+    id INTEGER PRIMARY KEY,
+    entity_id INTEGER NOT NULL,
+    hits TEXT NOT NULL,
+    delivered INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS monitoring_alerts_pending ON monitoring_alerts (entity_id) WHERE delivered = 0;
+'''
+
+# SQLite has a limit on the number of host parameters in one statement
+_BATCH = 500
+
+
+def _signed(value: int) -> int:
+    # SQLite integers are signed 64 bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _token_hashes(name: str) -> List[int]:
+    return [_signed(token_hash(t)) for t in tokenize(name)]
+
+
+class MonitoringRegistry:
+    def __init__(self, path: str):
+        self.store = LocalStore(path, SCHEMA)
+
+    def register(self, check_id: str, entity_type: EntityType, provider_id: str, query: ScreeningQuery):
+        self.register_many([(check_id, entity_type, provider_id, query)])
+
+    def register_many(self, entities: Iterable[Tuple[str, EntityType, str, ScreeningQuery]]):
+        with self.store.transaction() as db:
+            for check_id, entity_type, provider_id, query in entities:
+                cursor = db.execute(
+                    'INSERT OR IGNORE INTO monitored_entities (check_id, entity_type, provider_id, query) '
+                    'VALUES (?, ?, ?, ?)',
+                    # Serialised by hand, `Model.serialize` re-validates and dominates bulk registration
+                    (check_id, entity_type, provider_id, json.dumps({'name': query.name, 'dob': query.dob})),
+                )
+                if cursor.rowcount == 0:
+                    continue
+                db.executemany(
+                    'INSERT OR IGNORE INTO monitored_tokens (token_hash, entity_id) VALUES (?, ?)',
+                    [(h, cursor.lastrowid) for h in _token_hashes(query.name)],
+                )
+
+    def _entity_id(self, check_id: str) -> Optional[int]:
+        row = self.store.execute('SELECT id FROM monitored_entities WHERE check_id = ?', (check_id,)).fetchone()
+        return row[0] if row else None
+
+    def record_hits(self, check_id: str, hit_ids: Iterable[str]):
+        entity_id = self._entity_id(check_id)
+        if entity_id is None:
+            return
+        with self.store.transaction() as db:
+            db.executemany(
+                'INSERT OR IGNORE INTO monitored_hits (entity_id, hit_id) VALUES (?, ?)',
+                [(entity_id, hit_id) for hit_id in hit_ids],
+            )
+
+    def take_alerts(self, check_id: str, reference: str) -> Optional[PollCheckResponse]:
+        """ Returns the undelivered new hits for a check as one poll response, marking them delivered. """
+        with self.store.transaction() as db:
+            row = db.execute(
+                'SELECT id, entity_type, provider_id FROM monitored_entities WHERE check_id = ?', (check_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            entity_id, entity_type, provider_id = row
+
+            alerts = db.execute(
+                'SELECT id, hits FROM monitoring_alerts WHERE entity_id = ? AND delivered = 0 ORDER BY id',
+                (entity_id,),
+            ).fetchall()
+            if not alerts:
+                return None
+            db.execute(
+                f'UPDATE monitoring_alerts SET delivered = 1 WHERE id IN ({",".join("?" * len(alerts))})',
+                [alert_id for alert_id, _ in alerts],
+            )
+
+        return PollCheckResponse({
+            'provider_id': provider_id,
+            'reference': reference,
+            'custom_data': {'counter': 0},
+            'provider_data': ALERT_PROVIDER_DATA,
+            'check_output': {
+                'entity_type': entity_type,
+                'screening_hits': [hit for _, hits in alerts for hit in json.loads(hits)],
+            },
+        })
+
+    def affected_entities(self, entries: Iterable[dict]) -> Set[int]:
+        """
+        Entities that could match any name of `entries`. Like the index search,
+        an entity has to share enough tokens with a name to reach the match
+        threshold, which is checked with one grouped lookup per name.
+        """
+        affected: Set[int] = set()
+        db = self.store.connection()
+        for entry in entries:
+            for name in [entry['name'], *entry.get('aliases', [])]:
+                hashes = _token_hashes(name)
+                if not hashes:
+                    continue
+                rows = db.execute(
+                    f'SELECT entity_id FROM monitored_tokens WHERE token_hash IN ({",".join("?" * len(hashes))}) '
+                    'GROUP BY entity_id HAVING COUNT(*) >= ?',
+                    [*hashes, min_shared_tokens(len(hashes), MATCH_THRESHOLD)],
+                )
+                affected.update(entity_id for entity_id, in rows)
+        return affected
+
+    def rescreen(self, changes: Iterable[Tuple[str, str, Optional[dict]]]) -> Dict[str, List[ScreeningHit]]:
+        """
+        Re-screens the entities affected by a list delta, storing any new hits
+        as alerts. Returns the new hits by check id.
+        """
+        changed = [entry for op, _, entry in changes if op != OP_REMOVE]
+        affected = sorted(self.affected_entities(changed))
+        if not affected:
+            return {}
+
+        new_hits: Dict[str, List[ScreeningHit]] = {}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'delta.idx')
+            build_index(changed, path)
+            delta_index = WatchlistIndex(path)
+
+            db = self.store.connection()
+            for start in range(0, len(affected), _BATCH):
+                batch = affected[start:start + _BATCH]
+                placeholders = ','.join('?' * len(batch))
+                entities = db.execute(
+                    f'SELECT id, check_id, entity_type, query FROM monitored_entities WHERE id IN ({placeholders})',
+                    batch,
+                ).fetchall()
+                seen = defaultdict(set)
+                for entity_id, hit_id in db.execute(
+                        f'SELECT entity_id, hit_id FROM monitored_hits WHERE entity_id IN ({placeholders})', batch):
+                    seen[entity_id].add(hit_id)
+
+                with self.store.transaction() as tx:
+                    for entity_id, check_id, entity_type, query in entities:
+                        hits = [
+                            hit for hit in screen(entity_type, ScreeningQuery(json.loads(query)), delta_index)
+                            if hit.provider.hit_id not in seen[entity_id]
+                        ]
+                        if not hits:
+                            continue
+                        tx.executemany(
+                            'INSERT OR IGNORE INTO monitored_hits (entity_id, hit_id) VALUES (?, ?)',
+                            [(entity_id, hit.provider.hit_id) for hit in hits],
+                        )
+                        tx.execute(
+                            'INSERT INTO monitoring_alerts (entity_id, hits) VALUES (?, ?)',
+                            (entity_id, json.dumps([hit.serialize() for hit in hits])),
+                        )
+                        new_hits[check_id] = hits
+
+            delta_index.close()
+
+        return new_hits
+
+
+_registry: Optional[MonitoringRegistry] = None
+
+
+def get_registry() -> Optional[MonitoringRegistry]:
+    global _registry
+    if _registry is None and monitoring_db_path:
+        _registry = MonitoringRegistry(monitoring_db_path)
+    return _registry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.monitoring', description=__doc__.split('\n\n')[0])
+    parser.add_argument('registry', help='Monitoring registry database')
+    parser.add_argument('store', help='Watchlist store directory')
+    parser.add_argument('delta', help='JSON lines delta, see `app.watchlist_store.load_delta`')
+    args = parser.parse_args(argv)
+
+    changes = list(load_delta(args.delta))
+    generation = WatchlistStore(args.store).apply_delta(changes)
+    new_hits = MonitoringRegistry(args.registry).rescreen(changes)
+    print(f'Published generation {generation} of {args.store}; '
+          f'{sum(len(h) for h in new_hits.values())} new hits for {len(new_hits)} monitored checks')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""
+Client for an upstream screening provider.
+
+A slow or failing provider must not take the integration down with it: each
+provider gets a limit on concurrent calls and a circuit breaker. When too
+many recent calls failed or were slow, the breaker opens and calls fail
+straight away with `ProviderUnavailable` (reported to PassFort as a
+`PROVIDER_CONNECTION` error) instead of holding a worker until they time
+out. After `open_seconds` the breaker lets a few probe calls through, and
+closes again once they succeed.
+
+Calls get only the time left until the request's deadline (see
+`app.deadlines`), and tell the provider how much that is. Idempotent calls
+can be hedged: if the provider hasn't answered by about the 95th percentile
+of its recent response times, a second attempt is sent, and whichever
+answers first is used. That cuts the tail latency a slow call would add, for
+a few percent more calls.
+
+The limit, the breaker and the response times are per worker process.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Deque, Optional, Tuple
+
+from app import deadlines, metrics, tracing
+from app.auth import outbound_auth
+
+
+class ProviderUnavailable(Exception):
+    pass
+
+
+class CircuitOpen(ProviderUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, window: int = 20, min_calls: int = 10, failure_ratio: float = 0.5,
+                 slow_call: Optional[float] = None, slow_ratio: float = 0.5,
+                 open_seconds: float = 30, probes: int = 1):
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_call = slow_call
+        self.slow_ratio = slow_ratio
+        self.open_seconds = open_seconds
+        self.probes = probes
+
+        self.state = self.CLOSED
+        # (failed, slow) for the most recent calls
+        self._calls: Deque[Tuple[bool, bool]] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = 0
+        self._probes_passed = 0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """ Returns whether the call is a probe, or raises `CircuitOpen` if it may not be made. """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    raise CircuitOpen('Provider circuit is open')
+                self.state = self.HALF_OPEN
+                self._probing = self._probes_passed = 0
+
+            if self.state == self.HALF_OPEN:
+                if self._probing + self._probes_passed >= self.probes:
+                    raise CircuitOpen('Provider circuit is half open, waiting for probes')
+                self._probing += 1
+                return True
+
+            return False
+
+    def cancel(self, probe: bool):
+        """ For a call allowed by `before_call` that wasn't made after all. """
+        if probe:
+            with self._lock:
+                self._probing -= 1
+
+    def after_call(self, probe: bool, failed: bool, elapsed: float, timed_out: bool = False):
+        # A call that ran out of the caller's deadline took all the time it
+        # had: slow, however short the deadline was
+        slow = timed_out or (self.slow_call is not None and elapsed >= self.slow_call)
+        with self._lock:
+            if probe:
+                self._probing -= 1
+                if self.state != self.HALF_OPEN:
+                    return
+                if failed or slow:
+                    self._open()
+                else:
+                    self._probes_passed += 1
+                    if self._probes_passed >= self.probes:
+                        self.state = self.CLOSED
+                        self._calls.clear()
+                return
+
+            if self.state != self.CLOSED:
+                # Started before the circuit opened
+                return
+            self._calls.append((failed, slow))
+            if len(self._calls) < self.min_calls:
+                return
+            failures = sum(failed for failed, _ in self._calls)
+            slow_calls = sum(slow for _, slow in self._calls)
+            if failures >= self.failure_ratio * len(self._calls) or slow_calls >= self.slow_ratio * len(self._calls):
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+
+
+class ProviderClient:
+    # Seconds to wait for one of the concurrent call slots
+    QUEUE_TIMEOUT = 0.1
+    # Response times kept for the hedging delay, and how many are needed before hedging
+    LATENCY_SAMPLES = 200
+    MIN_LATENCY_SAMPLES = 20
+
+    def __init__(self, name: str, url: str, timeout: float = 10, max_concurrency: int = 10,
+                 breaker: Optional[CircuitBreaker] = None, hedge: bool = False, hedge_after: Optional[float] = None):
+        """
+        With `hedge`, idempotent calls are hedged after `hedge_after` seconds,
+        or by default after the 95th percentile of recent response times.
+        """
+        self.name = name
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._latencies: Deque[float] = deque(maxlen=self.LATENCY_SAMPLES)
+        self._session = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+        metrics.register_gauge(f'provider.{name}.circuit_open',
+                               lambda: float(self.breaker.state != CircuitBreaker.CLOSED))
+
+    def _get_session(self):
+        # Imported on first use, like in `app.auth`
+        import requests
+
+        with self._lock:
+            if self._session is None:
+                self._session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.max_concurrency)
+                self._session.mount('http://', adapter)
+                self._session.mount('https://', adapter)
+            return self._session
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Created on first use in each process, like the pool in `app.workers`
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(2 * self.max_concurrency, thread_name_prefix=f'{self.name}-hedge')
+                self._pid = os.getpid()
+            return self._executor
+
+    def hedge_delay(self) -> Optional[float]:
+        """ Seconds after which a call is hedged, or None if it isn't (yet). """
+        if not self.hedge:
+            return None
+        if self.hedge_after is not None:
+            return self.hedge_after
+        latencies = sorted(self._latencies)
+        if len(latencies) < self.MIN_LATENCY_SAMPLES:
+            return None
+        return latencies[int(len(latencies) * 0.95)]
+
+    def _acquire(self, wait: bool) -> bool:
+        # Takes a slot and the breaker's permission; returns whether the call is a probe
+        try:
+            probe = self.breaker.before_call()
+        except CircuitOpen:
+            metrics.increment(f'provider.{self.name}.rejected')
+            raise
+
+        acquired = self._slots.acquire(timeout=self.QUEUE_TIMEOUT) if wait else self._slots.acquire(blocking=False)
+        if not acquired:
+            self.breaker.cancel(probe)
+            metrics.increment(f'provider.{self.name}.rejected')
+            raise ProviderUnavailable('Too many concurrent calls to the provider')
+        return probe
+
+    @tracing.traced('provider.call')
+    def _call(self, path: str, body: dict, probe: bool) -> dict:
+        # One attempt, holding a slot taken by `_acquire`
+        import requests
+
+        timeout = self.timeout
+        headers = tracing.outbound_headers()
+        left = deadlines.remaining()
+        if left is not None:
+            if left <= 0:
+                self._slots.release()
+                self.breaker.cancel(probe)
+                raise ProviderUnavailable('Deadline exceeded before the provider was called')
+            timeout = min(timeout, left)
+            headers[deadlines.HEADER] = str(int(left * 1000))
+
+        start = time.monotonic()
+        failed = True
+        timed_out = False
+        try:
+            r = self._get_session().post(f'{self.url}{path}', json=body, headers=headers, auth=outbound_auth(),
+                                         timeout=timeout)
+            tracing.annotate(status=r.status_code)
+            # Client errors are ours, and say nothing about the provider's health
+            failed = r.status_code >= 500 or r.status_code == 429
+            r.raise_for_status()
+            try:
+                data = r.json()
+            except ValueError:
+                failed = True
+                raise ProviderUnavailable('Provider returned an invalid response')
+            self._latencies.append(time.monotonic() - start)
+            return data
+        except requests.Timeout:
+            if timeout < self.timeout:
+                # Cut short by our deadline rather than the provider's timeout:
+                # slow rather than failed, so a hung provider still opens the
+                # breaker when deadlines are shorter than `slow_call`
+                failed = False
+                timed_out = True
+                raise ProviderUnavailable('Provider did not respond within the deadline')
+            raise ProviderUnavailable(f'Provider did not respond within {self.timeout} seconds')
+        except requests.RequestException as e:
+            raise ProviderUnavailable(f'Provider request failed: {e}')
+        finally:
+            elapsed = time.monotonic() - start
+            self._slots.release()
+            self.breaker.after_call(probe, failed, elapsed, timed_out)
+            metrics.increment(f'provider.{self.name}.calls')
+            if failed:
+                metrics.increment(f'provider.{self.name}.failures')
+
+    def _submit(self, path: str, body: dict, probe: bool) -> Future:
+        # The attempt runs in the caller's context, so with its deadline
+        return self._get_executor().submit(contextvars.copy_context().run, self._call, path, body, probe)
+
+    def post(self, path: str, body: dict, idempotent: bool = False) -> dict:
+        """
+        Posts `body` to the provider and returns the JSON response.
+
+        Raises `ProviderUnavailable` if the call failed, or wasn't made because
+        the provider is failing or already has as many calls as it may.
+        Only `idempotent` calls are hedged.
+        """
+        delay = self.hedge_delay() if idempotent else None
+        if delay is None:
+            return self._call(path, body, self._acquire(wait=True))
+
+        first = self._submit(path, body, self._acquire(wait=True))
+        if wait([first], timeout=delay).done:
+            return first.result()
+
+        try:
+            # A hedge is only sent with capacity to spare, and never as a probe
+            probe = self._acquire(wait=False)
+        except ProviderUnavailable:
+            return first.result()
+        if probe:
+            self._slots.release()
+            self.breaker.cancel(probe)
+            return first.result()
+
+        metrics.increment(f'provider.{self.name}.hedged')
+        second = self._submit(path, body, False)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    if attempt is second:
+                        metrics.increment(f'provider.{self.name}.hedge_wins')
+                    return attempt.result()
+                error = attempt.exception()
+        raise error
@@ -0,0 +1,168 @@
+"""
+Replays captured traffic (see `app.capture`) against a running instance.
+
+    python -m app.replay capture.jsonl http://localhost:8001 --speed 2
+
+Each request is signed again with the integration key (`INTEGRATION_SECRET_KEY`,
+so run the instance with the same test key), the way PassFort signs requests,
+and sent at its captured time, `--speed` times faster; with `--speed 0` as fast
+as `--concurrency` allows. Latencies are measured from the time a request was
+due, so a slow instance can't hide a backlog by delaying requests.
+
+The report has the latency distributions per endpoint, replayed and captured,
+and the responses that differ from the captured ones. Redacted fields can't be
+compared, and `--ignore` skips others (by default `custom_data`, which demo
+checks randomise).
+"""
+
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+from app.capture import REDACTED_FIELDS, decode_body
+
+DEFAULT_IGNORE = ('custom_data',)
+
+_ID = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+
+class Result(NamedTuple):
+    endpoint: str
+    status: Optional[int]
+    captured_status: int
+    latency: float
+    captured_latency: float
+    differences: List[str]
+
+
+def endpoint(record: dict) -> str:
+    return f"{record['method']} {_ID.sub('<id>', record['path'].split('?')[0])}"
+
+
+def load(path: str) -> List[dict]:
+    with open(path) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    return sorted(records, key=lambda record: record['time'])
+
+
+def diff(expected, actual, ignore: Iterable[str] = DEFAULT_IGNORE, path: str = '') -> List[str]:
+    """ The paths (`a.b[0]`) at which `actual` differs from `expected`. """
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        differences = []
+        for key in sorted(set(expected) | set(actual)):
+            if key in REDACTED_FIELDS or key in ignore:
+                continue
+            differences += diff(expected.get(key), actual.get(key), ignore, f'{path}.{key}' if path else key)
+        return differences
+    if isinstance(expected, list) and isinstance(actual, list) and len(expected) == len(actual):
+        differences = []
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            differences += diff(e, a, ignore, f'{path}[{i}]')
+        return differences
+    return [] if expected == actual else [path or '(body)']
+
+
+class Replay:
+    def __init__(self, base_url: str, ignore: Sequence[str] = DEFAULT_IGNORE, timeout: float = 30):
+        self.base_url = base_url.rstrip('/')
+        self.ignore = ignore
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        # Imported on first use, like in `app.auth`
+        import requests
+
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def send(self, record: dict, due: Optional[float] = None) -> Result:
+        from requests import RequestException
+
+        from app.auth import outbound_auth
+
+        start = time.perf_counter()
+        try:
+            r = self._session().request(
+                record['method'], self.base_url + record['path'], headers=record['headers'],
+                data=json.dumps(record['body']).encode() if record['body'] is not None else None,
+                auth=outbound_auth(), timeout=self.timeout,
+            )
+            status = r.status_code
+            body = decode_body(r.content, r.headers.get('Content-Type', '').split(';')[0])
+            differences = [] if status != record['status'] else diff(record['response'], body, self.ignore)
+        except RequestException as e:
+            status, differences = None, [f'(request failed: {e})']
+        latency = time.perf_counter() - (start if due is None else due)
+        return Result(endpoint(record), status, record['status'], latency, record['duration_ms'] / 1000,
+                      differences)
+
+    def run(self, records: List[dict], speed: float = 1, concurrency: int = 8) -> List[Result]:
+        if not records:
+            return []
+        with ThreadPoolExecutor(concurrency) as pool:
+            start, first = time.perf_counter(), records[0]['time']
+            futures = []
+            for record in records:
+                due = None
+                if speed:
+                    due = start + (record['time'] - first) / speed
+                    time.sleep(max(0.0, due - time.perf_counter()))
+                futures.append(pool.submit(self.send, record, due))
+            return [future.result() for future in futures]
+
+
+def _percentile(ordered: List[float], p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def report(results: List[Result], out=sys.stdout, examples: int = 5):
+    by_endpoint: Dict[str, List[Result]] = defaultdict(list)
+    for result in results:
+        by_endpoint[result.endpoint].append(result)
+
+    print(f"{'endpoint':40} {'n':>6}  {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}  "
+          f"{'captured p50':>12} {'p99':>8}  {'status':>6} {'differ':>6}", file=out)
+    for name, group in sorted(by_endpoint.items()):
+        latencies = sorted(result.latency * 1000 for result in group)
+        captured = sorted(result.captured_latency * 1000 for result in group)
+        status = sum(result.status != result.captured_status for result in group)
+        differ = sum(bool(result.differences) for result in group)
+        print(f'{name:40} {len(group):6}  ' + ' '.join(f'{_percentile(latencies, p):8.1f}' for p in (50, 90, 99))
+              + f' {latencies[-1]:8.1f}  {_percentile(captured, 50):12.1f} {_percentile(captured, 99):8.1f}'
+              + f'  {status:6} {differ:6}', file=out)
+
+    shown = [result for result in results if result.differences or result.status != result.captured_status]
+    for result in shown[:examples]:
+        print(f'{result.endpoint}: status {result.status} (captured {result.captured_status}), differs at '
+              f"{', '.join(result.differences[:5]) or '-'}", file=out)
+    if len(shown) > examples:
+        print(f'... and {len(shown) - examples} more', file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.replay', description=__doc__.split('\n\n')[0])
+    parser.add_argument('capture', help='JSON lines file recorded with CAPTURE_PATH')
+    parser.add_argument('url', help='base URL of the instance, e.g. http://localhost:8001')
+    parser.add_argument('--speed', type=float, default=1, help='rate relative to the capture, 0: no delays')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--ignore', nargs='*', default=list(DEFAULT_IGNORE), help='fields not compared')
+    args = parser.parse_args(argv)
+
+    records = load(args.capture)
+    start = time.perf_counter()
+    results = Replay(args.url, args.ignore).run(records, args.speed, args.concurrency)
+    print(f'Replayed {len(results)} requests in {time.perf_counter() - start:.1f}s', file=sys.stderr)
+    report(results)
+    sys.exit(1 if any(result.differences or result.status != result.captured_status for result in results) else 0)
+
+
+if __name__ == '__main__':
+    main()
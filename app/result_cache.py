@@ -0,0 +1,181 @@
+"""
+Cache of screening results, for entities screened repeatedly in a short time
+(onboarding, re-checks, associates sharing a name).
+
+Results are keyed on a canonical hash of the normalised check input, the
+provider config and the version of the watchlist index they came from, so a
+new list generation is never answered from old results. There are two tiers:
+an LRU in each process, bounded by size and TTL, and optionally a SQLite file
+shared by the workers on a host (`RESULT_CACHE_PATH`). Concurrent requests
+for the same key in a process wait for one computation instead of repeating it.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from app import metrics
+from app.local_store import LocalStore
+from app.startup import result_cache_max_bytes, result_cache_path, result_cache_ttl
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS screening_results (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS screening_results_expires ON screening_results (expires);
+'''
+
+
+def cache_key(*parts) -> str:
+    """ A hash of `parts`, which must be JSON serialisable; dict key order doesn't matter. """
+    canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Optional[bytes] = None
+        self.error: Optional[BaseException] = None
+
+
+class ResultCache:
+    # Rows in the shared tier, evicted oldest-expiring first
+    SHARED_MAX_ROWS = 100000
+    EVICT_EVERY = 100
+
+    def __init__(self, ttl: float, max_bytes: int, shared_path: Optional[str] = None, name: str = 'result_cache'):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.name = name
+        self.shared = LocalStore(shared_path, SCHEMA) if shared_path else None
+
+        self._entries: 'OrderedDict[str, Tuple[float, bytes]]' = OrderedDict()
+        self._bytes = 0
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._shared_inserts = 0
+
+        metrics.register_gauge(f'{name}.entries', lambda: len(self._entries))
+        metrics.register_gauge(f'{name}.bytes', lambda: self._bytes)
+        metrics.register_gauge(f'{name}.hit_ratio', self.hit_ratio)
+
+    def hit_ratio(self) -> float:
+        hits = metrics.value(f'{self.name}.hits.memory') + metrics.value(f'{self.name}.hits.shared')
+        lookups = hits + metrics.value(f'{self.name}.misses')
+        return hits / lookups if lookups else 0.0
+
+    def _get_local(self, key: str, now: float) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= now:
+                del self._entries[key]
+                self._bytes -= len(value)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _put_local(self, key: str, value: bytes, expires: float):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[1])
+            self._entries[key] = (expires, value)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def _get_shared(self, key: str, now: float) -> Optional[Tuple[float, bytes]]:
+        return self.shared.execute(
+            'SELECT expires, value FROM screening_results WHERE key = ? AND expires > ?', (key, now)
+        ).fetchone()
+
+    def _put_shared(self, key: str, value: bytes, expires: float):
+        with self.shared.transaction() as db:
+            db.execute('INSERT OR REPLACE INTO screening_results (key, value, expires) VALUES (?, ?, ?)',
+                       (key, value, expires))
+            self._shared_inserts += 1
+            if self._shared_inserts % self.EVICT_EVERY == 0:
+                db.execute('DELETE FROM screening_results WHERE expires <= ?', (time.time(),))
+                db.execute(
+                    'DELETE FROM screening_results WHERE expires <= ('
+                    '    SELECT expires FROM screening_results ORDER BY expires DESC LIMIT 1 OFFSET ?'
+                    ')',
+                    (self.SHARED_MAX_ROWS,),
+                )
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        value = self._get_local(key, now)
+        if value is not None:
+            metrics.increment(f'{self.name}.hits.memory')
+            return value
+
+        if self.shared is not None:
+            row = self._get_shared(key, now)
+            if row is not None:
+                expires, value = row
+                self._put_local(key, value, expires)
+                metrics.increment(f'{self.name}.hits.shared')
+                return value
+
+        metrics.increment(f'{self.name}.misses')
+        return None
+
+    def put(self, key: str, value: bytes):
+        expires = time.time() + self.ttl
+        self._put_local(key, value, expires)
+        if self.shared is not None:
+            self._put_shared(key, value, expires)
+
+    def get_or_compute(self, key: str, compute: Callable[[], bytes]) -> bytes:
+        if self.ttl <= 0:
+            return compute()
+
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            metrics.increment(f'{self.name}.coalesced')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+            self.put(key, flight.value)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+screening_results = ResultCache(result_cache_ttl, result_cache_max_bytes, result_cache_path, 'screening_results')
@@ -0,0 +1,456 @@
+"""
+Real (non-demo) checks, screened in-process against the local watchlist index,
+or by an upstream provider when `PROVIDER_URL` is set.
+"""
+
+import json
+import os
+import re
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from flask import Response
+from schematics.exceptions import BaseError
+
+from app import jobs, tracing
+from app.api import (
+    Charge,
+    CommercialRelationshipType,
+    CountryMatchType,
+    CustomData,
+    DateMatchType,
+    EntityType,
+    Error,
+    Field,
+    FlagType,
+    HitStatus,
+    PollCheckRequest,
+    PollCheckResponse,
+    ProviderConfig,
+    ScreeningHit,
+    ScreeningQuery,
+    StartCheckRequest,
+    StartCheckResponse,
+    passthrough_response,
+)
+from app.countries import normalize_country
+from app.hit_log import hit_log
+from app.media import collapse_media
+from app.provider import CircuitBreaker, ProviderClient, ProviderUnavailable
+from app.result_cache import cache_key, screening_results
+from app.startup import (
+    provider_failure_ratio,
+    provider_hedge,
+    provider_hedge_after,
+    provider_max_concurrency,
+    provider_open_seconds,
+    provider_slow_call,
+    provider_slow_ratio,
+    provider_timeout,
+    provider_url,
+    screening_processes,
+    screening_timeout,
+    watchlist_index_path,
+)
+from app.watchlist import WatchlistIndex, WatchlistMatch, normalize_name
+from app.watchlist_store import WatchlistStore
+from app.workers import Overloaded, PoolBroken, TaskTimeout, WorkerPool
+
+PROVIDER_DATA = 'Screened against the local watchlist index.'
+
+MATCH_THRESHOLD = 0.8
+MAX_HITS = 50
+
+# Searches scanning at least this many postings run in the worker pool (if enabled)
+HEAVY_SCREENING_COST = 20000
+
+SCREENING_JOB = 'screening'
+
+# Stands in for the hits while the rest of a response is serialised
+_HITS_PLACEHOLDER = '__screening_hits__'
+
+_FULL_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+_index: Optional[Union[WatchlistIndex, WatchlistStore]] = None
+
+_pool = WorkerPool(screening_processes, max_queued=2 * screening_processes) if screening_processes else None
+
+_provider = ProviderClient(
+    'screening', provider_url, timeout=provider_timeout, max_concurrency=provider_max_concurrency,
+    breaker=CircuitBreaker(failure_ratio=provider_failure_ratio, slow_call=provider_slow_call,
+                           slow_ratio=provider_slow_ratio, open_seconds=provider_open_seconds),
+    hedge=provider_hedge, hedge_after=provider_hedge_after,
+) if provider_url else None
+
+
+def get_index() -> Optional[Union[WatchlistIndex, WatchlistStore]]:
+    # Opened lazily (and once per process) so that importing the app doesn't
+    # require the index to exist. The mapping itself is shared between workers.
+    # A directory is an incrementally updated store (see `app.watchlist_store`).
+    global _index
+    if _index is None and watchlist_index_path:
+        if os.path.isdir(watchlist_index_path):
+            _index = WatchlistStore(watchlist_index_path)
+        else:
+            _index = WatchlistIndex(watchlist_index_path)
+    return _index
+
+
+def _dob_conflicts(query: ScreeningQuery, entry: dict) -> bool:
+    query_dob, entry_dob = query.dob, entry.get('dob')
+    if not query_dob or not entry_dob:
+        return False
+    return query_dob[:4] != entry_dob[:4]
+
+
+def match_to_hit(match: WatchlistMatch) -> ScreeningHit:
+    entry = match.entry
+    is_pep = entry['type'] == 'PEP'
+
+    data = {
+        'name': entry['name'],
+        'aliases': entry.get('aliases', []),
+        'confidence_score': round(match.score, 4),
+        'countries': [
+            {
+                'type': CountryMatchType.NATIONALITY if is_pep else CountryMatchType.SANCTIONED,
+                'country_code': country,
+            }
+            for country in dict.fromkeys(map(normalize_country, entry.get('countries', []))) if country
+        ],
+        'dates': [
+            {'type': DateMatchType.DOB, 'date': entry['dob']}
+        ] if _FULL_DATE.match(entry.get('dob') or '') else [],
+    }
+
+    if is_pep:
+        data['pep'] = {
+            'tier': entry.get('pep_tier'),
+            'roles': [{'name': entry['pep_role'], 'tier': entry.get('pep_tier')}] if entry.get('pep_role') else [],
+        }
+    else:
+        list_name = entry.get('list')
+        data['sanctions'] = [{
+            'name': f'On List [{list_name}]' if list_name else 'Sanctioned',
+            'type': 'Watch List / Sanction',
+            'list': {'name': list_name} if list_name else None,
+            'issued_by': entry.get('issued_by'),
+        }]
+
+    return ScreeningHit({
+        'provider': {
+            'hit_id': entry['id'],
+            'label': entry.get('list') or 'watchlist',
+        },
+        'status': HitStatus.UNRESOLVED,
+        'flags': [{'type': FlagType.PEP if is_pep else FlagType.SANCTION}],
+        'data': data,
+    })
+
+
+def dedupe_hits(hits: List[ScreeningHit]) -> List[ScreeningHit]:
+    """
+    Merges hits for the same person or company listed more than once (e.g. on
+    several sanctions lists), keyed on the normalised name and date of birth.
+    """
+    merged: Dict[tuple, ScreeningHit] = {}
+    for hit in hits:
+        key = (normalize_name(hit.data.name), tuple(str(d.date) for d in hit.data.dates))
+        first = merged.setdefault(key, hit)
+        if first is hit:
+            continue
+
+        first.flags += [f for f in hit.flags if f.type not in {g.type for g in first.flags}]
+        first.data.aliases += [a for a in hit.data.aliases if a not in first.data.aliases]
+        countries = {(c.type, c.country_code) for c in first.data.countries}
+        first.data.countries += [c for c in hit.data.countries if (c.type, c.country_code) not in countries]
+        first.data.sanctions = (first.data.sanctions or []) + (hit.data.sanctions or []) or None
+        first.data.pep = first.data.pep or hit.data.pep
+        first.data.confidence_score = max(first.data.confidence_score, hit.data.confidence_score)
+
+    return list(merged.values())
+
+
+def screen(entity_type: EntityType, query: ScreeningQuery,
+           index: Union[WatchlistIndex, WatchlistStore]) -> List[ScreeningHit]:
+    matches = index.search(query.name, entity_type, threshold=MATCH_THRESHOLD, limit=MAX_HITS)
+    return dedupe_hits([match_to_hit(m) for m in matches if not _dob_conflicts(query, m.entry)])
+
+
+def _monitoring_registry():
+    # Imported here because `app.monitoring` re-screens through this module
+    from app.monitoring import get_registry
+    return get_registry()
+
+
+def start_screening(entity_type: EntityType, provider_id: str, req: StartCheckRequest) -> StartCheckResponse:
+    name = req.check_input.search_name()
+    if name is None:
+        field = Field.NAME if entity_type == EntityType.INDIVIDUAL else Field.COMPANY_NAME
+        return StartCheckResponse.error([Error.missing_required_field(field)])
+
+    country = req.check_input.input_country()
+    if country and normalize_country(country) is None:
+        return StartCheckResponse.error([Error.unsupported_country()])
+
+    details = req.check_input.personal_details
+    response = StartCheckResponse({
+        'provider_id': provider_id,
+        'reference': str(req.id),
+        'custom_data': {
+            'counter': 0,
+            'query': {
+                'name': name,
+                'dob': details.dob if details is not None else None,
+            },
+        },
+        'provider_data': PROVIDER_DATA,
+    })
+
+    registry = _monitoring_registry()
+    if registry is not None and req.provider_config.ongoing_monitoring:
+        registry.register(str(req.id), entity_type, provider_id, response.custom_data.query)
+
+    if jobs.queue is not None:
+        jobs.queue.enqueue(
+            str(req.id), SCREENING_JOB,
+            _job_payload(str(req.id), entity_type, response.custom_data.query, req.provider_config),
+            jobs.current_priority(),
+        )
+        jobs.workers.ensure_started()
+
+    return response
+
+
+def screening_response(entity_type: EntityType, provider_id: str, reference: str,
+                       commercial_relationship: CommercialRelationshipType,
+                       hits: List[ScreeningHit]) -> PollCheckResponse:
+    response = PollCheckResponse({
+        'provider_id': provider_id,
+        'reference': reference,
+        'custom_data': {'counter': 0},
+        'provider_data': PROVIDER_DATA,
+        'check_output': {
+            'entity_type': entity_type,
+            'screening_hits': hits,
+        },
+    })
+
+    if commercial_relationship == CommercialRelationshipType.PASSFORT:
+        response.charges = [Charge({'amount': 100, 'reference': reference})]
+
+    return response
+
+
+def serialize_hits(hits: List[ScreeningHit]) -> List[bytes]:
+    """ Each of `hits` serialised on its own, as it is in a response body. """
+    return [json.dumps(hit.serialize(), separators=(',', ':'), sort_keys=True).encode() for hit in hits]
+
+
+def join_hits(hits: List[bytes]) -> bytes:
+    return b'[' + b','.join(hits) + b']'
+
+
+def split_hits(hits: bytes) -> List[bytes]:
+    return [json.dumps(hit, separators=(',', ':'), sort_keys=True).encode() for hit in json.loads(hits)]
+
+
+def _hits_payload(entity_type: EntityType, query: dict) -> bytes:
+    # Runs inline or in the worker pool: screening, deduplication and
+    # serialisation of the hits, which is what the result cache holds.
+    hits = screen(entity_type, ScreeningQuery(query), get_index())
+    return join_hits(serialize_hits(hits))
+
+
+def _screening_body(response: PollCheckResponse) -> Tuple[bytes, bytes]:
+    # The envelope is small, so it is serialised per request, around a
+    # placeholder: the cached hits go between the two halves as they are.
+    data = response.serialize()
+    data['check_output']['screening_hits'] = _HITS_PLACEHOLDER
+    envelope = json.dumps(data, separators=(',', ':'), sort_keys=True).encode() + b'\n'
+    before, after = envelope.split(json.dumps(_HITS_PLACEHOLDER).encode(), 1)
+    return before, after
+
+
+def partial_response(response: PollCheckResponse, hits: List[bytes], cursor: int) -> Response:
+    """
+    `response` (pending or final) carrying `hits`, the serialised hits past
+    the client's `cursor`, with `custom_data.cursor` moved on past them.
+    """
+    if response.custom_data is None:
+        response.custom_data = CustomData({'counter': 0})
+    response.custom_data.cursor = cursor + len(hits)
+    before, after = _screening_body(response)
+    return passthrough_response(before, join_hits(hits), after)
+
+
+def _provider_hits(entity_type: EntityType, query: ScreeningQuery,
+                   on_hits: Optional[Callable[[int, List[bytes]], None]] = None) -> bytes:
+    # The provider answers with hits in PassFort's shape, a page at a time
+    # (following `next`) if it has many; they are validated and serialised the
+    # same way as hits from the local index. `on_hits` gets each page as it comes.
+    hits = []
+    page = None
+    while True:
+        body = {
+            'entity_type': entity_type,
+            'name': query.name,
+            'dob': query.dob,
+            'limit': MAX_HITS - len(hits),
+        }
+        if page is not None:
+            body['page'] = page
+        data = _provider.post('/search', body, idempotent=True)
+        try:
+            found = [ScreeningHit(hit) for hit in data['hits']]
+            for hit in found:
+                hit.validate()
+            page = data.get('next')
+        except (KeyError, TypeError, BaseError) as e:
+            raise ProviderUnavailable(f'Provider returned invalid hits: {e}')
+
+        for hit in found:
+            if hit.data.media:
+                # Syndicated copies of a story come back as separate articles
+                hit.data.media = collapse_media(hit.data.media, hit.data.name)
+
+        found = serialize_hits(found)[:MAX_HITS - len(hits)]
+        if on_hits is not None:
+            on_hits(len(hits), found)
+        hits.extend(found)
+        if page is None or not found or len(hits) >= MAX_HITS:
+            return join_hits(hits)
+
+
+@tracing.traced('screening')
+def _screening_hits(entity_type: EntityType, query: ScreeningQuery, provider_config: dict,
+                    on_hits: Optional[Callable[[int, List[bytes]], None]] = None) -> bytes:
+    """
+    The serialised hits for `query`, from the result cache if possible.
+    `on_hits(position, hits)` is called with hits as the provider returns them.
+    """
+    if _provider is not None:
+        key = cache_key(entity_type, normalize_name(query.name), query.dob, provider_config, _provider.url)
+        return screening_results.get_or_compute(key, lambda: _provider_hits(entity_type, query, on_hits))
+
+    index = get_index()
+    if index is None:
+        raise RuntimeError('Watchlist index is not configured.')
+
+    def compute() -> bytes:
+        if _pool is not None and index.estimate_cost(query.name) >= HEAVY_SCREENING_COST:
+            return _pool.run(screening_timeout, _hits_payload, entity_type, query.to_primitive())
+        return _hits_payload(entity_type, query.to_primitive())
+
+    key = cache_key(entity_type, normalize_name(query.name), query.dob, provider_config, index.version)
+    return screening_results.get_or_compute(key, compute)
+
+
+def _job_payload(check_id: str, entity_type: EntityType, query: ScreeningQuery,
+                 provider_config: ProviderConfig) -> dict:
+    return {
+        'check_id': check_id,
+        'entity_type': entity_type,
+        'query': query.to_primitive(),
+        'provider_config': provider_config.to_primitive(),
+    }
+
+
+@jobs.handler(SCREENING_JOB)
+def _screening_job(payload: dict) -> bytes:
+    # Errors, including a full worker pool, are retried by the queue
+    on_hits = None
+    if payload['provider_config'].get('partial_results') and 'check_id' in payload:
+        # Pending polls send the hits logged so far
+        on_hits = partial(hit_log.append, payload['check_id'])
+
+    hits = _screening_hits(payload['entity_type'], ScreeningQuery(payload['query']), payload['provider_config'],
+                           on_hits)
+    if on_hits is not None:
+        on_hits(0, split_hits(hits))
+    return hits
+
+
+def _job_hits(entity_type: EntityType, provider_id: str,
+              req: PollCheckRequest) -> Union[bytes, PollCheckResponse, Response]:
+    jobs.workers.ensure_started()
+    job = jobs.queue.get(str(req.id))
+    if job is None:
+        # Started before the queue was enabled, or finished long enough ago to be purged
+        jobs.queue.enqueue(
+            str(req.id), SCREENING_JOB,
+            _job_payload(str(req.id), entity_type, req.custom_data.query, req.provider_config),
+            jobs.current_priority(),
+        )
+
+    if job is None or job.status in {jobs.QUEUED, jobs.RUNNING}:
+        if req.provider_config.partial_results:
+            cursor = req.custom_data.cursor or 0
+            response = PollCheckResponse({
+                'provider_id': provider_id,
+                'reference': req.reference,
+                'custom_data': req.custom_data.to_primitive(),
+                'provider_data': PROVIDER_DATA,
+                'check_output': {'entity_type': entity_type},
+                'pending': True,
+            })
+            return partial_response(response, hit_log.read(str(req.id), cursor), cursor)
+
+        return PollCheckResponse({
+            'provider_id': provider_id,
+            'reference': req.reference,
+            # Sent back with the next poll
+            'custom_data': req.custom_data.to_primitive(),
+            'provider_data': PROVIDER_DATA,
+            'pending': True,
+        })
+
+    if job.status == jobs.DEAD:
+        return PollCheckResponse.error([
+            Error.provider_connection(f'Screening failed after {job.attempts} attempts: {job.error}')
+        ])
+
+    return job.result
+
+
+def poll_screening(entity_type: EntityType, provider_id: str,
+                   req: PollCheckRequest) -> Union[PollCheckResponse, Response]:
+    if _provider is None and get_index() is None:
+        return PollCheckResponse.error([Error.provider_connection('Watchlist index is not configured.')])
+
+    registry = _monitoring_registry()
+    if registry is not None:
+        alerts = registry.take_alerts(str(req.id), req.reference)
+        if alerts is not None:
+            return alerts
+
+    if jobs.queue is not None:
+        hits = _job_hits(entity_type, provider_id, req)
+        if not isinstance(hits, bytes):
+            return hits
+    else:
+        try:
+            hits = _screening_hits(entity_type, req.custom_data.query, req.provider_config.to_primitive())
+        except Overloaded:
+            return PollCheckResponse.error([Error.provider_connection('Screening capacity exceeded, try again.')])
+        except TaskTimeout:
+            return PollCheckResponse.error([
+                Error.provider_connection(f'Screening did not finish within {screening_timeout} seconds.')
+            ])
+        except PoolBroken:
+            return PollCheckResponse.error([Error.provider_connection('Screening failed, try again.')])
+        except ProviderUnavailable as e:
+            return PollCheckResponse.error([Error.provider_connection(str(e))])
+
+    if registry is not None and req.provider_config.ongoing_monitoring:
+        # Only monitored checks pay for parsing the hits back
+        registry.record_hits(str(req.id), [hit['provider']['hit_id'] for hit in json.loads(hits)])
+
+    response = screening_response(entity_type, provider_id, req.reference, req.commercial_relationship, [])
+    if req.provider_config.partial_results:
+        # Only the hits the client hasn't had with a pending poll
+        cursor = req.custom_data.cursor or 0
+        return partial_response(response, split_hits(hits)[cursor:], cursor)
+
+    before, after = _screening_body(response)
+    return passthrough_response(before, hits, after)
@@ -0,0 +1,121 @@
+"""
+gunicorn settings and server hooks, loaded by `gunicorn.conf.py`:
+
+    gunicorn -c gunicorn.conf.py main:app
+
+`SERVING_PROFILE` picks the worker model:
+
+- `sync`: one request at a time per worker, `2 * CPUs + 1` workers. Simple,
+  but a slow client or provider ties up a whole process.
+- `gthread` (default): `CPUs + 1` workers of `GUNICORN_THREADS` threads (4),
+  with keep-alive. Screening holds the GIL, so threads mostly help while
+  waiting on I/O; CPU-heavy searches go to `app.workers` instead.
+- `async`: gevent workers (`pip install gevent`), one per CPU, for many
+  concurrent slow provider calls.
+
+`WEB_CONCURRENCY` overrides the number of workers. The app is preloaded in
+the master: models, demo results and opened indexes are shared copy-on-write,
+and frozen out of the garbage collector so collections don't touch (and copy)
+their pages. Workers are recycled after `GUNICORN_MAX_REQUESTS` requests
+(jittered), or as soon as their RSS exceeds `WORKER_MAX_RSS_MB`.
+
+With more than one worker and neither `HIT_LOG_PATH` nor `JOB_QUEUE_PATH`
+set, the hit logs of partial results are kept in `hit_log.db` in
+`SHARED_STORE_DIR` (default: the temp dir) rather than in each worker, since
+the polls of a check can land on any worker.
+
+Keys are read again in every new worker, so after rotating the key file
+(`INTEGRATION_SECRET_KEY_FILE`) a `kill -HUP` on the master swaps workers
+gracefully: new ones start with the new key while old ones finish their
+requests.
+"""
+
+import gc
+import logging
+import os
+import resource
+import tempfile
+from typing import Optional
+
+PROFILES = ('sync', 'gthread', 'async')
+
+MAX_REQUESTS = 10000
+# Longer than the load balancer waits before reusing an idle connection
+KEEPALIVE = 75
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+# 0 disables recycling on memory use
+WORKER_MAX_RSS = _env_int('WORKER_MAX_RSS_MB', 0) * 2 ** 20
+
+
+def settings(profile: Optional[str] = None, cpu_count: Optional[int] = None) -> dict:
+    profile = profile or os.environ.get('SERVING_PROFILE', 'gthread')
+    cpu_count = cpu_count or os.cpu_count() or 1
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown serving profile '{profile}', expected one of {', '.join(PROFILES)}")
+
+    max_requests = _env_int('GUNICORN_MAX_REQUESTS', MAX_REQUESTS)
+    config = {
+        'bind': f":{os.environ.get('PORT', '8080')}",
+        'preload_app': True,
+        # Jitter keeps workers started together from all restarting together
+        'max_requests': max_requests,
+        'max_requests_jitter': max_requests // 10,
+        'keepalive': KEEPALIVE,
+    }
+
+    if profile == 'sync':
+        config.update(worker_class='sync', workers=2 * cpu_count + 1)
+    elif profile == 'gthread':
+        config.update(worker_class='gthread', workers=cpu_count + 1, threads=_env_int('GUNICORN_THREADS', 4))
+    else:
+        try:
+            import gevent  # noqa: F401
+        except ImportError:
+            raise RuntimeError('The async serving profile requires gevent (pip install gevent)')
+        config.update(worker_class='gevent', workers=cpu_count, worker_connections=1000)
+
+    if 'WEB_CONCURRENCY' in os.environ:
+        config['workers'] = _env_int('WEB_CONCURRENCY', config['workers'])
+
+    return config
+
+
+def share_hit_log(workers: int):
+    """ Points `HIT_LOG_PATH` at a file shared by the workers, if there are several and it isn't set. """
+    if workers > 1 and not os.environ.get('HIT_LOG_PATH') and not os.environ.get('JOB_QUEUE_PATH'):
+        directory = os.environ.get('SHARED_STORE_DIR') or tempfile.gettempdir()
+        os.environ['HIT_LOG_PATH'] = os.path.join(directory, 'hit_log.db')
+
+
+def rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * resource.getpagesize()
+    except FileNotFoundError:
+        # Peak rather than current RSS, in kilobytes on Linux but bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def pre_fork(server, worker):
+    # Objects loaded by the preloaded app live as long as the master. Left to
+    # the collector, every collection in a worker would write to their pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app import startup
+    startup.reload_keys()
+
+
+def post_request(worker, req, environ, resp):
+    if WORKER_MAX_RSS and rss_bytes() > WORKER_MAX_RSS:
+        logging.getLogger(__name__).warning(
+            f'Worker {worker.pid} exceeded {WORKER_MAX_RSS // 2 ** 20} MiB RSS, restarting it'
+        )
+        # Finishes in-flight requests, then exits; the master starts a replacement
+        worker.alive = False
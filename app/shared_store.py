@@ -0,0 +1,179 @@
+"""
+Read-only payloads shared by all workers on a host.
+
+A store is an immutable file of key -> bytes, written once and then mmap'd
+by every process that reads it. The pages live in the OS page cache, so each
+payload is in memory once however many gunicorn workers serve it.
+`SharedStore.get` returns a memoryview into the mapping rather than a copy,
+and `SharedStore.open` a file that servers can send with sendfile(2).
+
+Layout (native byte order, offsets in bytes from the start of the file):
+
+    header   magic, byte order, entry count, section offsets
+    hashes   u64 key hashes, sorted
+    records  4 x u64 per entry, in hash order: key offset, key length,
+             value offset, value length (offsets into `data`)
+    data     keys and values
+"""
+
+import glob
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_left
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional, Tuple
+
+MAGIC = b'SRSHST01'
+
+_HEADER = struct.Struct('<8sBxxxIQQQ')
+
+
+def _key_hash(key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+def build_store(items: Iterable[Tuple[str, bytes]], path: str) -> int:
+    """ Writes a store of `items` to `path`, atomically. Returns the number of entries. """
+    entries = sorted(((_key_hash(key.encode()), key.encode(), bytes(value)) for key, value in items),
+                     key=lambda entry: entry[0])
+
+    hashes = struct.pack(f'={len(entries)}Q', *(hashed for hashed, _, _ in entries))
+    records = []
+    data = bytearray()
+    for _, key, value in entries:
+        records += [len(data), len(key)]
+        data += key
+        records += [len(data), len(value)]
+        data += value
+
+    hashes_off = _HEADER.size
+    records_off = hashes_off + len(hashes)
+    data_off = records_off + 8 * len(records)
+
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, sys.byteorder == 'little', len(entries), hashes_off, records_off, data_off))
+        file.write(hashes)
+        file.write(struct.pack(f'={len(records)}Q', *records))
+        file.write(data)
+    os.replace(tmp_path, path)
+
+    return len(entries)
+
+
+class ValueFile:
+    """
+    A value of a store, as a read-only file: its own file descriptor on the
+    store, positioned at the value, with reads stopping at its end. Servers
+    can send it with sendfile(2) straight from the page cache.
+    """
+
+    mode = 'rb'
+
+    def __init__(self, file: BinaryIO, length: int):
+        self._file = file
+        self.length = self._remaining = length
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def read(self, size: int = -1) -> bytes:
+        size = self._remaining if size < 0 else min(size, self._remaining)
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+class SharedStore:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, little_endian, self._count, hashes_off, records_off, data_off = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f'Not a shared store: {path}')
+        if bool(little_endian) != (sys.byteorder == 'little'):
+            raise ValueError(f'Shared store was built on a host with a different byte order: {path}')
+
+        self._view = view = memoryview(self._mmap)
+        self._hashes = view[hashes_off:records_off].cast('Q')
+        self._records = view[records_off:data_off].cast('Q')
+        self._data = view[data_off:]
+        self._data_off = data_off
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def close(self):
+        for view in (self._hashes, self._records, self._data, self._view):
+            view.release()
+        self._mmap.close()
+
+    def _find(self, key: str) -> Optional[int]:
+        encoded = key.encode()
+        hashed = _key_hash(encoded)
+        i = bisect_left(self._hashes, hashed)
+        # Keys with the same hash are adjacent
+        while i < self._count and self._hashes[i] == hashed:
+            key_off, key_len = self._records[4 * i], self._records[4 * i + 1]
+            if self._data[key_off:key_off + key_len] == encoded:
+                return i
+            i += 1
+        return None
+
+    def keys(self) -> Iterator[str]:
+        for i in range(self._count):
+            key_off, key_len = self._records[4 * i], self._records[4 * i + 1]
+            yield self._data[key_off:key_off + key_len].tobytes().decode()
+
+    def get(self, key: str) -> Optional[memoryview]:
+        i = self._find(key)
+        if i is None:
+            return None
+        value_off, value_len = self._records[4 * i + 2], self._records[4 * i + 3]
+        return self._data[value_off:value_off + value_len]
+
+    def open(self, key: str) -> Optional[ValueFile]:
+        """ The value of `key` as a file, or None if it's missing (or the store file was removed since). """
+        i = self._find(key)
+        if i is None:
+            return None
+        value_off, value_len = self._records[4 * i + 2], self._records[4 * i + 3]
+
+        # Each response needs a file descriptor of its own: servers seek it
+        try:
+            file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None
+        file.seek(self._data_off + value_off)
+        return ValueFile(file, value_len)
+
+
+def open_store(directory: str, name: str, fingerprint: str,
+               items: Callable[[], Iterable[Tuple[str, bytes]]]) -> SharedStore:
+    """
+    Opens the store `name` for `fingerprint` (which should change whenever
+    the items would), building it from `items()` if no process on this host
+    has yet. Stores of other fingerprints are removed; processes still using
+    them keep their mapping.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{name}-{fingerprint}.store')
+    if not os.path.exists(path):
+        build_store(items(), path)
+        for stale in glob.glob(os.path.join(directory, f'{name}-*.store')):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+    return SharedStore(path)
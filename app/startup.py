@@ -13,11 +13,95 @@ def _env(name):
         sys.exit(f'Missing required environment variable: {name}')
 
 
-_integration_secret_key = _env('INTEGRATION_SECRET_KEY')
+def _integration_secret_key():
+    # A file (e.g. a mounted secret) can be rotated without restarting the master
+    path = os.environ.get('INTEGRATION_SECRET_KEY_FILE')
+    if path:
+        with open(path) as file:
+            return file.read().strip()
+    return _env('INTEGRATION_SECRET_KEY')
 
-integration_key_store = {
-    _integration_secret_key[:8]: base64.b64decode(_integration_secret_key)
-}
-integration_key_id = _integration_secret_key[:8]
+
+integration_key_store = {}
+integration_key_id = None
+
+
+def reload_keys():
+    """
+    Reads the integration key again. Called in each new gunicorn worker, so
+    after a key rotation `kill -HUP` on the master replaces the workers with
+    ones using the new key (see `app.serving`).
+    """
+    global integration_key_id
+    secret_key = _integration_secret_key()
+    integration_key_id = secret_key[:8]
+    # Updated in place: other modules hold a reference to the store
+    integration_key_store.clear()
+    integration_key_store[integration_key_id] = base64.b64decode(secret_key)
+
+
+reload_keys()
+
+# Optional: path to an index built with `python -m app.watchlist build`
+watchlist_index_path = os.environ.get('WATCHLIST_INDEX_PATH')
+
+# Optional: SQLite database of checks under ongoing monitoring (see `app.monitoring`)
+monitoring_db_path = os.environ.get('MONITORING_DB_PATH')
+
+# Processes per worker for CPU-heavy screening (0 runs everything on the request thread)
+screening_processes = int(os.environ.get('SCREENING_PROCESSES', '0'))
+screening_timeout = float(os.environ.get('SCREENING_TIMEOUT', '10'))
+
+# Admission control (see `app.admission`): requests per second and burst per
+# signing key, concurrent requests per endpoint. 0 disables a limit.
+admission_rate = float(os.environ.get('ADMISSION_RATE', '0'))
+admission_burst = float(os.environ.get('ADMISSION_BURST', '0'))
+admission_concurrency = int(os.environ.get('ADMISSION_CONCURRENCY', '0'))
+admission_state_dir = os.environ.get('ADMISSION_STATE_DIR')
+
+# Responses to `POST /checks`, by request id, kept for retries (see `app.idempotency`)
+idempotency_cache_path = os.environ.get('IDEMPOTENCY_CACHE_PATH')
+idempotency_cache_size = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', '10000'))
+
+# Screening results cached per worker (and per host with a path), see `app.result_cache`
+result_cache_ttl = float(os.environ.get('RESULT_CACHE_TTL', '300'))
+result_cache_max_bytes = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(64 * 2 ** 20)))
+result_cache_path = os.environ.get('RESULT_CACHE_PATH')
+
+# Directory for payloads shared by the workers on a host (see `app.shared_store`), default: the temp dir
+shared_store_dir = os.environ.get('SHARED_STORE_DIR')
+
+# Optional: SQLite job queue; checks then run in the background (see `app.jobs`)
+job_queue_path = os.environ.get('JOB_QUEUE_PATH')
+job_workers = int(os.environ.get('JOB_WORKERS', '2'))
+job_max_attempts = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+
+# Optional: SQLite file of the hits found per check, default: the job queue's (see `app.hit_log`)
+hit_log_path = os.environ.get('HIT_LOG_PATH')
+
+# Optional: upstream screening provider, used instead of the local index (see `app.provider`)
+provider_url = os.environ.get('PROVIDER_URL')
+provider_timeout = float(os.environ.get('PROVIDER_TIMEOUT', '10'))
+provider_max_concurrency = int(os.environ.get('PROVIDER_MAX_CONCURRENCY', '10'))
+# The circuit opens when this share of recent calls failed, or PROVIDER_SLOW_RATIO of them took
+# PROVIDER_SLOW_CALL seconds or more
+provider_failure_ratio = float(os.environ.get('PROVIDER_FAILURE_RATIO', '0.5'))
+provider_slow_call = float(os.environ.get('PROVIDER_SLOW_CALL', '5'))
+provider_slow_ratio = float(os.environ.get('PROVIDER_SLOW_RATIO', '0.5'))
+provider_open_seconds = float(os.environ.get('PROVIDER_OPEN_SECONDS', '30'))
+# Hedge provider searches: after PROVIDER_HEDGE_AFTER seconds, or by default the p95 response time
+provider_hedge = os.environ.get('PROVIDER_HEDGE', '0') == '1'
+provider_hedge_after = float(os.environ['PROVIDER_HEDGE_AFTER']) if os.environ.get('PROVIDER_HEDGE_AFTER') else None
+
+# Seconds a request may take, unless its caller sets `X-Request-Timeout-Ms` (0: no limit, see `app.deadlines`)
+request_timeout = float(os.environ.get('REQUEST_TIMEOUT', '0'))
+
+# Optional: JSON lines file recording a sample of the traffic, for replaying it (see `app.capture`)
+capture_path = os.environ.get('CAPTURE_PATH')
+capture_sample_rate = float(os.environ.get('CAPTURE_SAMPLE_RATE', '0.1'))
+
+# Optional: JSON lines file or collector URL for request traces, and the share of requests traced (see `app.tracing`)
+trace_export = os.environ.get('TRACE_EXPORT')
+trace_sample_rate = float(os.environ.get('TRACE_SAMPLE_RATE', '0.1'))
 
 logging.basicConfig(level=os.environ.get('LOGLEVEL', 'INFO'))
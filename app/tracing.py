@@ -0,0 +1,326 @@
+"""
+Request tracing: timed spans for the stages of a request, exported in batches.
+
+With `TRACE_EXPORT` set (a JSON lines file, or the URL of a collector), a
+sample of the requests (`TRACE_SAMPLE_RATE`, default 0.1) is traced: a root
+span for the request, with child spans for authentication, validation, the
+handler, screening, demo results, the logging hooks and each call to a
+provider. A request with a W3C `traceparent` header joins the caller's trace,
+sampled or not as the caller decided, and calls to providers pass the trace on
+in the same header, so their spans can be put together with ours.
+
+Requests that aren't sampled have no current span, and every `span` in them is
+a shared no-op, so tracing costs next to nothing when it is off.
+
+Spans are sent from a background thread in each process, in batches of up to
+`BATCH_SIZE`, at least every `FLUSH_INTERVAL` seconds. Spans are dropped
+(counted in `tracing.dropped`) rather than queued without limit.
+
+    python -m app.tracing collect spans.jsonl --port 9411
+    python -m app.tracing show spans.jsonl [trace id]
+
+run a stand-in collector that appends the batches it receives to a file, and
+print the traces in a file as trees of spans.
+"""
+
+import abc
+import argparse
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from flask import Response, g, request
+
+from app import metrics
+from app.startup import trace_export, trace_sample_rate
+
+HEADER = 'traceparent'
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'sampled', 'attributes', 'start', '_started', '_token')
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, sampled: bool = True, **attributes):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.sampled = sampled
+        self.attributes = attributes
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._token = None
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def __enter__(self) -> 'Span':
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        self.finish()
+
+    def finish(self):
+        if self.sampled and exporter is not None:
+            exporter.export({
+                'trace_id': self.trace_id,
+                'span_id': self.span_id,
+                'parent_id': self.parent_id,
+                'name': self.name,
+                'start': self.start,
+                'duration_ms': round((time.perf_counter() - self._started) * 1000, 3),
+                'attributes': self.attributes,
+                'pid': os.getpid(),
+            })
+
+
+class _NoSpan:
+    # Stands in for the spans of requests that aren't traced
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+_current: ContextVar[Optional[Span]] = ContextVar('span', default=None)
+
+
+def span(name: str, **attributes):
+    """ A child span of the current one, as a context manager, if the request is traced. """
+    parent = _current.get()
+    if parent is None or not parent.sampled:
+        return _NO_SPAN
+    return Span(parent.trace_id, parent.span_id, name, **attributes)
+
+
+def traced(name: str):
+    """ Runs the decorated function in a span called `name`. """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapped(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def annotate(**attributes):
+    """ Adds `attributes` to the current span, if there is one. """
+    current = _current.get()
+    if current is not None and current.sampled:
+        current.attributes.update(attributes)
+
+
+def outbound_headers() -> Dict[str, str]:
+    """ Headers that pass the current trace on to a provider. """
+    current = _current.get()
+    return {} if current is None else {HEADER: current.traceparent()}
+
+
+class SpanExporter(abc.ABC):
+    BATCH_SIZE = 100
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, max_queued: int = 10000):
+        self.max_queued = max_queued
+        self._queue: Optional[queue.Queue] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _get_queue(self) -> queue.Queue:
+        # Started on first use in each process, like the pool in `app.workers`
+        with self._lock:
+            if self._queue is None or self._pid != os.getpid():
+                self._queue = queue.Queue(self.max_queued)
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, args=(self._queue,), name='tracing', daemon=True).start()
+            return self._queue
+
+    def export(self, span: dict):
+        try:
+            self._get_queue().put_nowait(span)
+        except queue.Full:
+            metrics.increment('tracing.dropped')
+
+    def flush(self):
+        """ Waits until the spans exported so far are sent. """
+        self._get_queue().join()
+
+    def _run(self, spans: queue.Queue):
+        while True:
+            batch = [spans.get()]
+            deadline = time.monotonic() + self.FLUSH_INTERVAL
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(spans.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self.send(batch)
+                metrics.increment('tracing.exported', len(batch))
+            except (OSError, ValueError):
+                metrics.increment('tracing.dropped', len(batch))
+            for _ in batch:
+                spans.task_done()
+
+    @abc.abstractmethod
+    def send(self, batch: List[dict]):
+        """ Sends a batch of spans, raising OSError or ValueError if it can't. """
+
+
+class FileExporter(SpanExporter):
+    def __init__(self, path: str, max_queued: int = 10000):
+        super().__init__(max_queued)
+        self.path = path
+
+    def send(self, batch: List[dict]):
+        # One write to a file opened for appending, so the workers' batches don't interleave
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, b''.join(json.dumps(span, separators=(',', ':')).encode() + b'\n' for span in batch))
+        finally:
+            os.close(fd)
+
+
+class CollectorExporter(SpanExporter):
+    """ Posts batches as `{"spans": [...]}` to a collector (e.g. `python -m app.tracing collect`). """
+
+    def __init__(self, url: str, max_queued: int = 10000, timeout: float = 5):
+        super().__init__(max_queued)
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, batch: List[dict]):
+        # Imported on first use, like in `app.auth`
+        import requests
+
+        try:
+            requests.post(self.url, json={'spans': batch}, timeout=self.timeout).raise_for_status()
+        except requests.RequestException as e:
+            raise OSError(e)
+
+
+def _exporter(target: Optional[str]) -> Optional[SpanExporter]:
+    if not target:
+        return None
+    if target.startswith(('http://', 'https://')):
+        return CollectorExporter(target)
+    return FileExporter(target)
+
+
+exporter = _exporter(trace_export)
+sample_rate = trace_sample_rate
+
+
+def before_request():
+    if exporter is None:
+        return
+    match = _TRACEPARENT.match(request.headers.get(HEADER, ''))
+    if match is not None:
+        # The caller decided whether the trace is sampled
+        trace_id, parent_id, flags = match.groups()
+        sampled = bool(int(flags, 16) & 1)
+    elif random.random() < sample_rate:
+        trace_id, parent_id, sampled = os.urandom(16).hex(), None, True
+    else:
+        return
+
+    root = Span(trace_id, parent_id, 'request', sampled, method=request.method, path=request.path)
+    root.__enter__()
+    g.trace_span = root
+
+
+def after_request(response: Response) -> Response:
+    annotate(status=response.status_code)
+    return response
+
+
+def teardown_request(exc):
+    root = g.pop('trace_span', None)
+    if root is not None:
+        root.__exit__(type(exc) if exc is not None else None, exc, None)
+    # Threads (and greenlets) serve one request after another
+    _current.set(None)
+
+
+def _collect(path: str, port: int):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            spans = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['spans']
+            with lock, open(path, 'ab') as file:
+                file.writelines(json.dumps(span, separators=(',', ':')).encode() + b'\n' for span in spans)
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    lock = threading.Lock()
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    print(f'Collecting spans at http://127.0.0.1:{server.server_address[1]}/ into {path}', file=sys.stderr)
+    server.serve_forever()
+
+
+def _show(path: str, trace_id: Optional[str] = None, out=sys.stdout):
+    traces: Dict[str, List[dict]] = defaultdict(list)
+    with open(path) as file:
+        for line in file:
+            span = json.loads(line)
+            if trace_id is None or span['trace_id'] == trace_id:
+                traces[span['trace_id']].append(span)
+
+    for spans in sorted(traces.values(), key=lambda spans: min(span['start'] for span in spans)):
+        ids = {span['span_id'] for span in spans}
+        children = defaultdict(list)
+        for span in sorted(spans, key=lambda span: span['start']):
+            children[span['parent_id'] if span['parent_id'] in ids else None].append(span)
+        start = min(span['start'] for span in spans)
+        print(f"trace {spans[0]['trace_id']}", file=out)
+
+        def show(parent: Optional[str], depth: int):
+            for span in children[parent]:
+                attributes = ' '.join(f'{k}={v}' for k, v in span['attributes'].items())
+                print(f"  {(span['start'] - start) * 1000:8.1f}ms {span['duration_ms']:8.1f}ms  "
+                      f"{'  ' * depth}{span['name']} {attributes}".rstrip(), file=out)
+                show(span['span_id'], depth + 1)
+        show(None, 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.tracing', description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    collect = commands.add_parser('collect', help='receive spans over HTTP and append them to a file')
+    collect.add_argument('path')
+    collect.add_argument('--port', type=int, default=9411)
+    show = commands.add_parser('show', help='print the traces in a file of spans')
+    show.add_argument('path')
+    show.add_argument('trace_id', nargs='?')
+    args = parser.parse_args(argv)
+
+    if args.command == 'collect':
+        _collect(args.path, args.port)
+    else:
+        _show(args.path, args.trace_id)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+"""
+On-disk watchlist index, queried in-process through a read-only mmap.
+
+The file is built once from a list export (CSV, JSON or JSON lines) and then
+opened by every worker. Because the mapping is read-only and file-backed, the
+pages live in the OS page cache and are shared by all gunicorn workers instead
+of being copied into each one.
+
+Layout (native byte order, offsets in bytes from the start of the file):
+
+    header      magic, version, counts and section offsets
+    buckets     open-addressed hash table: token hash -> postings range
+    postings    u32 name ids, sorted within each token
+    names       u32 entry id per name (every alias is its own name)
+    name_tokens u8 token count per name
+    name_kinds  u8 entity kind per name
+    name_slots  u8 position of the name in its entry (0 is the primary name)
+    entries     u64 offsets into `data` (entry_count + 1 of them)
+    data        compact JSON record per entry
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.countries import normalize_country
+
+MAGIC = b'SRWLIDX1'
+VERSION = 1
+
+_HEADER = struct.Struct('<8sBBHIIIQQQQQQQQ')
+_BUCKET = struct.Struct('<QII')
+
+KIND_ANY = 0
+KIND_INDIVIDUAL = 1
+KIND_COMPANY = 2
+
+_KINDS = {
+    'INDIVIDUAL': KIND_INDIVIDUAL,
+    'COMPANY': KIND_COMPANY,
+}
+
+_TOKEN_SEPARATOR = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_name(name: str) -> str:
+    stripped = unicodedata.normalize('NFKD', name.casefold())
+    if not stripped.isascii():
+        stripped = ''.join(c for c in stripped if not unicodedata.combining(c))
+    return ' '.join(t for t in _TOKEN_SEPARATOR.split(stripped) if t)
+
+
+def tokenize(name: str) -> List[str]:
+    # Duplicate tokens don't add anything to a token overlap score
+    return list(dict.fromkeys(normalize_name(name).split()))
+
+
+def token_hash(token: str) -> int:
+    value = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), 'little')
+    # Zero marks an empty bucket
+    return value or 1
+
+
+def min_shared_tokens(token_count: int, threshold: float) -> int:
+    # The fewest tokens a name must share with a `token_count` token query to
+    # reach `threshold`: 2 * shared / (token_count + name_tokens) with
+    # name_tokens >= shared.
+    return max(1, math.ceil(threshold * token_count / (2 - threshold) - 1e-9))
+
+
+def _split_list(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [v for v in value if v]
+    return [v.strip() for v in str(value).split(';') if v.strip()]
+
+
+def normalize_entry(raw: dict) -> dict:
+    entry = {
+        'id': str(raw['id']),
+        'name': raw['name'],
+        'aliases': _split_list(raw.get('aliases')),
+        'entity_type': (raw.get('entity_type') or '').upper() or None,
+        'type': (raw.get('type') or 'SANCTION').upper(),
+        'list': raw.get('list') or None,
+        'issued_by': raw.get('issued_by') or None,
+        # Alpha-3 codes, whichever codes or names the export used
+        'countries': list(dict.fromkeys(normalize_country(c) or c for c in _split_list(raw.get('countries')))),
+        'dob': raw.get('dob') or None,
+        'pep_role': raw.get('pep_role') or None,
+        'pep_tier': int(raw['pep_tier']) if raw.get('pep_tier') not in (None, '') else None,
+    }
+    return {k: v for k, v in entry.items() if v not in (None, [])}
+
+
+def load_entries(path: str) -> Iterator[dict]:
+    """
+    Reads a list export. CSV files use `;` to separate multi-valued columns
+    (`aliases`, `countries`), JSON files may hold a list or one object per line.
+    """
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf8') as file:
+            for row in csv.DictReader(file):
+                yield normalize_entry(row)
+        return
+
+    with open(path, encoding='utf8') as file:
+        if path.endswith('.jsonl'):
+            for line in file:
+                if line.strip():
+                    yield normalize_entry(json.loads(line))
+        else:
+            for raw in json.load(file):
+                yield normalize_entry(raw)
+
+
+def build_index(entries: Iterable[dict], path: str) -> int:
+    """
+    Writes the index for `entries` to `path` and returns the number of entries.
+
+    The file is written next to its destination and renamed into place, so a
+    reader never observes a partially written index.
+    """
+    postings: Dict[int, array] = defaultdict(lambda: array('I'))
+    names = array('I')
+    name_tokens = array('B')
+    name_kinds = array('B')
+    name_slots = array('B')
+    offsets = array('Q', [0])
+    data = bytearray()
+
+    for entry_id, entry in enumerate(entries):
+        kind = _KINDS.get(entry.get('entity_type'), KIND_ANY)
+        for slot, name in enumerate([entry['name'], *entry.get('aliases', [])][:256]):
+            tokens = tokenize(name)
+            if not tokens:
+                continue
+            name_id = len(names)
+            names.append(entry_id)
+            name_tokens.append(min(len(tokens), 255))
+            name_kinds.append(kind)
+            name_slots.append(slot)
+            for token in tokens:
+                postings[token_hash(token)].append(name_id)
+
+        data += json.dumps(entry, separators=(',', ':'), ensure_ascii=False).encode()
+        offsets.append(len(data))
+
+    bucket_count = 1
+    while bucket_count < 2 * len(postings):
+        bucket_count *= 2
+
+    buckets = bytearray(_BUCKET.size * bucket_count)
+    all_postings = array('I')
+    mask = bucket_count - 1
+    for hashed, ids in postings.items():
+        slot = hashed & mask
+        while _BUCKET.unpack_from(buckets, slot * _BUCKET.size)[0] != 0:
+            slot = (slot + 1) & mask
+        _BUCKET.pack_into(buckets, slot * _BUCKET.size, hashed, len(all_postings), len(ids))
+        all_postings.extend(ids)
+
+    sections = [bytes(buckets), all_postings.tobytes(), names.tobytes(), name_tokens.tobytes(),
+                name_kinds.tobytes(), name_slots.tobytes(), offsets.tobytes(), bytes(data)]
+    section_offsets = []
+    position = _HEADER.size
+    for section in sections:
+        # Keep every section 8-byte aligned so it can be cast in place
+        position += -position % 8
+        section_offsets.append(position)
+        position += len(section)
+
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, 'wb') as file:
+        file.write(_HEADER.pack(
+            MAGIC, VERSION, sys.byteorder == 'little', 0,
+            len(offsets) - 1, len(names), bucket_count,
+            *section_offsets,
+        ))
+        for offset, section in zip(section_offsets, sections):
+            file.write(bytes(offset - file.tell()))
+            file.write(section)
+    os.replace(tmp_path, path)
+
+    return len(offsets) - 1
+
+
+@dataclass
+class WatchlistMatch:
+    score: float
+    matched_name: str
+    entry: dict
+
+
+class WatchlistIndex:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            stat = os.fstat(file.fileno())
+        # Identifies this build of the index, e.g. for caching results
+        self.version = f'{path}:{stat.st_ino}:{stat.st_mtime_ns}'
+
+        (magic, version, little_endian, _, self.entry_count, self.name_count, self._bucket_count,
+         buckets_off, postings_off, names_off, tokens_off, kinds_off, slots_off, entries_off, self._data_off
+         ) = _HEADER.unpack_from(self._mmap)
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'Not a watchlist index: {path}')
+        if bool(little_endian) != (sys.byteorder == 'little'):
+            raise ValueError(f'Watchlist index was built on a host with a different byte order: {path}')
+
+        self._view = view = memoryview(self._mmap)
+        self._buckets_off = buckets_off
+        self._postings = view[postings_off:names_off].cast('I')
+        self._names = view[names_off:names_off + 4 * self.name_count].cast('I')
+        self._name_tokens = view[tokens_off:tokens_off + self.name_count]
+        self._name_kinds = view[kinds_off:kinds_off + self.name_count]
+        self._name_slots = view[slots_off:slots_off + self.name_count]
+        self._entries = view[entries_off:entries_off + 8 * (self.entry_count + 1)].cast('Q')
+
+    def __len__(self):
+        return self.entry_count
+
+    def close(self):
+        for view in (self._postings, self._names, self._name_tokens, self._name_kinds, self._name_slots,
+                     self._entries, self._view):
+            view.release()
+        self._mmap.close()
+
+    def entries(self) -> Iterator[dict]:
+        for entry_id in range(self.entry_count):
+            yield self.entry(entry_id)
+
+    def _lookup(self, token: str) -> memoryview:
+        hashed = token_hash(token)
+        mask = self._bucket_count - 1
+        slot = hashed & mask
+        while True:
+            stored_hash, start, count = _BUCKET.unpack_from(self._mmap, self._buckets_off + slot * _BUCKET.size)
+            if stored_hash == 0:
+                return self._postings[0:0]
+            if stored_hash == hashed:
+                return self._postings[start:start + count]
+            slot = (slot + 1) & mask
+
+    def entry(self, entry_id: int) -> dict:
+        start = self._data_off + self._entries[entry_id]
+        end = self._data_off + self._entries[entry_id + 1]
+        return json.loads(self._mmap[start:end].decode())
+
+    def estimate_cost(self, name: str) -> int:
+        """ The number of postings a search for `name` would scan at most. """
+        return sum(len(self._lookup(t)) for t in tokenize(name))
+
+    def search(self, name: str, entity_type: Optional[str] = None, threshold: float = 0.8,
+               limit: int = 50) -> List[WatchlistMatch]:
+        """
+        Finds entries with a name or alias whose token overlap with `name`
+        (Dice coefficient) is at least `threshold`.
+        """
+        tokens = tokenize(name)
+        if not tokens:
+            return []
+
+        kind = _KINDS.get(entity_type, KIND_ANY)
+        lists = sorted((self._lookup(t) for t in tokens), key=len)
+
+        # A name needs at least `min_shared` of the query tokens to reach the
+        # threshold, so it must contain one of the rarest
+        # `len(tokens) - min_shared + 1` tokens. Only those postings are
+        # scanned; the remaining tokens are checked by binary search.
+        min_shared = min(len(tokens), min_shared_tokens(len(tokens), threshold))
+        prefix = len(tokens) - min_shared + 1
+        candidates: Dict[int, int] = defaultdict(int)
+        for postings in lists[:prefix]:
+            for name_id in postings:
+                candidates[name_id] += 1
+
+        # entry id -> (score, name id)
+        best: Dict[int, Tuple[float, int]] = {}
+        for name_id, shared in candidates.items():
+            if kind and self._name_kinds[name_id] not in (kind, KIND_ANY):
+                continue
+            for postings in lists[prefix:]:
+                i = bisect_left(postings, name_id)
+                if i < len(postings) and postings[i] == name_id:
+                    shared += 1
+
+            score = 2 * shared / (len(tokens) + self._name_tokens[name_id])
+            if score < threshold:
+                continue
+
+            entry_id = self._names[name_id]
+            if best.get(entry_id, (0.0,))[0] < score:
+                best[entry_id] = (score, name_id)
+
+        matches = []
+        for entry_id, (score, name_id) in sorted(best.items(), key=lambda item: -item[1][0])[:limit]:
+            entry = self.entry(entry_id)
+            names = [entry['name'], *entry.get('aliases', [])]
+            matches.append(WatchlistMatch(score=score, matched_name=names[self._name_slots[name_id]], entry=entry))
+        return matches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.watchlist', description=__doc__.split('\n\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Build an index from a list export')
+    build.add_argument('source')
+    build.add_argument('index')
+
+    search = subparsers.add_parser('search', help='Search an index by name')
+    search.add_argument('index')
+    search.add_argument('name')
+    search.add_argument('--entity-type', choices=sorted(_KINDS))
+    search.add_argument('--threshold', type=float, default=0.8)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        count = build_index(load_entries(args.source), args.index)
+        print(f'Indexed {count} entries into {args.index}')
+    else:
+        index = WatchlistIndex(args.index)
+        for match in index.search(args.name, args.entity_type, args.threshold):
+            print(f'{match.score:.2f}  {match.matched_name}  {json.dumps(match.entry)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+"""
+A watchlist index that can be updated incrementally.
+
+The store is a directory of immutable index segments (see `app.watchlist`)
+and a `MANIFEST` naming the segments of the current generation:
+
+    {"generation": 3, "segments": [{"file": "seg-000001.idx", "masks": []},
+                                   {"file": "seg-000003.idx", "masks": ["42"]}]}
+
+Applying a delta writes one new segment holding the added and modified
+entries. Its `masks` are the ids it removes or replaces in older segments.
+Once there are more than `MAX_SEGMENTS` segments they are merged into one.
+
+Writers serialise on a lock file and publish a generation by renaming a new
+manifest over the old one. Readers never lock: they notice the new manifest
+on their next search, open its segments and swap them in, while searches
+already running finish against the generation they started with. A
+generation swapped out is closed (unmapping segments a merge may have
+deleted) once the last of those searches is done.
+"""
+
+import argparse
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from app.watchlist import WatchlistIndex, WatchlistMatch, build_index, load_entries, normalize_entry
+
+MANIFEST = 'MANIFEST'
+MAX_SEGMENTS = 8
+
+# How often readers check whether a new generation was published
+RELOAD_INTERVAL = 1.0
+
+OP_ADD = 'add'
+OP_MODIFY = 'modify'
+OP_REMOVE = 'remove'
+
+
+def load_delta(path: str) -> Iterator[Tuple[str, str, Optional[dict]]]:
+    """
+    Reads a JSON lines delta, one change per line:
+
+        {"op": "add", "entry": {...}}
+        {"op": "modify", "entry": {...}}
+        {"op": "remove", "id": "42"}
+    """
+    with open(path, encoding='utf8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            change = json.loads(line)
+            op = change['op']
+            if op not in (OP_ADD, OP_MODIFY, OP_REMOVE):
+                raise ValueError(f'Unknown delta operation: {op}')
+            if op == OP_REMOVE:
+                yield op, str(change['id']), None
+            else:
+                entry = normalize_entry(change['entry'])
+                yield op, entry['id'], entry
+
+
+class WatchlistGeneration:
+    """ The segments of one published manifest, opened for searching. """
+
+    def __init__(self, directory: str, manifest: dict):
+        self.generation = manifest['generation']
+        self.segments: List[WatchlistIndex] = []
+        # Ids hidden in each segment by newer segments
+        self.masked: List[Set[str]] = []
+        # Searches using this generation, and whether a newer one replaced it
+        # (both kept by `WatchlistStore`, under its lock)
+        self.users = 0
+        self.retired = False
+
+        masked: Set[str] = set()
+        try:
+            for segment in reversed(manifest['segments']):
+                self.segments.insert(0, WatchlistIndex(os.path.join(directory, segment['file'])))
+                self.masked.insert(0, set(masked))
+                masked.update(segment['masks'])
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+    def entries(self) -> Iterator[dict]:
+        for segment, masked in zip(self.segments, self.masked):
+            for entry in segment.entries():
+                if entry['id'] not in masked:
+                    yield entry
+
+    def estimate_cost(self, name: str) -> int:
+        return sum(segment.estimate_cost(name) for segment in self.segments)
+
+    def search(self, name: str, entity_type: Optional[str] = None, threshold: float = 0.8,
+               limit: int = 50) -> List[WatchlistMatch]:
+        matches: List[WatchlistMatch] = []
+        for segment, masked in zip(self.segments, self.masked):
+            for match in segment.search(name, entity_type, threshold, limit + len(masked)):
+                if match.entry['id'] not in masked:
+                    matches.append(match)
+        matches.sort(key=lambda m: -m.score)
+        return matches[:limit]
+
+
+class WatchlistStore:
+    def __init__(self, directory: str, reload_interval: float = RELOAD_INTERVAL):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self._current: Optional[WatchlistGeneration] = None
+        self._manifest_stat = None
+        self._checked_at = 0.0
+        self._reload_lock = threading.Lock()
+        self._users_lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST)
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self._manifest_path, encoding='utf8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {'generation': 0, 'segments': []}
+
+    def _stat_manifest(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self._manifest_path)
+        except FileNotFoundError:
+            # Nothing published yet: an empty generation, as in `_read_manifest`
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def current(self) -> WatchlistGeneration:
+        """
+        The latest generation. It is closed once a newer one replaces it, so
+        anything that outlives a reload should use `searching` instead.
+        """
+        if self._pid != os.getpid():
+            # Forked (e.g. into the screening pool) while another thread may
+            # have held a lock, or been searching
+            self._reload_lock = threading.Lock()
+            self._users_lock = threading.Lock()
+            if self._current is not None:
+                self._current.users = 0
+            self._pid = os.getpid()
+
+        now = time.monotonic()
+        if self._current is not None and now - self._checked_at < self.reload_interval:
+            return self._current
+
+        self._checked_at = now
+
+        manifest_stat = self._stat_manifest()
+        if self._current is not None and manifest_stat == self._manifest_stat:
+            return self._current
+
+        # Only one thread opens the new generation, the others keep searching the old one
+        if not self._reload_lock.acquire(blocking=self._current is None):
+            return self._current
+        try:
+            while True:
+                manifest_stat = self._stat_manifest()
+                try:
+                    generation = WatchlistGeneration(self.directory, self._read_manifest())
+                    break
+                except FileNotFoundError:
+                    # A merge removed a segment between reading the manifest and opening it
+                    continue
+
+            if self._current is not None:
+                logging.info(f'Watchlist generation {self._current.generation} -> {generation.generation}')
+            with self._users_lock:
+                previous, self._current = self._current, generation
+                if previous is not None:
+                    previous.retired = True
+                # Otherwise the last search still using it closes it
+                close = previous is not None and previous.users == 0
+            self._manifest_stat = manifest_stat
+            if close:
+                previous.close()
+            return generation
+        finally:
+            self._reload_lock.release()
+
+    @contextmanager
+    def searching(self) -> Iterator[WatchlistGeneration]:
+        """ The latest generation, kept open until the block exits. """
+        self.current()
+        with self._users_lock:
+            generation = self._current
+            generation.users += 1
+        try:
+            yield generation
+        finally:
+            with self._users_lock:
+                generation.users -= 1
+                close = generation.retired and generation.users == 0
+            if close:
+                generation.close()
+
+    def search(self, name: str, entity_type: Optional[str] = None, threshold: float = 0.8,
+               limit: int = 50) -> List[WatchlistMatch]:
+        with self.searching() as generation:
+            return generation.search(name, entity_type, threshold, limit)
+
+    def estimate_cost(self, name: str) -> int:
+        with self.searching() as generation:
+            return generation.estimate_cost(name)
+
+    @property
+    def version(self) -> str:
+        return f'{self.directory}:{self.current().generation}'
+
+    # Writing
+
+    @contextmanager
+    def _write_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _publish(self, manifest: dict):
+        tmp_path = f'{self._manifest_path}.tmp{os.getpid()}'
+        with open(tmp_path, 'w', encoding='utf8') as file:
+            json.dump(manifest, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self._manifest_path)
+
+        live = {segment['file'] for segment in manifest['segments']}
+        for filename in os.listdir(self.directory):
+            if filename.startswith('seg-') and filename not in live:
+                os.remove(os.path.join(self.directory, filename))
+
+    def _write_segment(self, generation: int, entries: Iterable[dict]) -> str:
+        filename = f'seg-{generation:06d}.idx'
+        build_index(entries, os.path.join(self.directory, filename))
+        return filename
+
+    def rebuild(self, entries: Iterable[dict]) -> int:
+        """ Replaces the whole store with `entries`, returning the new generation. """
+        with self._write_lock():
+            generation = self._read_manifest()['generation'] + 1
+            filename = self._write_segment(generation, entries)
+            self._publish({'generation': generation, 'segments': [{'file': filename, 'masks': []}]})
+            return generation
+
+    def apply_delta(self, changes: Iterable[Tuple[str, str, Optional[dict]]]) -> int:
+        """ Applies `(op, id, entry)` changes as a new segment, returning the new generation. """
+        with self._write_lock():
+            manifest = self._read_manifest()
+            generation = manifest['generation'] + 1
+
+            # The last change to an id wins
+            latest: Dict[str, Optional[dict]] = {}
+            for op, entry_id, entry in changes:
+                latest.pop(entry_id, None)
+                latest[entry_id] = None if op == OP_REMOVE else entry
+
+            filename = self._write_segment(generation, (e for e in latest.values() if e is not None))
+            segments = manifest['segments'] + [{'file': filename, 'masks': sorted(latest)}]
+            manifest = {'generation': generation, 'segments': segments}
+
+            if len(segments) > MAX_SEGMENTS:
+                manifest = self._merge(manifest)
+
+            self._publish(manifest)
+            return manifest['generation']
+
+    def merge(self) -> int:
+        """ Compacts all segments into one, returning the new generation. """
+        with self._write_lock():
+            manifest = self._merge(self._read_manifest())
+            self._publish(manifest)
+            return manifest['generation']
+
+    def _merge(self, manifest: dict) -> dict:
+        generation = manifest['generation'] + 1
+        merged = WatchlistGeneration(self.directory, manifest)
+        try:
+            filename = self._write_segment(generation, merged.entries())
+        finally:
+            merged.close()
+        return {'generation': generation, 'segments': [{'file': filename, 'masks': []}]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.watchlist_store', description=__doc__.split('\n\n')[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild = subparsers.add_parser('rebuild', help='Replace the store contents with a full list export')
+    rebuild.add_argument('store')
+    rebuild.add_argument('source')
+
+    apply = subparsers.add_parser('apply', help='Apply a JSON lines delta')
+    apply.add_argument('store')
+    apply.add_argument('delta')
+
+    merge = subparsers.add_parser('merge', help='Merge all segments into one')
+    merge.add_argument('store')
+
+    args = parser.parse_args(argv)
+    store = WatchlistStore(args.store)
+
+    if args.command == 'rebuild':
+        generation = store.rebuild(load_entries(args.source))
+    elif args.command == 'apply':
+        generation = store.apply_delta(load_delta(args.delta))
+    else:
+        generation = store.merge()
+    print(f'Published generation {generation} of {args.store}')
+
+
+if __name__ == '__main__':
+    main()
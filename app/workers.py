@@ -0,0 +1,98 @@
+"""
+Process pool for CPU-heavy work.
+
+Screening a name with very common tokens, deduplicating many hits and
+serialising a large result are CPU bound, and running them on a request
+thread holds the GIL (or a whole sync worker). Such work is sent to a small
+pool of processes instead. The pool bounds how much work can be waiting, so
+that an overloaded worker sheds load instead of queueing it without limit.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class Overloaded(Exception):
+    pass
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+class PoolBroken(Exception):
+    pass
+
+
+class WorkerPool:
+    def __init__(self, processes: int, max_queued: int, queue_timeout: float = 0.1):
+        self.processes = processes
+        self.queue_timeout = queue_timeout
+        # Counts running and queued tasks, including tasks that timed out but
+        # are still running: a process can't be interrupted, so they still take capacity.
+        self._slots = threading.BoundedSemaphore(processes + max_queued)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Created on first use, so that each gunicorn worker gets its own pool
+        # instead of inheriting one from the master.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(self.processes)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        # A process of the pool died (e.g. killed for using too much memory),
+        # which breaks the whole executor: the next task starts a new one
+        with self._lock:
+            if self._executor is executor:
+                logging.error('Worker pool process died, starting a new pool')
+                executor.shutdown(wait=False)
+                self._executor = None
+
+    def run(self, timeout: float, fn: Callable[..., T], *args) -> T:
+        """
+        Runs `fn(*args)` in the pool and waits up to `timeout` seconds for the result.
+
+        Raises `Overloaded` if the pool is full, `TaskTimeout` if `fn`
+        doesn't finish in time and `PoolBroken` if a process of the pool died.
+        """
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise Overloaded()
+
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._discard(executor)
+            raise PoolBroken()
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            if not future.cancel():
+                logging.warning(f'{fn.__name__} timed out after {timeout}s, leaving it to finish in the background')
+            raise TaskTimeout()
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise PoolBroken()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,30 @@
+"""
+Benchmarks, run from the repository root with `python -m benchmarks.<name>`.
+"""
+
+import base64
+import os
+import random
+from typing import List, Sequence
+
+# `app.startup` requires a key; benchmarks sign their own requests with a throwaway one
+os.environ.setdefault('INTEGRATION_SECRET_KEY', base64.b64encode(os.urandom(32)).decode())
+
+_SYLLABLES = ['al', 'an', 'ar', 'ba', 'da', 'el', 'fa', 'ha', 'ib', 'ka', 'la', 'li', 'ma', 'mo', 'na',
+              'ov', 'ra', 'ri', 'sa', 'se', 'ta', 'to', 'va', 'ya', 'za']
+_COMPANY_SUFFIXES = ['LLC', 'Ltd', 'Trading', 'Holdings', 'Group', 'Bank', 'Shipping']
+
+
+def _word(rng: random.Random) -> str:
+    return ''.join(rng.choice(_SYLLABLES) for _ in range(rng.randrange(2, 4))).capitalize()
+
+
+def synthetic_name(rng: random.Random, entity_type: str = 'INDIVIDUAL') -> str:
+    if entity_type == 'COMPANY':
+        return f'{_word(rng)} {_word(rng)} {rng.choice(_COMPANY_SUFFIXES)}'
+    return ' '.join(_word(rng) for _ in range(rng.randrange(2, 4)))
+
+
+def percentiles(samples: Sequence[float], *points: float) -> List[float]:
+    ordered = sorted(samples)
+    return [ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in points]
@@ -0,0 +1,123 @@
+"""
+Collapsing near-duplicate adverse media on large synthetic feeds.
+
+    python -m benchmarks.media_collapse --articles 1000 10000 100000
+
+A feed is made of stories, each syndicated a heavy-tailed number of times
+(up to `--max-copies`): copies get an outlet's name in the headline, lose a few
+words, gain a byline, or have a word changed. Reported per feed size:
+
+- time per article, which stays flat if collapsing is near-linear
+- the stories found, against the stories in the feed
+- merged: stories found that mix copies of different stories
+- split: feed stories that were found as more than one story
+
+With `--baseline`, feeds up to 5000 articles are also collapsed by comparing
+every pair of articles on their exact Jaccard index.
+"""
+
+import argparse
+import datetime
+import random
+import time
+from collections import defaultdict
+from typing import List, Tuple
+
+from app.api import MediaData
+from app.media import SHINGLE_WORDS, SIMILARITY, MediaCollapser, _tokens
+from benchmarks import synthetic_name
+
+OUTLETS = ['Reuters', 'AP', 'Bloomberg', 'AFP', 'The Daily Ledger', 'Metro Wire', 'Courier']
+
+
+def synthetic_feed(articles: int, max_copies: int, seed: int = 0) -> List[Tuple[int, MediaData]]:
+    rng = random.Random(seed)
+    vocabulary = [synthetic_name(rng).split()[0].lower() for _ in range(5000)]
+    feed = []
+    story = 0
+    while len(feed) < articles:
+        title = [rng.choice(vocabulary) for _ in range(rng.randrange(6, 12))]
+        snippet = [rng.choice(vocabulary) for _ in range(rng.randrange(30, 60))]
+        date = datetime.date(2020, 1, 1) + datetime.timedelta(days=rng.randrange(1500))
+        copies = min(max_copies, int(rng.paretovariate(1.2)))
+        for _ in range(min(copies, articles - len(feed))):
+            copy_title, copy_snippet = list(title), list(snippet)
+            if rng.random() < 0.5:
+                copy_title.insert(0, f'{rng.choice(OUTLETS)}:')
+            if rng.random() < 0.5:
+                start = rng.randrange(len(copy_snippet) - 4)
+                del copy_snippet[start:start + rng.randrange(1, 4)]
+            if rng.random() < 0.3:
+                copy_snippet += ['reporting', 'by', rng.choice(OUTLETS)]
+            if rng.random() < 0.3:
+                copy_snippet[rng.randrange(len(copy_snippet))] = rng.choice(vocabulary)
+            feed.append((story, MediaData({
+                'url': f'https://news{rng.randrange(1000)}.example.com/{story}/{len(feed)}',
+                'title': ' '.join(copy_title),
+                'snippet': ' '.join(copy_snippet),
+                'date': date + datetime.timedelta(days=rng.randrange(4)),
+            })))
+        story += 1
+    rng.shuffle(feed)
+    return feed
+
+
+def quality(feed: List[Tuple[int, MediaData]], found: List[int]) -> Tuple[int, int, int, int]:
+    members = defaultdict(set)
+    found_for = defaultdict(set)
+    for (story, _), found_story in zip(feed, found):
+        members[found_story].add(story)
+        found_for[story].add(found_story)
+    merged = sum(len(stories) > 1 for stories in members.values())
+    split = sum(len(stories) > 1 for stories in found_for.values())
+    return len(found_for), len(members), merged, split
+
+
+def baseline(feed: List[Tuple[int, MediaData]]) -> List[int]:
+    # Every article against the first article of every story found so far
+    shingle_sets, found, firsts = [], [], []
+    for _, article in feed:
+        tokens = _tokens(article)
+        shingles = {' '.join(tokens[i:i + SHINGLE_WORDS]) for i in range(max(1, len(tokens) - SHINGLE_WORDS + 1))}
+        for story, first in enumerate(firsts):
+            if len(shingles & first) / len(shingles | first) >= SIMILARITY:
+                found.append(story)
+                break
+        else:
+            found.append(len(firsts))
+            firsts.append(shingles)
+        shingle_sets.append(shingles)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--articles', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--max-copies', type=int, default=200)
+    parser.add_argument('--baseline', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'articles':>9} {'method':>9} {'us/article':>11} {'stories':>8} {'found':>8} {'merged':>7} {'split':>6}")
+    for articles in args.articles:
+        feed = synthetic_feed(articles, args.max_copies, args.seed)
+
+        start = time.perf_counter()
+        collapser = MediaCollapser()
+        found = [collapser.add(article) for _, article in feed]
+        elapsed = time.perf_counter() - start
+        stories, found_stories, merged, split = quality(feed, found)
+        print(f'{articles:9} {"minhash":>9} {elapsed / articles * 1e6:11.1f} {stories:8} {found_stories:8} '
+              f'{merged:7} {split:6}')
+
+        if args.baseline and articles <= 5000:
+            start = time.perf_counter()
+            found = baseline(feed)
+            elapsed = time.perf_counter() - start
+            stories, found_stories, merged, split = quality(feed, found)
+            print(f'{articles:9} {"pairwise":>9} {elapsed / articles * 1e6:11.1f} {stories:8} {found_stories:8} '
+                  f'{merged:7} {split:6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Registering monitored entities and re-screening them against a list delta.
+
+    python -m benchmarks.monitoring_rescreen --entities 1000000 --delta 1000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app.api import ScreeningQuery
+from app.monitoring import MonitoringRegistry
+from benchmarks import synthetic_name
+from benchmarks.watchlist_updates import synthetic_delta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--entities', type=int, default=1000000)
+    parser.add_argument('--delta', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=10000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'monitoring.db')
+        registry = MonitoringRegistry(path)
+
+        started = time.perf_counter()
+        for start in range(0, args.entities, args.batch):
+            registry.register_many(
+                (f'check-{i}', 'INDIVIDUAL', 'provider', ScreeningQuery({'name': synthetic_name(rng)}))
+                for i in range(start, min(start + args.batch, args.entities))
+            )
+        elapsed = time.perf_counter() - started
+        print(f'register: {args.entities} entities in {elapsed:.1f}s '
+              f'({args.entities / elapsed:.0f}/s), {os.path.getsize(path) / 2 ** 20:.0f} MiB')
+
+        changes = list(synthetic_delta(args.delta, args.entities, rng))
+        changed = [entry for _, _, entry in changes if entry is not None]
+
+        started = time.perf_counter()
+        affected = registry.affected_entities(changed)
+        print(f'inverted index lookup: {len(changed)} changed entries -> {len(affected)} candidate entities '
+              f'in {(time.perf_counter() - started) * 1000:.0f}ms')
+
+        started = time.perf_counter()
+        new_hits = registry.rescreen(changes)
+        print(f'rescreen: {sum(len(h) for h in new_hits.values())} new hits for {len(new_hits)} entities '
+              f'in {time.perf_counter() - started:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
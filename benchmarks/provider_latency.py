@@ -0,0 +1,86 @@
+"""
+Latency of provider calls against a stub provider with a long tail, with and without hedging and deadlines.
+
+    python -m benchmarks.provider_latency --calls 2000 --clients 4
+
+The stub answers most calls in about `--fast` seconds and a share `--tail`
+of them in `--slow` seconds. Scenarios:
+
+- plain: no hedging, no deadline
+- hedged: hedged after the p95 of recent response times
+- deadline: no hedging, each call with a `--deadline`
+"""
+
+import argparse
+import random
+import threading
+import time
+
+import benchmarks  # noqa: F401 (app.startup needs a key)
+from app import deadlines
+from app.provider import CircuitBreaker, ProviderClient, ProviderUnavailable
+from benchmarks import percentiles
+from tests.provider_stub import StubProvider
+
+
+def run(client: ProviderClient, calls: int, clients: int, deadline: float = None):
+    timings = []
+    errors = []
+
+    def worker(n):
+        for _ in range(n):
+            start = time.perf_counter()
+            try:
+                with deadlines.within(deadline):
+                    client.post('/search', {'name': 'John Smith'}, idempotent=True)
+            except ProviderUnavailable as e:
+                errors.append(e)
+            timings.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(calls // clients,)) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--fast', type=float, default=0.005)
+    parser.add_argument('--slow', type=float, default=0.25)
+    parser.add_argument('--tail', type=float, default=0.03)
+    parser.add_argument('--deadline', type=float, default=0.05)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+
+    def latency():
+        if rng.random() < args.tail:
+            return args.slow
+        return rng.uniform(0.5, 1.5) * args.fast
+
+    scenarios = [
+        ('plain', {}, None),
+        ('hedged', {'hedge': True}, None),
+        ('deadline', {}, args.deadline),
+    ]
+    with StubProvider(latency=latency) as stub:
+        for name, options, deadline in scenarios:
+            # Never opens: this measures latency, not failure handling
+            breaker = CircuitBreaker(slow_call=None, failure_ratio=2)
+            client = ProviderClient('stub', stub.url, max_concurrency=2 * args.clients, breaker=breaker, **options)
+            run(client, 200, args.clients)  # warm up, and collect response times for the hedging delay
+
+            sent = len(stub.requests)
+            timings, errors = run(client, args.calls, args.clients, deadline)
+            attempts = (len(stub.requests) - sent) / len(timings)
+            p50, p95, p99 = percentiles(timings, 50, 95, 99)
+            print(f'{name:9} p50={p50 * 1000:6.1f}ms p95={p95 * 1000:6.1f}ms p99={p99 * 1000:6.1f}ms '
+                  f'max={max(timings) * 1000:6.1f}ms attempts/call={attempts:.3f} errors={len(errors)}')
+
+
+if __name__ == '__main__':
+    main()
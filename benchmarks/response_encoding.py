@@ -0,0 +1,96 @@
+"""
+Size and encode/decode time of large poll results as JSON and MessagePack.
+
+    python -m benchmarks.response_encoding --hits 1000 5000
+
+A synthetic `PollCheckResponse` with many screening hits is serialised once
+through the models (as `validate_models` does for both encodings), then:
+
+- json: encoded the way `jsonify` does, decoded with `json.loads`
+- msgpack: `msgpack.packb` / `msgpack.unpackb`
+- transcode: a precomputed JSON body re-encoded as MessagePack, as for
+  cached screening results and demo results
+"""
+
+import argparse
+import json
+import random
+import time
+
+import msgpack
+
+import benchmarks  # noqa: F401 (app.startup needs a key)
+from app.api import PollCheckResponse
+from benchmarks import synthetic_name
+
+
+def synthetic_response(hits: int, seed: int = 0) -> PollCheckResponse:
+    rng = random.Random(seed)
+    return PollCheckResponse({
+        'provider_id': '6e15bc41-17a1-4568-8549-b5f828b13060',
+        'reference': 'bulk',
+        'custom_data': {'counter': 0},
+        'provider_data': 'Synthetic',
+        'check_output': {
+            'entity_type': 'INDIVIDUAL',
+            'screening_hits': [{
+                'provider': {'hit_id': str(i), 'label': 'synthetic'},
+                'status': 'UNRESOLVED',
+                'flags': [{'type': rng.choice(['PEP', 'SANCTION', 'ADVERSE_MEDIA'])}],
+                'data': {
+                    'name': synthetic_name(rng),
+                    'aliases': [synthetic_name(rng) for _ in range(rng.randrange(4))],
+                    'confidence_score': round(rng.random(), 4),
+                    'countries': [{'type': 'NATIONALITY', 'country_code': rng.choice(['GBR', 'USA', 'FRA'])}],
+                    'dates': [{'type': 'DOB', 'date': f'19{rng.randrange(40, 99)}-0{rng.randrange(1, 9)}-1{i % 9}'}],
+                    'sanctions': [{'name': 'On List [OFAC]', 'type': 'Watch List / Sanction'}],
+                    'media': [{
+                        'url': f'https://news.example.com/{i}/{j}',
+                        'title': f'{synthetic_name(rng)} named in inquiry',
+                        'snippet': ' '.join(synthetic_name(rng) for _ in range(12)),
+                        'date': '2020-01-01',
+                    } for j in range(rng.randrange(3))],
+                },
+            } for i in range(hits)],
+        },
+    })
+
+
+def timed(fn, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--hits', type=int, nargs='+', default=[1000, 5000])
+    args = parser.parse_args()
+
+    for hits in args.hits:
+        response = synthetic_response(hits)
+        serialize_time = timed(response.serialize, 1)
+        data = response.serialize()
+        print(f'{hits} hits, serialised from the models in {serialize_time * 1000:.1f}ms')
+
+        as_json = json.dumps(data, separators=(',', ':'), sort_keys=True).encode()
+        rows = [('json', len(as_json),
+                 timed(lambda: json.dumps(data, separators=(',', ':'), sort_keys=True).encode()),
+                 timed(lambda: json.loads(as_json)))]
+        as_msgpack = msgpack.packb(data)
+        assert msgpack.unpackb(as_msgpack) == json.loads(as_json)
+        rows.append(('msgpack', len(as_msgpack), timed(lambda: msgpack.packb(data)),
+                     timed(lambda: msgpack.unpackb(as_msgpack))))
+        rows.append(('transcode', len(as_msgpack), timed(lambda: msgpack.packb(json.loads(as_json))),
+                     timed(lambda: msgpack.unpackb(as_msgpack))))
+
+        for name, size, encode_time, decode_time in rows:
+            print(f'  {name:10} {size / 1024:9.1f}KiB  encode {encode_time * 1000:7.2f}ms  '
+                  f'decode {decode_time * 1000:7.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Per-request cost of serving a precomputed payload, against a memcpy of it.
+
+    python -m benchmarks.response_path --size 1048576
+
+Each path runs through Flask with the app's logging hooks at INFO (to a null
+handler), and the WSGI body is consumed the way gunicorn does: bytes chunks
+are written out (here: only counted), files go to sendfile(2) (here: not
+read at all, as the kernel does the copy).
+
+- buffered: a `json_response` of bytes copied out of the store, as before
+- passthrough: `passthrough_response` of cached bytes
+- file: `file_response` of a value in a shared store
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from flask import Flask
+
+import benchmarks  # noqa: F401 (app.startup needs a key)
+from app.api import file_response, json_response, passthrough_response
+from app.application import logger, post_request_logging
+from app.shared_store import SharedStore, build_store
+
+
+class SendfileWrapper:
+    """ Like gunicorn's `wsgi.file_wrapper`: the server sends the file without reading it. """
+
+    def __init__(self, file, block_size=8192):
+        self.file = file
+
+    def close(self):
+        self.file.close()
+
+
+def make_app(store: SharedStore, cached: bytes) -> Flask:
+    app = Flask(__name__)
+    app.after_request(post_request_logging)
+
+    @app.route('/buffered')
+    def buffered():
+        return json_response(store.get('payload').tobytes())
+
+    @app.route('/passthrough')
+    def passthrough():
+        return passthrough_response(cached)
+
+    @app.route('/file')
+    def file():
+        value = store.open('payload')
+        return file_response(value, value.length)
+
+    return app
+
+
+def serve(app: Flask, environ: dict) -> int:
+    sent = 0
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    body = app(dict(environ), start_response)
+    if isinstance(body, SendfileWrapper):
+        sent = body.file.length
+    else:
+        for chunk in body:
+            sent += len(chunk)
+    if hasattr(body, 'close'):
+        body.close()
+    return sent
+
+
+def timed(fn, iterations: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=2 ** 20)
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    logger.handlers = [logging.NullHandler()]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    # A JSON document of about `size` bytes
+    payload = b'{"data":"' + b'x' * max(0, args.size - 11) + b'"}\n'
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'payloads.store')
+        build_store([('payload', payload)], path)
+        store = SharedStore(path)
+        app = make_app(store, payload)
+
+        buffer = bytearray(len(payload))
+
+        def memcpy():
+            buffer[:] = payload
+
+        memcpy_time = timed(memcpy, args.iterations)
+        print(f'{"memcpy":12} {memcpy_time * 1e6:9.1f}us')
+
+        for name in ('buffered', 'passthrough', 'file'):
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': f'/{name}', 'SERVER_NAME': 'localhost',
+                'SERVER_PORT': '80', 'wsgi.url_scheme': 'http', 'wsgi.file_wrapper': SendfileWrapper,
+                'wsgi.input': None, 'wsgi.errors': None,
+            }
+            assert serve(app, environ) == len(payload)
+            elapsed = timed(lambda: serve(app, environ), args.iterations)
+            print(f'{name:12} {elapsed * 1e6:9.1f}us  {elapsed / memcpy_time:6.1f}x memcpy')
+
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
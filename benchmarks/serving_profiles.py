@@ -0,0 +1,140 @@
+"""
+Throughput and latency of the serving profiles (see `app.serving`) on the check lifecycle.
+
+    python -m benchmarks.serving_profiles --clients 16 --seconds 10
+
+Each profile is started as a real gunicorn server on a local port. Clients
+loop over the lifecycle endpoints (config, start and poll of a demo check)
+on keep-alive connections. Clients run on the same machine, so compare
+profiles with each other rather than with production numbers.
+"""
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import requests
+from requests_http_signature import HTTPSignatureAuth
+
+from benchmarks import percentiles
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_listening(server: subprocess.Popen, port: int, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {server.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'gunicorn did not start listening on port {port}')
+
+
+def start_server(profile: str, port: int, workers: int = None) -> subprocess.Popen:
+    env = dict(os.environ, SERVING_PROFILE=profile, PORT=str(port), LOGLEVEL='WARNING')
+    if workers:
+        env['WEB_CONCURRENCY'] = str(workers)
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'main:app'],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_until_listening(server, port)
+    except RuntimeError:
+        server.kill()
+        raise
+    return server
+
+
+def lifecycle(session: requests.Session, base_url: str, auth) -> None:
+    r = session.get(f'{base_url}/individual/config', auth=auth())
+    r.raise_for_status()
+
+    check_id = str(uuid.uuid4())
+    r = session.post(f'{base_url}/individual/checks', auth=auth(), json={
+        'id': check_id, 'demo_result': 'ALL_DATA', 'check_input': {'entity_type': 'INDIVIDUAL'},
+        'commercial_relationship': 'DIRECT', 'provider_config': {},
+    })
+    r.raise_for_status()
+    start = r.json()
+
+    r = session.post(f'{base_url}/individual/checks/{check_id}/poll', auth=auth(), json={
+        'id': check_id, 'provider_id': start['provider_id'], 'reference': start['reference'],
+        'demo_result': 'ALL_DATA', 'commercial_relationship': 'DIRECT', 'provider_config': {},
+        'custom_data': {'counter': 0},
+    })
+    r.raise_for_status()
+
+
+def measure(base_url: str, clients: int, seconds: float):
+    from app.startup import integration_key_id, integration_key_store
+
+    def auth():
+        return HTTPSignatureAuth(key=integration_key_store[integration_key_id], key_id=integration_key_id,
+                                 headers=['(request-target)', 'date'])
+
+    timings = []
+    errors = []
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        with requests.Session() as session:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    lifecycle(session, base_url, auth)
+                except requests.RequestException as e:
+                    errors.append(e)
+                    continue
+                timings.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--profiles', nargs='+', default=['sync', 'gthread', 'async'])
+    parser.add_argument('--workers', type=int, help='override the workers computed by each profile')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    for profile in args.profiles:
+        port = _free_port()
+        try:
+            server = start_server(profile, port, args.workers)
+        except RuntimeError as e:
+            print(f'{profile:8} skipped: {e}')
+            continue
+        try:
+            base_url = f'http://127.0.0.1:{port}'
+            measure(base_url, 1, 1)  # warm up every endpoint
+            timings, errors = measure(base_url, args.clients, args.seconds)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+
+        p50, p99 = percentiles(timings, 50, 99) if timings else (0, 0)
+        print(f'{profile:8} {len(timings) / args.seconds:8.1f} lifecycles/s '
+              f'p50={p50 * 1000:.1f}ms p99={p99 * 1000:.1f}ms errors={len(errors)}')
+
+
+if __name__ == '__main__':
+    main()
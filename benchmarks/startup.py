@@ -0,0 +1,96 @@
+"""
+Cold start of a worker: import time, and time to the first request served.
+
+    python -m benchmarks.startup --runs 10
+
+Each run is a fresh interpreter. "first request" is a signed demo poll in the
+process that imported the app; "first request after fork" is the same request
+in a child forked after the import, which is what gunicorn workers see with
+`--preload`. `--importtime` lists the slowest imports (`python -X importtime`).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+import benchmarks  # noqa: F401 (sets a throwaway INTEGRATION_SECRET_KEY for the children)
+
+_RUN = r'''
+import json, os, sys, time, uuid
+
+start = time.perf_counter()
+import main
+imported = time.perf_counter() - start
+
+# The client side of the request isn't part of the worker's cold start
+from requests import Request
+from requests_http_signature import HTTPSignatureAuth
+from app.startup import integration_key_id, integration_key_store
+
+def first_request():
+    check_id = str(uuid.uuid4())
+    url = f'http://app/individual/checks/{check_id}/poll'
+    body = {
+        'id': check_id, 'provider_id': str(uuid.uuid4()), 'reference': 'ref', 'demo_result': 'ALL_DATA',
+        'commercial_relationship': 'DIRECT', 'provider_config': {}, 'custom_data': {'counter': 0},
+    }
+    signed = Request('POST', url, json=body, auth=HTTPSignatureAuth(
+        key=integration_key_store[integration_key_id], key_id=integration_key_id,
+        headers=['(request-target)', 'date'],
+    )).prepare()
+
+    start = time.perf_counter()
+    r = main.app.test_client().post(f'/individual/checks/{check_id}/poll', data=signed.body, headers=dict(signed.headers))
+    assert r.status_code == 200, r.data
+    return time.perf_counter() - start
+
+read, write = os.pipe()
+pid = os.fork()
+if pid == 0:
+    os.write(write, json.dumps(first_request()).encode())
+    os._exit(0)
+os.waitpid(pid, 0)
+forked = json.loads(os.read(read, 1024))
+
+print(json.dumps({'import': imported, 'first_request': first_request(), 'first_request_after_fork': forked}))
+'''
+
+
+def run_once() -> dict:
+    output = subprocess.run([sys.executable, '-c', _RUN], check=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    return json.loads(output)
+
+
+def slowest_imports(count: int):
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                            check=True, stderr=subprocess.PIPE).stderr.decode()
+    timings = []
+    for line in stderr.splitlines()[1:]:
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace(':', '|', 1).split('|')]
+        timings.append((int(cumulative_us), int(self_us), name))
+    for cumulative_us, self_us, name in sorted(timings, reverse=True)[:count]:
+        print(f'  {cumulative_us / 1000:8.1f}ms cumulative {self_us / 1000:8.1f}ms self  {name}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--importtime', type=int, default=0, metavar='COUNT')
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    for name in ['import', 'first_request', 'first_request_after_fork']:
+        samples = [run[name] for run in runs]
+        print(f'{name + ":":26} median={statistics.median(samples) * 1000:.1f}ms max={max(samples) * 1000:.1f}ms')
+
+    if args.importtime:
+        print('slowest imports:')
+        slowest_imports(args.importtime)
+
+
+if __name__ == '__main__':
+    main()
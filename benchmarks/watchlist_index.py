@@ -0,0 +1,73 @@
+"""
+Build and query benchmark for the watchlist index.
+
+    python -m benchmarks.watchlist_index --entries 300000 --queries 2000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from app.watchlist import WatchlistIndex, build_index
+from benchmarks import percentiles, synthetic_name
+
+
+def synthetic_entries(count: int, rng: random.Random):
+    for i in range(count):
+        entity_type = 'COMPANY' if rng.random() < 0.3 else 'INDIVIDUAL'
+        yield {
+            'id': str(i),
+            'name': synthetic_name(rng, entity_type),
+            'aliases': [synthetic_name(rng, entity_type) for _ in range(rng.randrange(3))],
+            'entity_type': entity_type,
+            'type': 'PEP' if rng.random() < 0.2 else 'SANCTION',
+            'list': 'Synthetic List',
+            'countries': ['GBR'],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--entries', type=int, default=300000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'watchlist.idx')
+
+        started = time.perf_counter()
+        build_index(synthetic_entries(args.entries, random.Random(args.seed)), path)
+        build_time = time.perf_counter() - started
+        print(f'build: {args.entries} entries in {build_time:.2f}s, '
+              f'{os.path.getsize(path) / 2 ** 20:.1f} MiB on disk')
+
+        started = time.perf_counter()
+        index = WatchlistIndex(path)
+        print(f'open: {(time.perf_counter() - started) * 1000:.2f}ms')
+
+        # Half the queries are names known to be on the list, half are random
+        rng = random.Random(args.seed + 1)
+        known = list(synthetic_entries(args.entries, random.Random(args.seed)))
+        queries = [
+            rng.choice(known)['name'] if i % 2 else synthetic_name(rng, 'INDIVIDUAL')
+            for i in range(args.queries)
+        ]
+
+        timings = []
+        hits = 0
+        for query in queries:
+            started = time.perf_counter()
+            hits += len(index.search(query))
+            timings.append(time.perf_counter() - started)
+
+        p50, p95, p99 = percentiles(timings, 50, 95, 99)
+        print(f'query: {args.queries} queries, {hits} matches, '
+              f'p50={p50 * 1000:.3f}ms p95={p95 * 1000:.3f}ms p99={p99 * 1000:.3f}ms')
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
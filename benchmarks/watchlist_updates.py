@@ -0,0 +1,84 @@
+"""
+Full rebuild vs incremental delta, and generation swap latency, for the watchlist store.
+
+    python -m benchmarks.watchlist_updates --entries 300000 --delta 3000
+"""
+
+import argparse
+import random
+import tempfile
+import threading
+import time
+
+from app.watchlist_store import OP_ADD, OP_MODIFY, OP_REMOVE, WatchlistStore
+from benchmarks import percentiles, synthetic_name
+from benchmarks.watchlist_index import synthetic_entries
+
+
+def synthetic_delta(size: int, entries: int, rng: random.Random):
+    for i in range(size):
+        op = rng.choice([OP_ADD, OP_MODIFY, OP_REMOVE])
+        entry_id = str(entries + i) if op == OP_ADD else str(rng.randrange(entries))
+        entry = None if op == OP_REMOVE else {
+            'id': entry_id, 'name': synthetic_name(rng), 'type': 'SANCTION', 'entity_type': 'INDIVIDUAL',
+        }
+        yield op, entry_id, entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--entries', type=int, default=300000)
+    parser.add_argument('--delta', type=int, default=3000)
+    parser.add_argument('--deltas', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        writer = WatchlistStore(directory)
+        started = time.perf_counter()
+        writer.rebuild(synthetic_entries(args.entries, random.Random(0)))
+        print(f'full rebuild: {args.entries} entries in {time.perf_counter() - started:.2f}s')
+
+        reader = WatchlistStore(directory, reload_interval=0)
+        reader.current()
+
+        # Search continuously while deltas are applied, to show reads never wait for writers
+        stop = threading.Event()
+        query_timings = []
+
+        def search_loop():
+            query_rng = random.Random(1)
+            while not stop.is_set():
+                started = time.perf_counter()
+                reader.search(synthetic_name(query_rng))
+                query_timings.append(time.perf_counter() - started)
+
+        searcher = threading.Thread(target=search_loop)
+        searcher.start()
+
+        for i in range(args.deltas):
+            started = time.perf_counter()
+            generation = writer.apply_delta(synthetic_delta(args.delta, args.entries, rng))
+            applied = time.perf_counter() - started
+
+            # Swap latency: from publishing the manifest until readers search the new generation
+            started = time.perf_counter()
+            while reader.current().generation != generation:
+                pass
+            swapped = time.perf_counter() - started
+            print(f'delta {i + 1}: {args.delta} changes applied in {applied * 1000:.1f}ms, '
+                  f'generation {generation} swapped in {swapped * 1000:.2f}ms')
+
+        started = time.perf_counter()
+        writer.merge()
+        print(f'merge: {time.perf_counter() - started:.2f}s')
+
+        stop.set()
+        searcher.join()
+        p50, p99, p100 = percentiles(query_timings, 50, 99, 100)
+        print(f'concurrent searches: {len(query_timings)}, '
+              f'p50={p50 * 1000:.3f}ms p99={p99 * 1000:.3f}ms max={p100 * 1000:.3f}ms')
+
+
+if __name__ == '__main__':
+    main()
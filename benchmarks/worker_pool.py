@@ -0,0 +1,91 @@
+"""
+Latency of light searches while heavy searches run, inline on threads vs in the worker pool.
+
+    python -m benchmarks.worker_pool --entries 200000 --heavy-threads 4
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from app.watchlist import WatchlistIndex, build_index
+from app.workers import WorkerPool
+from benchmarks import percentiles, synthetic_name
+from benchmarks.watchlist_index import synthetic_entries
+
+_indexes = {}
+
+
+def heavy_search(path: str, seconds: float) -> int:
+    # A low threshold makes every search scan and score most of the postings
+    index = _indexes.setdefault(path, WatchlistIndex(path))
+    rng = random.Random()
+    matches = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        matches += len(index.search(synthetic_name(rng), threshold=0.3, limit=1000))
+    return matches
+
+
+def measure(index: WatchlistIndex, path: str, heavy_threads: int, pool: WorkerPool = None, seconds: float = 3.0):
+    stop = threading.Event()
+
+    def heavy_loop():
+        while not stop.is_set():
+            if pool is None:
+                heavy_search(path, 0.5)
+            else:
+                pool.run(10, heavy_search, path, 0.5)
+
+    threads = [threading.Thread(target=heavy_loop) for _ in range(heavy_threads)]
+    for thread in threads:
+        thread.start()
+
+    # Light requests arrive every 5ms; latency is measured from arrival, so it
+    # includes waiting for the GIL held by heavy work on other threads
+    rng = random.Random(0)
+    timings = []
+    arrival = time.perf_counter()
+    deadline = arrival + seconds
+    while arrival < deadline:
+        arrival += 0.005
+        time.sleep(max(0.0, arrival - time.perf_counter()))
+        index.search(synthetic_name(rng))
+        timings.append(time.perf_counter() - arrival)
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return percentiles(timings, 50, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--entries', type=int, default=200000)
+    parser.add_argument('--heavy-threads', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'watchlist.idx')
+        build_index(synthetic_entries(args.entries, random.Random(0)), path)
+        index = WatchlistIndex(path)
+
+        p50, p99 = measure(index, path, 0)
+        print(f'idle:           light p50={p50 * 1000:.2f}ms p99={p99 * 1000:.2f}ms')
+
+        p50, p99 = measure(index, path, args.heavy_threads)
+        print(f'heavy inline:   light p50={p50 * 1000:.2f}ms p99={p99 * 1000:.2f}ms')
+
+        pool = WorkerPool(args.processes, max_queued=args.heavy_threads)
+        pool.run(10, heavy_search, path, 0)
+        p50, p99 = measure(index, path, args.heavy_threads, pool)
+        print(f'heavy in pool:  light p50={p50 * 1000:.2f}ms p99={p99 * 1000:.2f}ms')
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
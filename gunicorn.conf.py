@@ -0,0 +1,11 @@
+# gunicorn configuration; settings and hooks are documented in `app/serving.py`
+
+from app import serving
+
+globals().update(serving.settings())
+# Before the app is preloaded, which opens the hit log
+serving.share_hit_log(workers)  # noqa: F821 (set just above)
+
+pre_fork = serving.pre_fork
+post_fork = serving.post_fork
+post_request = serving.post_request
@@ -1,6 +1,7 @@
 import logging
 import sys
 import warnings
+from uuid import uuid4
 
 import pytest
 
@@ -12,6 +13,26 @@ import tests.startup
 
 sys.modules['app.startup'] = tests.startup
 
+pytest_plugins = ['tests.perf_budget']
+
+# What real (not demo) checks are started with, unless a test says otherwise
+CHECK_INPUT = {
+    'INDIVIDUAL': {
+        'entity_type': 'INDIVIDUAL',
+        'personal_details': {'name': {'given_names': ['John'], 'family_name': 'Smith'}},
+    },
+    'COMPANY': {
+        'entity_type': 'COMPANY',
+        'metadata': {'name': 'Acme Trading LLC'},
+    },
+}
+
+LIST_CSV = '''id,name,aliases,entity_type,type,list,issued_by,countries,dob,pep_role,pep_tier
+1,John Smith,Johnny Smith;J. Smith,INDIVIDUAL,SANCTION,UK HM Treasury,UK,GBR,1970-01-01,,
+2,Vladimír Ivanov,,INDIVIDUAL,PEP,,,RUS,,Minister of Finance,1
+3,Acme Trading LLC,Acme Trading,COMPANY,SANCTION,OFAC SDN,US,USA;IRN,,,
+'''
+
 
 @pytest.fixture
 def session():
@@ -32,3 +53,86 @@ def auth():
         key_id='dummykey',
         headers=['(request-target)', 'date'] if headers is None else headers
     )
+
+
+@pytest.fixture
+def start_body():
+    """ The body of a start request; keyword arguments replace its fields. """
+    def body(check_id=None, entity_type='INDIVIDUAL', **fields):
+        return {
+            'id': str(check_id or uuid4()),
+            'check_input': CHECK_INPUT[entity_type],
+            'commercial_relationship': 'DIRECT',
+            'provider_config': {},
+            **fields,
+        }
+    return body
+
+
+@pytest.fixture
+def poll_body():
+    """ The body of a poll request; keyword arguments replace its fields. """
+    from app.company import PROVIDER_ID as COMPANY_PROVIDER_ID
+    from app.individual import PROVIDER_ID as INDIVIDUAL_PROVIDER_ID
+
+    provider_ids = {'INDIVIDUAL': INDIVIDUAL_PROVIDER_ID, 'COMPANY': COMPANY_PROVIDER_ID}
+
+    def body(check_id=None, custom_data=None, entity_type='INDIVIDUAL', **fields):
+        check_id = str(check_id or uuid4())
+        return {
+            'id': check_id,
+            'provider_id': provider_ids[entity_type],
+            'reference': check_id,
+            'commercial_relationship': 'DIRECT',
+            'provider_config': {},
+            'custom_data': {'counter': 0} if custom_data is None else custom_data,
+            **fields,
+        }
+    return body
+
+
+@pytest.fixture
+def start_check(session, auth, start_body):
+    """ Sends a signed start request and returns the response. """
+    def start(check_id=None, entity_type='INDIVIDUAL', headers=None, **fields):
+        return session.post(f'http://app/{entity_type.lower()}/checks',
+                            json=start_body(check_id, entity_type, **fields), headers=headers, auth=auth())
+    return start
+
+
+@pytest.fixture
+def poll_check(session, auth, poll_body):
+    """ Sends a signed poll request and returns the response. """
+    def poll(check_id=None, custom_data=None, entity_type='INDIVIDUAL', headers=None, **fields):
+        check_id = check_id or uuid4()
+        return session.post(f'http://app/{entity_type.lower()}/checks/{check_id}/poll',
+                            json=poll_body(check_id, custom_data, entity_type, **fields), headers=headers,
+                            auth=auth())
+    return poll
+
+
+@pytest.fixture
+def screen(start_check, poll_check):
+    """ Starts a real check and polls it once, returning the poll's JSON. """
+    def screen(check_id=None, headers=None, **fields):
+        check_id = check_id or uuid4()
+        custom_data = start_check(check_id, **fields).json()['custom_data']
+        r = poll_check(check_id, custom_data, headers=headers, **fields)
+        assert r.status_code == 200
+        return r.json()
+    return screen
+
+
+@pytest.fixture
+def watchlist_index(tmp_path, monkeypatch):
+    from app.watchlist import WatchlistIndex, build_index, load_entries
+
+    source = tmp_path / 'list.csv'
+    source.write_text(LIST_CSV)
+    path = str(tmp_path / 'list.idx')
+    build_index(load_entries(str(source)), path)
+
+    index = WatchlistIndex(path)
+    monkeypatch.setattr('app.screening._index', index)
+    yield index
+    index.close()
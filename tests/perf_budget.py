@@ -0,0 +1,217 @@
+"""
+Performance budgets for the check endpoints.
+
+Tests marked `perf` run a signed request many times through the app and
+compare, per scenario, the median latency and the peak memory allocated while
+serving one request (through `tracemalloc`) with the baseline checked in at
+`tests/perf_baseline.json`. A scenario fails when either is over its baseline
+by more than the file's tolerance and slack.
+
+The speed of the machine drifts between runs (CPU frequency, other tenants)
+by more than the regressions worth catching, so every request is followed by
+a fixed pure-Python workload, and latencies are compared relative to it: on a
+machine running 30% slow, both take 30% longer.
+
+    python -m pytest tests/test_perf_budget.py --perf
+    python -m pytest tests/test_perf_budget.py --perf-update
+
+run the budgets, and measure them again and write the results to the baseline.
+Latencies depend on the machine, so baselines should be updated on the machine
+that checks them. Without either option the budgets are skipped.
+"""
+
+import gc
+import json
+import os
+import statistics
+import time
+import tracemalloc
+import warnings
+from typing import Callable, Dict, List, Tuple
+
+import pytest
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'perf_baseline.json')
+
+# Over the baseline by more than `tolerance` (relative) and `slack` (absolute)
+# fails, once latencies are scaled to the speed of the machine the baseline
+# was measured at (see `at_speed_of`)
+DEFAULT_TOLERANCE = {'p50_ms': 0.25, 'peak_kib': 0.1}
+DEFAULT_SLACK = {'p50_ms': 0.1, 'peak_kib': 0.0}
+
+# Makes a signed request (not timed) and returns a call that sends it
+Prepare = Callable[[], Callable[[], object]]
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('perf', 'performance budgets')
+    group.addoption('--perf', action='store_true', help='check the performance budgets of tests marked perf')
+    group.addoption('--perf-update', action='store_true', help='write the measured budgets to the baseline')
+    group.addoption('--perf-iterations', type=int, default=250, help='timed requests per scenario')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'perf: checks a performance budget (run with --perf or --perf-update)')
+    config._perf_results = {}
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--perf') or config.getoption('--perf-update'):
+        return
+    skip = pytest.mark.skip(reason='performance budgets run with --perf')
+    for item in items:
+        if 'perf' in item.keywords:
+            item.add_marker(skip)
+
+
+def load_baseline(path: str = BASELINE_PATH) -> dict:
+    if not os.path.exists(path):
+        return {'tolerance': dict(DEFAULT_TOLERANCE), 'slack': dict(DEFAULT_SLACK), 'budgets': {}}
+    with open(path) as file:
+        return json.load(file)
+
+
+_REFERENCE_DATA = {'hits': [{'name': f'John Smith {i}', 'countries': ['GBR', 'USA'], 'score': i / 7}
+                            for i in range(40)]}
+
+
+def _reference():
+    # Stands for the machine's speed at the time: a fixed amount of the kind
+    # of work a request does
+    json.loads(json.dumps(_REFERENCE_DATA))
+    sorted(str(i) for i in range(300))
+
+
+def measure(prepare: Prepare, iterations: int, rounds: int = 5, warmup: int = 20,
+            traced: int = 10) -> Dict[str, float]:
+    """
+    The median latency (ms) of a request, the median time (ms) of the
+    reference workload run after each request, and the median peak memory
+    allocated (KiB) by a request. Requests are timed in `rounds`, and the round
+    where they were fastest relative to the reference is kept, so that a busy
+    moment on the machine doesn't fail the budget.
+    """
+    # Warnings are ignored rather than recorded by pytest, which would count
+    # their records (hundreds of thousands of deprecation warnings from
+    # schematics) in the time and memory of the requests
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return _measure(prepare, iterations, rounds, warmup, traced)
+
+
+def _measure(prepare: Prepare, iterations: int, rounds: int, warmup: int, traced: int) -> Dict[str, float]:
+    for _ in range(warmup):
+        prepare()()
+        _reference()
+
+    medians: List[Tuple[float, float]] = []
+    for _ in range(rounds):
+        gc.collect()
+        times: List[float] = []
+        references: List[float] = []
+        for _ in range(max(1, iterations // rounds)):
+            send = prepare()
+            start = time.perf_counter()
+            send()
+            times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            _reference()
+            references.append(time.perf_counter() - start)
+        medians.append((statistics.median(times), statistics.median(references)))
+    p50, reference = min(medians, key=lambda median: median[0] / median[1])
+
+    # Traced separately: tracing allocations slows everything down
+    peaks: List[int] = []
+    for _ in range(traced):
+        send = prepare()
+        tracemalloc.start()
+        try:
+            send()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'p50_ms': round(p50 * 1000, 3),
+        'reference_ms': round(reference * 1000, 4),
+        'peak_kib': round(statistics.median(peaks) / 1024, 1),
+    }
+
+
+def at_speed_of(measured: Dict[str, float], budget: Dict[str, float]) -> Dict[str, float]:
+    """ `measured`, with its latency scaled to the machine speed `budget` was measured at. """
+    if 'reference_ms' not in measured or 'reference_ms' not in budget:
+        return measured
+    scale = budget['reference_ms'] / measured['reference_ms']
+    return {**measured, 'p50_ms': round(measured['p50_ms'] * scale, 3), 'reference_ms': budget['reference_ms']}
+
+
+def over_budget(measured: Dict[str, float], budget: Dict[str, float], tolerance: Dict[str, float],
+                slack: Dict[str, float]) -> List[str]:
+    return [
+        f'{metric} {measured[metric]} > {limit} (+{tolerance[metric]:.0%} +{slack[metric]})'
+        for metric, limit in budget.items()
+        if metric in tolerance and metric in measured
+        and measured[metric] > limit * (1 + tolerance[metric]) + slack[metric]
+    ]
+
+
+class PerfBudget:
+    def __init__(self, config):
+        self.config = config
+        self.baseline = load_baseline()
+
+    def check(self, name: str, prepare: Prepare):
+        """ Measures the scenario `name` and fails if it is over its budget (or records it, with --perf-update). """
+        iterations = self.config.getoption('--perf-iterations')
+        measured = measure(prepare, iterations)
+        self.config._perf_results[name] = measured
+        if self.config.getoption('--perf-update'):
+            return
+
+        budget = self.baseline['budgets'].get(name)
+        if budget is None:
+            pytest.fail(f'No baseline for {name}: run with --perf-update')
+        tolerance = {**DEFAULT_TOLERANCE, **self.baseline.get('tolerance', {})}
+        slack = {**DEFAULT_SLACK, **self.baseline.get('slack', {})}
+        measured = at_speed_of(measured, budget)
+        if over_budget(measured, budget, tolerance, slack):
+            # Measured again before failing: a regression is over budget both
+            # times, a slow spell on the machine seldom lasts that long
+            again = at_speed_of(measure(prepare, iterations), budget)
+            measured = {metric: min(value, again[metric]) for metric, value in measured.items()}
+        self.config._perf_results[name] = measured
+        failures = over_budget(measured, budget, tolerance, slack)
+        if failures:
+            pytest.fail(f'{name} over budget: ' + ', '.join(failures))
+
+
+@pytest.fixture
+def perf_budget(request) -> PerfBudget:
+    return PerfBudget(request.config)
+
+
+def pytest_sessionfinish(session):
+    config = session.config
+    if not config.getoption('--perf-update') or not config._perf_results:
+        return
+    baseline = load_baseline()
+    baseline['budgets'].update(config._perf_results)
+    baseline['budgets'] = dict(sorted(baseline['budgets'].items()))
+    with open(BASELINE_PATH, 'w') as file:
+        json.dump(baseline, file, indent=2)
+        file.write('\n')
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    if not config._perf_results:
+        return
+    budgets = load_baseline()['budgets']
+    terminalreporter.section('performance budgets')
+    terminalreporter.write_line(f"{'scenario':<32} {'p50 ms':>9} {'budget':>9} {'peak KiB':>9} {'budget':>9}")
+    for name, measured in sorted(config._perf_results.items()):
+        budget = budgets.get(name, {})
+        terminalreporter.write_line(
+            f"{name:<32} {measured['p50_ms']:9.3f} {budget.get('p50_ms', float('nan')):9.3f} "
+            f"{measured['peak_kib']:9.1f} {budget.get('peak_kib', float('nan')):9.1f}"
+        )
@@ -0,0 +1,85 @@
+"""
+A local stand-in for an upstream screening provider, with injectable latency and errors.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Union
+
+# A hit as the stub returns it
+HIT = {
+    'provider': {'hit_id': '1', 'label': 'stub'},
+    'status': 'UNRESOLVED',
+    'flags': [{'type': 'SANCTION'}],
+    'data': {'name': 'John Smith', 'aliases': [], 'countries': [], 'dates': []},
+}
+
+
+class StubProvider:
+    """
+    Serves `POST /search` on a local port, answering with `hits` after
+    `latency` seconds (or `latency()`), or with a 503 for a share
+    `error_rate` of the requests. All three can be changed while it runs.
+    With `page_size`, hits come `page_size` at a time, with a `next` page.
+    """
+
+    def __init__(self, hits: Optional[List[dict]] = None, latency: Union[float, Callable[[], float]] = 0,
+                 error_rate: float = 0, seed: int = 0, page_size: Optional[int] = None):
+        self.hits = hits or []
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests: List[dict] = []
+        self.headers: List[dict] = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with stub._lock:
+                    stub.requests.append(body)
+                    stub.headers.append(dict(self.headers))
+                    fail = stub._rng.random() < stub.error_rate
+                    latency = stub.latency() if callable(stub.latency) else stub.latency
+
+                time.sleep(latency)
+                status, data = (503, b'unavailable') if fail else (200, json.dumps(stub.page(body)).encode())
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up (timed out, or another attempt won)
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def page(self, body: dict) -> dict:
+        if self.page_size is None:
+            return {'hits': self.hits}
+        start = int(body.get('page') or 0)
+        end = start + self.page_size
+        page = {'hits': self.hits[start:end]}
+        if end < len(self.hits):
+            page['next'] = str(end)
+        return page
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
@@ -7,3 +7,35 @@ integration_key_store = {
 }
 integration_key_id = 'dummykey'
 passfort_base_url = 'http://localhost/'
+watchlist_index_path = None
+monitoring_db_path = None
+screening_processes = 0
+screening_timeout = 10
+admission_rate = 0
+admission_burst = 0
+admission_concurrency = 0
+admission_state_dir = None
+idempotency_cache_path = None
+idempotency_cache_size = 1000
+result_cache_ttl = 0
+result_cache_max_bytes = 2 ** 20
+result_cache_path = None
+shared_store_dir = None
+job_queue_path = None
+job_workers = 2
+job_max_attempts = 3
+provider_url = None
+provider_timeout = 2
+provider_max_concurrency = 4
+provider_failure_ratio = 0.5
+provider_slow_call = 1
+provider_slow_ratio = 0.5
+provider_open_seconds = 30
+provider_hedge = False
+provider_hedge_after = None
+request_timeout = 0
+hit_log_path = None
+capture_path = None
+capture_sample_rate = 1
+trace_export = None
+trace_sample_rate = 1
@@ -0,0 +1,91 @@
+import pytest
+
+from app.admission import (
+    ConcurrencySlots,
+    SharedConcurrencySlots,
+    SharedTokenBuckets,
+    TokenBuckets,
+    admission,
+)
+
+
+def test_token_buckets():
+    buckets = TokenBuckets(rate=1, burst=2)
+    assert buckets.acquire('a') is None
+    assert buckets.acquire('a') is None
+    assert 0 < buckets.acquire('a') <= 1
+
+    # Keys have their own buckets
+    assert buckets.acquire('b') is None
+
+
+def test_shared_token_buckets(tmp_path):
+    path = str(tmp_path / 'buckets.db')
+    worker_1 = SharedTokenBuckets(rate=0.01, burst=2, path=path)
+    worker_2 = SharedTokenBuckets(rate=0.01, burst=2, path=path)
+
+    assert worker_1.acquire('a') is None
+    assert worker_2.acquire('a') is None
+    assert worker_1.acquire('a') > 1
+
+
+@pytest.mark.parametrize('make_slots', [
+    lambda tmp_path: ConcurrencySlots(2),
+    lambda tmp_path: SharedConcurrencySlots(2, str(tmp_path)),
+])
+def test_concurrency_slots(tmp_path, make_slots):
+    slots = make_slots(tmp_path)
+    first = slots.acquire('poll')
+    second = slots.acquire('poll')
+    assert first is not None and second is not None
+    assert slots.acquire('poll') is None
+    assert slots.acquire('start') is not None
+
+    slots.release(first)
+    assert slots.acquire('poll') is not None
+
+
+def test_rate_limited_before_validation(session, auth, monkeypatch):
+    monkeypatch.setattr(admission, 'buckets', TokenBuckets(rate=0.01, burst=1))
+
+    r = session.post('http://app/individual/checks', json={}, auth=auth())
+    assert r.status_code == 400
+
+    # Shed before the (invalid) body is validated
+    r = session.post('http://app/individual/checks', json={}, auth=auth())
+    assert r.status_code == 429
+    assert int(r.headers['Retry-After']) >= 1
+
+
+def test_forged_key_id_charged_to_address(session, auth, monkeypatch):
+    monkeypatch.setattr(admission, 'buckets', TokenBuckets(rate=0.01, burst=1))
+
+    forged = {'Authorization': 'Signature keyId="dummykey",algorithm="hmac-sha256",signature="Zm9yZ2Vk"'}
+    r = session.get('http://app/individual/config', headers=forged)
+    assert r.status_code == 401
+    r = session.get('http://app/individual/config', headers=forged)
+    assert r.status_code == 429
+
+    # The key's own bucket is untouched
+    r = session.get('http://app/individual/config', auth=auth())
+    assert r.status_code == 200
+
+
+def test_endpoint_concurrency(session, auth, monkeypatch):
+    slots = ConcurrencySlots(1)
+    monkeypatch.setattr(admission, 'slots', slots)
+
+    # Occupy the only slot of the endpoint from another request
+    slot = slots.acquire('individual.get_config')
+    r = session.get('http://app/individual/config', auth=auth())
+    assert r.status_code == 429
+
+    # Other endpoints are unaffected, and slots are released after each request
+    r = session.get('http://app/company/config', auth=auth())
+    assert r.status_code == 200
+    r = session.get('http://app/company/config', auth=auth())
+    assert r.status_code == 200
+
+    slots.release(slot)
+    r = session.get('http://app/individual/config', auth=auth())
+    assert r.status_code == 200
@@ -0,0 +1,76 @@
+import json
+from uuid import uuid4
+
+import pytest
+
+from app.bulk import run
+from app.watchlist_store import WatchlistStore
+
+
+def _check(name=None, demo_result=None, entity_type='INDIVIDUAL'):
+    check_input = {'entity_type': entity_type}
+    if name is not None:
+        check_input['personal_details'] = {'name': {'given_names': name.split()[:-1], 'family_name': name.split()[-1]}}
+    req = {
+        'id': str(uuid4()),
+        'check_input': check_input,
+        'commercial_relationship': 'DIRECT',
+        'provider_config': {},
+    }
+    if demo_result is not None:
+        req['demo_result'] = demo_result
+    return json.dumps(req)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Set before the pool forks, so its processes screen against it too
+    store = WatchlistStore(str(tmp_path / 'store'), reload_interval=0)
+    store.rebuild([{'id': '1', 'name': 'John Smith', 'type': 'SANCTION', 'entity_type': 'INDIVIDUAL'}])
+    monkeypatch.setattr('app.screening._index', store)
+    return store
+
+
+def test_bulk_screening(tmp_path, store):
+    lines = [
+        _check('John Smith'),
+        _check('Jane Doe'),
+        _check(demo_result='SCREEN_SINGLE_SANCTION'),
+        _check(demo_result='ERROR_INVALID_CREDENTIALS'),
+        _check('Acme', entity_type='UNKNOWN'),
+        'not json',
+    ] * 5
+    input_path, output_path = tmp_path / 'checks.jsonl', tmp_path / 'results.jsonl'
+    input_path.write_text('\n'.join(lines) + '\n')
+
+    progress = run(str(input_path), str(output_path), processes=2, batch_size=4)
+    assert (progress.done, progress.errors) == (30, 15)
+
+    results = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert len(results) == 30
+    assert [h['provider']['hit_id'] for h in results[0]['check_output']['screening_hits']] == ['1']
+    assert results[1]['check_output']['screening_hits'] == []
+    assert results[2]['check_output']['screening_hits'] and results[2]['errors'] == []
+    assert results[3]['errors'][0]['type'] == 'INVALID_CREDENTIALS'
+    assert results[4]['errors'][0]['type'] == 'INVALID_CHECK_INPUT'
+    assert results[5]['errors'][0]['message'].startswith('Invalid JSON')
+    assert not any(result['pending'] for result in results)
+    # In input order
+    assert [bool(r['errors']) for r in results] == [False, False, False, True, True, True] * 5
+
+
+def test_resume(tmp_path, store):
+    lines = [_check('John Smith'), _check('Jane Doe')] * 5
+    input_path, output_path = tmp_path / 'checks.jsonl', tmp_path / 'results.jsonl'
+    input_path.write_text('\n'.join(lines) + '\n')
+
+    run(str(input_path), str(output_path), processes=1, batch_size=3)
+    complete = output_path.read_bytes()
+
+    # Interrupted in the middle of writing the fourth line
+    lines = complete.split(b'\n')
+    output_path.write_bytes(b'\n'.join(lines[:3]) + b'\n' + lines[3][:10])
+
+    progress = run(str(input_path), str(output_path), processes=1, batch_size=3)
+    assert (progress.resumed, progress.done) == (3, 10)
+    assert output_path.read_bytes() == complete
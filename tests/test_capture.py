@@ -0,0 +1,117 @@
+import io
+import json
+from uuid import uuid4
+
+import pytest
+
+from app.capture import CaptureWriter, capture, redact
+from app.individual import PROVIDER_ID
+from app.replay import Replay, diff, report
+
+
+def test_redact():
+    data = {
+        'check_input': {
+            'entity_type': 'INDIVIDUAL',
+            'personal_details': {'name': {'given_names': ['John'], 'family_name': 'Smith'}, 'dob': '1970-01-31'},
+        },
+        'provider_credentials': {'apikey': 'secret'},
+    }
+    redacted = redact(data, b'key')
+    details = redacted['check_input']['personal_details']
+    assert redacted['check_input']['entity_type'] == 'INDIVIDUAL'
+    assert details['name']['given_names'][0] not in {'John', 'JOHN'}
+    assert details['name']['given_names'][0][0].isupper() and details['name']['given_names'][0][1:].islower()
+    assert len(details['dob']) == 10 and details['dob'][4] == '-' and details['dob'] != '1970-01-31'
+    assert redacted['provider_credentials']['apikey'] != 'secret'
+
+    # The same value always gets the same pseudonym (with the same key)
+    assert redact(data, b'key') == redacted
+    assert redact(data, b'other') != redacted
+
+
+@pytest.fixture
+def captured(tmp_path, monkeypatch):
+    path = tmp_path / 'capture.jsonl'
+    writer = CaptureWriter(str(path))
+    monkeypatch.setattr(capture, 'writer', writer)
+
+    def records():
+        writer.flush()
+        if not path.exists():
+            return []
+        return [json.loads(line) for line in path.read_text().splitlines()]
+    return records
+
+
+def _traffic(session, auth):
+    check_id = uuid4()
+    session.post('http://app/individual/checks', json={
+        'id': str(check_id),
+        'check_input': {
+            'entity_type': 'INDIVIDUAL',
+            'personal_details': {'name': {'given_names': ['John'], 'family_name': 'Smith'}},
+        },
+        'commercial_relationship': 'DIRECT',
+        'provider_config': {},
+        'demo_result': 'SCREEN_SINGLE_SANCTION',
+    }, auth=auth())
+    # A demo result, passed through from the shared store
+    session.post(f'http://app/individual/checks/{check_id}/poll', json={
+        'id': str(check_id),
+        'provider_id': PROVIDER_ID,
+        'reference': str(check_id),
+        'demo_result': 'SCREEN_SINGLE_SANCTION',
+        'commercial_relationship': 'DIRECT',
+        'provider_config': {},
+        'custom_data': {'counter': 0},
+    }, auth=auth(), headers={'X-Request-Timeout-Ms': '5000'})
+
+
+def test_capture(session, auth, captured):
+    _traffic(session, auth)
+    start, poll = captured()
+
+    assert (start['method'], start['path'], start['status']) == ('POST', '/individual/checks', 200)
+    assert 'John' not in json.dumps(start)
+    assert start['body']['check_input']['entity_type'] == 'INDIVIDUAL'
+    assert 'Authorization' not in start['headers'] and 'Signature' not in json.dumps(start['headers'])
+    assert start['duration_ms'] > 0
+
+    assert poll['headers']['X-Request-Timeout-Ms'] == '5000'
+    hits = poll['response']['check_output']['screening_hits']
+    assert len(hits) == 1 and hits[0]['flags'] == [{'type': 'SANCTION'}]
+
+
+def test_sampling(session, auth, captured, monkeypatch):
+    monkeypatch.setattr(capture, 'sample_rate', 0)
+    _traffic(session, auth)
+    assert captured() == []
+
+
+def test_replay(session, auth, captured):
+    for _ in range(3):
+        _traffic(session, auth)
+    records = captured()
+
+    replay = Replay('http://app')
+    replay._session = lambda: session
+    results = replay.run(records, speed=0, concurrency=1)
+    assert [result.status for result in results] == [200] * 6
+    assert not any(result.differences for result in results)
+
+    # The result of the poll is different now
+    records[1]['response']['check_output']['screening_hits'][0]['flags'] = [{'type': 'PEP'}]
+    [result] = replay.run(records[1:2], speed=0)
+    assert result.differences == ['check_output.screening_hits[0].flags[0].type']
+
+    out = io.StringIO()
+    report(results + [result], out)
+    assert 'POST /individual/checks/<id>/poll' in out.getvalue()
+
+
+def test_diff():
+    assert diff({'a': 1, 'custom_data': {'counter': 1}}, {'a': 1, 'custom_data': {'counter': 2}}) == []
+    assert diff({'a': [1, 2]}, {'a': [1, 3]}) == ['a[1]']
+    assert diff({'a': [1, 2]}, {'a': [1]}) == ['a']
+    assert diff({'name': 'Xbcd'}, {'name': 'Qrst', 'b': None}) == []
@@ -0,0 +1,68 @@
+import pytest
+
+from app.countries import COUNTRIES, normalize_country
+from app.provider import CircuitBreaker, ProviderClient
+from app.watchlist import load_entries
+from tests.provider_stub import HIT, StubProvider
+
+
+@pytest.mark.parametrize('value,code', [
+    ('GBR', 'GBR'),
+    ('gb', 'GBR'),
+    ('UK', 'GBR'),
+    (' United Kingdom ', 'GBR'),
+    ('the Netherlands', 'NLD'),
+    ("Cote d'Ivoire", 'CIV'),
+    ('Côte d’Ivoire', 'CIV'),
+    ('Korea, Republic of', 'KOR'),
+    ('SUN', 'RUS'),
+    ('ZR', 'COD'),
+    ('ROM', 'ROU'),
+    ('Kosovo', 'XKX'),
+    ('XYZ', None),
+    ('Atlantis', None),
+    ('', None),
+    (None, None),
+])
+def test_normalize_country(value, code):
+    assert normalize_country(value) == code
+
+
+def test_countries():
+    assert len(COUNTRIES) == 250
+    assert all(normalize_country(code) == code for code in COUNTRIES)
+
+
+def test_unsupported_country(start_check):
+    r = start_check(check_input={
+        'entity_type': 'INDIVIDUAL',
+        'personal_details': {'name': {'given_names': ['John'], 'family_name': 'Smith'}, 'nationality': 'Atlantis'},
+    })
+    assert r.json()['errors'] == [{
+        'type': 'INVALID_CHECK_INPUT',
+        'sub_type': 'UNSUPPORTED_COUNTRY',
+        'message': 'Country not supported.',
+    }]
+
+    r = start_check(entity_type='COMPANY', check_input={
+        'entity_type': 'COMPANY',
+        'metadata': {'name': 'Acme Trading', 'country_of_incorporation': 'United Kingdom'},
+    })
+    assert r.json()['errors'] == []
+
+
+def test_provider_countries_normalized(screen, monkeypatch):
+    countries = [{'type': 'SANCTIONED', 'country_code': country} for country in ('GB', 'Russia', 'USA')]
+    with StubProvider(hits=[{**HIT, 'data': {**HIT['data'], 'countries': countries}}]) as stub:
+        monkeypatch.setattr('app.screening._provider', ProviderClient('stub', stub.url, breaker=CircuitBreaker()))
+        [hit] = screen()['check_output']['screening_hits']
+
+    assert [c['country_code'] for c in hit['data']['countries']] == ['GBR', 'RUS', 'USA']
+
+
+def test_watchlist_countries_normalized(tmp_path):
+    source = tmp_path / 'list.csv'
+    source.write_text('id,name,countries\n1,John Smith,GBR\n2,Acme Trading LLC,US;Iran;USA;Atlantis\n')
+    entries = {entry['id']: entry for entry in load_entries(str(source))}
+    assert entries['1']['countries'] == ['GBR']
+    assert entries['2']['countries'] == ['USA', 'IRN', 'Atlantis']
@@ -0,0 +1,83 @@
+from uuid import uuid4
+
+import pytest
+
+from app.hit_log import HitLog, SharedHitLog
+
+
+@pytest.fixture(params=['memory', 'shared'])
+def log(request, tmp_path):
+    if request.param == 'memory':
+        return HitLog(max_checks=2)
+    return SharedHitLog(str(tmp_path / 'hits.db'))
+
+
+def test_append_and_read(log):
+    log.append('check', 0, [b'1', b'2'])
+    log.append('check', 2, [b'3'])
+    assert log.read('check') == [b'1', b'2', b'3']
+    assert log.read('check', 2) == [b'3']
+    assert log.read('check', 5) == []
+    assert log.read('other') == []
+
+
+def test_append_is_idempotent(log):
+    log.append('check', 0, [b'1', b'2'])
+    # A retried producer appends the same hits again, and some more
+    log.append('check', 0, [b'1', b'2', b'3'])
+    log.append('check', 1, [b'2'])
+    assert log.read('check') == [b'1', b'2', b'3']
+
+    with pytest.raises(ValueError):
+        log.append('check', 4, [b'5'])
+
+
+def test_keeps_recent_checks():
+    log = HitLog(max_checks=2)
+    for check_id in ['a', 'b', 'c']:
+        log.append(check_id, 0, [check_id.encode()])
+    assert (log.read('a'), log.read('c')) == ([], [b'c'])
+
+
+@pytest.fixture
+def poll(poll_check):
+    def poll(check_id, custom_data, partial_results=True, demo_result='SCREEN_ALL_FLAGS_SEPARATE_HITS'):
+        r = poll_check(check_id, custom_data, demo_result=demo_result, commercial_relationship='PASSFORT',
+                       provider_config={'partial_results': partial_results})
+        assert r.status_code == 200
+        return r.json()
+    return poll
+
+
+def test_demo_hits_while_pending(poll):
+    check_id = uuid4()
+    full = poll(check_id, {'counter': 0}, partial_results=False)
+
+    hits, deltas = [], []
+    custom_data = {'counter': 2}
+    while True:
+        res = poll(check_id, custom_data)
+        # A retried poll gets the same hits again
+        assert poll(check_id, custom_data) == res
+        delta = res['check_output']['screening_hits']
+        hits += delta
+        deltas.append(len(delta))
+        assert res['custom_data']['cursor'] == len(hits)
+        if not res['pending']:
+            break
+        custom_data = res['custom_data']
+
+    assert deltas == [2, 1, 1]
+    assert hits == full['check_output']['screening_hits']
+    assert res['charges'] == full['charges']
+
+
+def test_demo_without_hits(poll):
+    res = poll(uuid4(), {'counter': 1}, demo_result='SCREEN_NO_HITS')
+    assert res['pending'] is True
+    assert res['check_output']['screening_hits'] == []
+
+    # Results without hits come as they are
+    check_id = uuid4()
+    res = poll(check_id, {'counter': 0}, demo_result='UNKNOWN')
+    assert res == poll(check_id, {'counter': 0}, partial_results=False, demo_result='UNKNOWN')
@@ -0,0 +1,58 @@
+from uuid import uuid4
+
+from app.idempotency import ResponseCache, SharedResponseCache
+
+
+def test_retried_start_returns_cached_response(start_check, monkeypatch):
+    calls = []
+    monkeypatch.setattr('app.individual.randrange', lambda n: calls.append(n) or len(calls))
+
+    check_id = uuid4()
+    first = start_check(check_id, demo_result='ALL_DATA')
+    assert first.status_code == 200
+    assert first.json()['custom_data'] == {'counter': 1}
+
+    retry = start_check(check_id, demo_result='ALL_DATA')
+    assert retry.status_code == 200
+    assert retry.headers['content-type'] == 'application/json'
+    assert retry.content == first.content
+    assert len(calls) == 1
+
+    # Another check is started as normal
+    assert start_check(demo_result='ALL_DATA').json()['custom_data'] == {'counter': 2}
+
+
+def test_invalid_requests_are_not_cached(session, auth, start_check):
+    check_id = uuid4()
+    r = session.post('http://app/individual/checks', json={'id': str(check_id)}, auth=auth())
+    assert r.status_code == 400
+
+    assert start_check(check_id, demo_result='ALL_DATA').status_code == 200
+
+
+def test_response_cache_is_bounded():
+    cache = ResponseCache(max_size=2)
+    assert cache.add('a', b'1') == b'1'
+    assert cache.add('a', b'2') == b'1'
+    cache.add('b', b'2')
+    cache.get('a')
+    cache.add('c', b'3')
+
+    assert cache.get('a') == b'1'
+    assert cache.get('b') is None
+
+
+def test_shared_response_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(SharedResponseCache, 'EVICT_EVERY', 1)
+    path = str(tmp_path / 'idempotency.db')
+    worker_1 = SharedResponseCache(max_size=2, path=path)
+    worker_2 = SharedResponseCache(max_size=2, path=path)
+
+    assert worker_1.add('a', b'1') == b'1'
+    assert worker_2.get('a') == b'1'
+    assert worker_2.add('a', b'2') == b'1'
+
+    worker_2.add('b', b'2')
+    worker_2.add('c', b'3')
+    assert worker_1.get('a') is None
+    assert worker_1.get('c') == b'3'
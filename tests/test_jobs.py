@@ -0,0 +1,224 @@
+import threading
+import time
+from uuid import uuid4
+
+import pytest
+
+from app import jobs
+from app.jobs import DEAD, DONE, PRIORITY_BULK, PRIORITY_INTERACTIVE, QUEUED, JobQueue
+from app.provider import ProviderClient
+from app.watchlist_store import WatchlistStore
+from tests.provider_stub import StubProvider
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('app.jobs.time.time', clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return JobQueue(str(tmp_path / 'jobs.db'), max_attempts=3)
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    handlers = {}
+    monkeypatch.setattr('app.jobs._handlers', handlers)
+    return handlers
+
+
+def test_claims_by_priority_then_age(queue, clock):
+    queue.enqueue('bulk', 'test', {}, PRIORITY_BULK)
+    clock.now += 1
+    queue.enqueue('first', 'test', {}, PRIORITY_INTERACTIVE)
+    clock.now += 1
+    queue.enqueue('second', 'test', {}, PRIORITY_INTERACTIVE)
+
+    assert [queue.claim().id for _ in range(3)] == ['first', 'second', 'bulk']
+    assert queue.claim() is None
+
+
+def test_enqueue_is_idempotent(queue, handlers):
+    handlers['test'] = lambda payload: b'done'
+    assert queue.enqueue('job', 'test', {'n': 1})
+    assert queue.run_one()
+    assert not queue.enqueue('job', 'test', {'n': 2})
+
+    job = queue.get('job')
+    assert (job.status, job.payload, job.result) == (DONE, {'n': 1}, b'done')
+
+
+def test_retries_with_backoff_then_dead_letters(queue, clock, handlers, monkeypatch):
+    monkeypatch.setattr('app.jobs.random.uniform', lambda a, b: 1.0)
+    calls = []
+
+    def flaky(payload):
+        calls.append(clock.now)
+        raise ConnectionError('provider unavailable')
+
+    handlers['test'] = flaky
+    queue.enqueue('job', 'test', {})
+
+    assert queue.run_one()
+    job = queue.get('job')
+    assert (job.status, job.attempts, job.error) == (QUEUED, 1, 'ConnectionError: provider unavailable')
+
+    # Not due until the backoff has passed
+    assert not queue.run_one()
+    clock.now += queue.RETRY_DELAY
+    assert queue.run_one()
+    assert not queue.run_one()
+    clock.now += 2 * queue.RETRY_DELAY
+    assert queue.run_one()
+
+    job = queue.get('job')
+    assert (job.status, job.attempts) == (DEAD, 3)
+    assert calls == [1000.0, 1001.0, 1003.0]
+    clock.now += 1000
+    assert not queue.run_one()
+
+    # Dead-lettered jobs can be re-queued by hand
+    handlers['test'] = lambda payload: b'ok'
+    assert queue.retry('job')
+    assert not queue.retry('job')
+    assert queue.run_one()
+    assert queue.get('job').status == DONE
+
+
+def test_expired_lease_is_reclaimed(queue, clock):
+    queue.enqueue('job', 'test', {})
+    assert queue.claim().attempts == 1
+    # The worker holding it died: nobody else gets it until the lease expires
+    assert queue.claim() is None
+    clock.now += queue.LEASE + 1
+    assert queue.claim().attempts == 2
+
+
+def test_overrun_lease_result_dropped(queue, clock):
+    queue.enqueue('job', 'test', {})
+    late = queue.claim()
+    clock.now += queue.LEASE + 1
+    current = queue.claim()
+
+    # The worker whose lease ran out finishes after the job was claimed again
+    assert not queue.complete(late, b'stale')
+    assert not queue.fail(late, 'stale')
+    job = queue.get('job')
+    assert (job.status, job.result, job.error) == (jobs.RUNNING, None, None)
+
+    assert queue.complete(current, b'done')
+    assert not queue.fail(current, 'too late')
+    assert not queue.complete(late, b'stale')
+    job = queue.get('job')
+    assert (job.status, job.result, job.error) == (DONE, b'done', None)
+
+
+def test_purge(queue, clock, handlers):
+    handlers['test'] = lambda payload: b''
+    queue.enqueue('old', 'test', {})
+    queue.run_one()
+    clock.now += queue.RETENTION + 1
+    queue.enqueue('new', 'test', {})
+
+    assert queue.purge() == 1
+    assert queue.counts() == {QUEUED: 1}
+
+
+@pytest.fixture
+def job_queue(tmp_path, monkeypatch):
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    monkeypatch.setattr('app.jobs.queue', queue)
+    # Jobs are run by the test rather than by threads
+    monkeypatch.setattr('app.jobs.workers', jobs.JobWorkers(queue, 0))
+
+    store = WatchlistStore(str(tmp_path / 'store'), reload_interval=0)
+    store.rebuild([{'id': '1', 'name': 'John Smith', 'type': 'SANCTION', 'entity_type': 'INDIVIDUAL'}])
+    monkeypatch.setattr('app.screening._index', store)
+    return queue
+
+
+def test_check_runs_as_job(start_check, poll_check, job_queue):
+    check_id = uuid4()
+    custom_data = start_check(check_id).json()['custom_data']
+    assert job_queue.get(str(check_id)).status == QUEUED
+
+    res = poll_check(check_id, custom_data).json()
+    assert res['pending'] is True
+    assert res['custom_data'] == custom_data
+
+    assert job_queue.run_one()
+    res = poll_check(check_id, custom_data).json()
+    assert res['pending'] is False
+    assert [h['provider']['hit_id'] for h in res['check_output']['screening_hits']] == ['1']
+
+
+def test_dead_job_is_reported(poll_check, job_queue, monkeypatch):
+    monkeypatch.setattr('app.jobs._handlers', {})
+    check_id = uuid4()
+    custom_data = {'counter': 0, 'query': {'name': 'John Smith'}}
+
+    # Polling a check without a job enqueues one
+    assert poll_check(check_id, custom_data).json()['pending'] is True
+    for _ in range(job_queue.max_attempts):
+        job_queue.store.execute("UPDATE jobs SET run_after = 0")
+        assert job_queue.run_one()
+
+    res = poll_check(check_id, custom_data).json()
+    [error] = res['errors']
+    assert error['type'] == 'PROVIDER_CONNECTION'
+    assert error['message'].startswith('Screening failed after 5 attempts')
+
+
+def test_partial_results_while_job_runs(poll_check, job_queue, monkeypatch):
+    hits = [{
+        'provider': {'hit_id': str(i), 'label': 'stub'},
+        'status': 'UNRESOLVED',
+        'flags': [{'type': 'SANCTION'}],
+        'data': {'name': 'John Smith', 'aliases': [], 'countries': [], 'dates': []},
+    } for i in range(5)]
+    second_page = threading.Event()
+
+    with StubProvider(hits=hits, page_size=2) as stub:
+        def latency():
+            # The first page comes at once, the rest once the test lets them
+            if stub.requests[-1].get('page'):
+                second_page.wait(5)
+            return 0
+
+        stub.latency = latency
+        monkeypatch.setattr('app.screening._provider', ProviderClient('stub', stub.url, timeout=10))
+
+        check_id = uuid4()
+        custom_data = {'counter': 0, 'query': {'name': 'John Smith'}}
+        poll = {'partial_results': True}
+        assert poll_check(check_id, custom_data, provider_config=poll).json()['check_output']['screening_hits'] == []
+
+        worker = threading.Thread(target=job_queue.run_one)
+        worker.start()
+        for _ in range(100):
+            res = poll_check(check_id, custom_data, provider_config=poll).json()
+            if res['check_output']['screening_hits']:
+                break
+            time.sleep(0.02)
+        assert res['pending'] is True
+        assert [h['provider']['hit_id'] for h in res['check_output']['screening_hits']] == ['0', '1']
+        assert res['custom_data'] == {**custom_data, 'cursor': 2}
+
+        second_page.set()
+        worker.join()
+        res = poll_check(check_id, res['custom_data'], provider_config=poll).json()
+        assert res['pending'] is False
+        assert [h['provider']['hit_id'] for h in res['check_output']['screening_hits']] == ['2', '3', '4']
+        assert res['custom_data']['cursor'] == 5
+        assert [r.get('page') for r in stub.requests] == [None, '2', '4']
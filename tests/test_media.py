@@ -0,0 +1,72 @@
+import datetime
+import random
+
+from app.api import MediaData
+from app.media import MediaCollapser, collapse_media
+from app.provider import CircuitBreaker, ProviderClient
+from tests.provider_stub import HIT, StubProvider
+
+SNIPPET = ('Prosecutors said on Tuesday that {name} had moved funds through a network of shell companies '
+           'registered in three countries, according to court documents seen by reporters.')
+
+
+def _snippet(seed, name):
+    # A story of its own: different words from every other story
+    rng = random.Random(seed)
+    words = ['funds', 'court', 'bank', 'minister', 'transfer', 'charges', 'police', 'bribery', 'company', 'audit',
+             'contract', 'inquiry', 'offshore', 'tax', 'ruling', 'appeal', 'assets', 'frozen', 'report', 'trial']
+    return f"{name} {' '.join(rng.choice(words) for _ in range(25))}"
+
+
+def _article(title, snippet, date, url='https://news.example.com/1'):
+    return MediaData({'url': url, 'title': title, 'snippet': snippet, 'date': date})
+
+
+def test_collapses_syndicated_copies():
+    story = SNIPPET.format(name='John Smith')
+    other = ('The regulator fined the bank for failing to report suspicious transfers between 2015 and 2018, '
+             'and said its controls were inadequate.')
+    articles = [
+        _article('John Smith charged with fraud', story, datetime.date(2020, 3, 2)),
+        _article('Reuters: John Smith charged with fraud', story + ' Reporting by Reuters.', datetime.date(2020, 3, 1)),
+        _article('John Smith charged with fraud', story.replace('on Tuesday ', ''), datetime.date(2020, 3, 3)),
+        _article('John Smith charged with fraud', story, datetime.date(2020, 3, 4)),
+        _article('Bank fined over controls', other, datetime.date(2019, 1, 1)),
+    ]
+
+    collapser = MediaCollapser()
+    assert [collapser.add(article) for article in articles] == [0, 0, 0, 0, 1]
+    first, second = collapser.stories
+    assert first.copies == 4
+    # The earliest copy stands for the story
+    assert first.article.date == datetime.date(2020, 3, 1)
+
+
+def test_ranked_and_capped():
+    articles = []
+    for i in range(30):
+        name = 'John Smith' if i % 3 == 0 else 'Jane Doe'
+        snippet = _snippet(i, name)
+        date = datetime.date(2020, 1, 1) + datetime.timedelta(days=i)
+        articles += [_article(f'Case {i} update', snippet, date)] * 3
+
+    media = collapse_media(articles, 'John Smith', limit=12)
+    assert len(media) == 12
+    # Articles naming John Smith first, newest first
+    assert [a.date.day for a in media[:10]] == [28, 25, 22, 19, 16, 13, 10, 7, 4, 1]
+    assert all('Jane Doe' in a.snippet for a in media[10:])
+
+
+def test_provider_media_collapsed(screen, monkeypatch):
+    media = [{
+        'url': f'https://news{copy}.example.com/{story}',
+        'title': f'Story {story}',
+        'snippet': _snippet(story, 'John Smith'),
+        'date': '2020-01-01',
+    } for story in range(5) for copy in range(20)]
+
+    with StubProvider(hits=[{**HIT, 'data': {**HIT['data'], 'media': media}}]) as stub:
+        monkeypatch.setattr('app.screening._provider', ProviderClient('stub', stub.url, breaker=CircuitBreaker()))
+        [hit] = screen()['check_output']['screening_hits']
+
+    assert sorted(a['title'] for a in hit['data']['media']) == [f'Story {story}' for story in range(5)]
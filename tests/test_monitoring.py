@@ -0,0 +1,76 @@
+from uuid import uuid4
+
+import pytest
+
+from app.api import ScreeningQuery
+from app.individual import PROVIDER_ID
+from app.monitoring import MonitoringRegistry
+from app.watchlist_store import WatchlistStore
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = MonitoringRegistry(str(tmp_path / 'monitoring.db'))
+    monkeypatch.setattr('app.monitoring._registry', registry)
+    return registry
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = WatchlistStore(str(tmp_path / 'store'), reload_interval=0)
+    store.rebuild([{'id': '1', 'name': 'John Smith', 'type': 'SANCTION', 'entity_type': 'INDIVIDUAL'}])
+    monkeypatch.setattr('app.screening._index', store)
+    return store
+
+
+def test_rescreen_only_affected_entities(registry):
+    registry.register('check-1', 'INDIVIDUAL', PROVIDER_ID, ScreeningQuery({'name': 'John Smith'}))
+    registry.register('check-2', 'INDIVIDUAL', PROVIDER_ID, ScreeningQuery({'name': 'Jane Doe'}))
+    registry.register('check-3', 'COMPANY', PROVIDER_ID, ScreeningQuery({'name': 'Acme Trading LLC'}))
+
+    changes = [
+        ('add', '10', {'id': '10', 'name': 'Smith John', 'type': 'PEP', 'entity_type': 'INDIVIDUAL'}),
+        ('add', '11', {'id': '11', 'name': 'Acme Trading', 'aliases': ['Acme Trading LLC'], 'type': 'SANCTION'}),
+        ('remove', '12', None),
+    ]
+    assert registry.affected_entities([e for _, _, e in changes if e]) == {1, 3}
+
+    new_hits = registry.rescreen(changes)
+    assert {check_id: [h.provider.hit_id for h in hits] for check_id, hits in new_hits.items()} == {
+        'check-1': ['10'],
+        'check-3': ['11'],
+    }
+
+    # Hits are only reported once
+    assert registry.rescreen(changes) == {}
+
+
+MONITORED = {'ongoing_monitoring': True}
+
+
+def test_unmonitored_check_hits_not_recorded(screen, registry, store, monkeypatch):
+    monkeypatch.setattr(registry, 'record_hits', lambda *args: pytest.fail('hits recorded'))
+    res = screen()
+    assert [h['provider']['hit_id'] for h in res['check_output']['screening_hits']] == ['1']
+
+
+def test_monitored_check_polls_new_hits(screen, poll_check, registry, store):
+    check_id = uuid4()
+    res = screen(check_id, provider_config=MONITORED)
+    assert [h['provider']['hit_id'] for h in res['check_output']['screening_hits']] == ['1']
+
+    changes = [('add', '2', {'id': '2', 'name': 'John Smith', 'type': 'PEP', 'entity_type': 'INDIVIDUAL'})]
+    store.apply_delta(changes)
+    registry.rescreen(changes)
+
+    custom_data = {'counter': 0, 'query': {'name': 'John Smith'}}
+    res = poll_check(check_id, custom_data, provider_config=MONITORED).json()
+    assert res['provider_data'] == 'Ongoing monitoring: new hits since the last screening.'
+    assert [h['provider']['hit_id'] for h in res['check_output']['screening_hits']] == ['2']
+    assert res['check_output']['screening_hits'][0]['flags'] == [{'type': 'PEP'}]
+
+    # Once delivered, polls return the full screening again, where both
+    # entries for the same person are merged into one hit
+    res = poll_check(check_id, custom_data, provider_config=MONITORED).json()
+    [hit] = res['check_output']['screening_hits']
+    assert hit['flags'] == [{'type': 'SANCTION'}, {'type': 'PEP'}]
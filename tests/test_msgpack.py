@@ -0,0 +1,68 @@
+from uuid import uuid4
+
+import msgpack
+import pytest
+
+from app.watchlist_store import WatchlistStore
+
+MSGPACK = 'application/msgpack'
+
+
+def _accept(accept):
+    return {'Accept': accept} if accept else None
+
+
+@pytest.mark.parametrize('accept, mimetype', [
+    (None, 'application/json'),
+    ('*/*', 'application/json'),
+    ('application/json', 'application/json'),
+    ('application/msgpack', 'application/msgpack'),
+    ('application/vnd.msgpack', 'application/vnd.msgpack'),
+    ('application/json;q=0.5, application/msgpack', 'application/msgpack'),
+    ('text/html', 'application/json'),
+])
+def test_negotiation(start_check, accept, mimetype):
+    r = start_check(headers=_accept(accept), demo_result='ALL_DATA')
+    assert r.status_code == 200
+    assert r.headers['content-type'] == mimetype
+
+
+def test_same_content_as_json(start_check, poll_check, tmp_path, monkeypatch):
+    store = WatchlistStore(str(tmp_path / 'store'), reload_interval=0)
+    store.rebuild([{'id': '1', 'name': 'John Smith', 'type': 'SANCTION', 'entity_type': 'INDIVIDUAL',
+                    'dob': '1970-01-01', 'countries': ['GBR']}])
+    monkeypatch.setattr('app.screening._index', store)
+    monkeypatch.setattr('app.individual.randrange', lambda n: 0)
+
+    # A model serialised per request, a demo result from the shared store, and cached screening hits
+    check_id = uuid4()
+    demo = {'demo_result': 'SCREEN_SINGLE_SANCTION'}
+    screening = {'custom_data': {'counter': 0, 'query': {'name': 'John Smith'}}}
+    for send in [
+        lambda accept: start_check(check_id, headers=_accept(accept), demo_result='ALL_DATA'),
+        lambda accept: poll_check(check_id, headers=_accept(accept), **demo),
+        lambda accept: poll_check(check_id, headers=_accept(accept), **screening),
+    ]:
+        as_json = send(None)
+        as_msgpack = send(MSGPACK)
+        assert as_msgpack.headers['content-type'] == MSGPACK
+        assert msgpack.unpackb(as_msgpack.content) == as_json.json()
+        assert len(as_msgpack.content) < len(as_json.content)
+
+    hit = msgpack.unpackb(as_msgpack.content)['check_output']['screening_hits'][0]
+    assert hit['data']['dates'] == [{'type': 'DOB', 'date': '1970-01-01'}]
+
+
+def test_retried_start_in_both_encodings(start_check, monkeypatch):
+    calls = []
+    monkeypatch.setattr('app.individual.randrange', lambda n: calls.append(n) or len(calls))
+
+    check_id = uuid4()
+    first = start_check(check_id, headers=_accept(MSGPACK), demo_result='ALL_DATA')
+    retry = start_check(check_id, headers=_accept(MSGPACK), demo_result='ALL_DATA')
+    assert retry.headers['content-type'] == MSGPACK
+    assert retry.content == first.content
+    assert msgpack.unpackb(retry.content)['custom_data'] == {'counter': 1}
+
+    # Each encoding is cached on its own
+    assert start_check(check_id, demo_result='ALL_DATA').json()['custom_data'] == {'counter': 2}
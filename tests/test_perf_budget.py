@@ -0,0 +1,93 @@
+from uuid import uuid4
+
+import pytest
+from requests import Request
+
+from tests.perf_budget import at_speed_of, over_budget
+
+# Who the screening polls search the watchlist for
+NAMES = {'INDIVIDUAL': 'John Smith', 'COMPANY': 'Acme Trading LLC'}
+
+ENTITIES = pytest.mark.parametrize('entity', ['INDIVIDUAL', 'COMPANY'])
+
+
+@pytest.fixture
+def client():
+    from main import app
+
+    app.testing = True
+    return app.test_client()
+
+
+def _prepare(client, auth, path, body):
+    # Signs a new request each time (with a new check id, so starts aren't
+    # answered from the idempotency cache) and returns a call that sends it
+    def prepare():
+        prepared = Request('POST', f'http://app{path}', json=body(), auth=auth()).prepare()
+
+        def send():
+            response = client.post(path, data=prepared.body, headers=dict(prepared.headers))
+            assert response.status_code == 200
+            response.get_data()
+            response.close()
+        return send
+    return prepare
+
+
+@pytest.mark.perf
+@ENTITIES
+def test_demo_start(client, auth, start_body, perf_budget, entity):
+    prepare = _prepare(client, auth, f'/{entity.lower()}/checks',
+                       lambda: start_body(entity_type=entity, demo_result='ALL_DATA'))
+    perf_budget.check(f'{entity.lower()}.demo.start', prepare)
+
+
+@pytest.mark.perf
+@ENTITIES
+def test_demo_poll(client, auth, poll_body, perf_budget, entity):
+    prepare = _prepare(client, auth, f'/{entity.lower()}/checks/{uuid4()}/poll',
+                       lambda: poll_body(custom_data={'counter': 3}, entity_type=entity, demo_result='ALL_DATA'))
+    perf_budget.check(f'{entity.lower()}.demo.poll', prepare)
+
+
+@pytest.mark.perf
+@ENTITIES
+def test_demo_result(client, auth, poll_body, perf_budget, entity):
+    prepare = _prepare(client, auth, f'/{entity.lower()}/checks/{uuid4()}/poll',
+                       lambda: poll_body(entity_type=entity, demo_result='ALL_DATA'))
+    perf_budget.check(f'{entity.lower()}.demo.result', prepare)
+
+
+@pytest.mark.perf
+@ENTITIES
+def test_screening_start(client, auth, start_body, perf_budget, watchlist_index, entity):
+    prepare = _prepare(client, auth, f'/{entity.lower()}/checks', lambda: start_body(entity_type=entity))
+    perf_budget.check(f'{entity.lower()}.screening.start', prepare)
+
+
+@pytest.mark.perf
+@ENTITIES
+def test_screening_result(client, auth, poll_body, perf_budget, watchlist_index, entity):
+    custom_data = {'counter': 0, 'query': {'name': NAMES[entity], 'dob': None}}
+    prepare = _prepare(client, auth, f'/{entity.lower()}/checks/{uuid4()}/poll',
+                       lambda: poll_body(custom_data=custom_data, entity_type=entity))
+    perf_budget.check(f'{entity.lower()}.screening.result', prepare)
+
+
+def test_over_budget():
+    tolerance = {'p50_ms': 0.25, 'peak_kib': 0.1}
+    slack = {'p50_ms': 0.1, 'peak_kib': 0.0}
+    budget = {'p50_ms': 2.0, 'reference_ms': 0.2, 'peak_kib': 100.0}
+    assert over_budget({'p50_ms': 2.55, 'reference_ms': 0.2, 'peak_kib': 109.0}, budget, tolerance, slack) == []
+    assert over_budget({'p50_ms': 2.65, 'reference_ms': 0.2, 'peak_kib': 111.0}, budget, tolerance, slack) == [
+        'p50_ms 2.65 > 2.0 (+25% +0.1)', 'peak_kib 111.0 > 100.0 (+10% +0.0)',
+    ]
+
+
+def test_at_speed_of():
+    budget = {'p50_ms': 2.0, 'reference_ms': 0.2, 'peak_kib': 100.0}
+    # Twice as slow as when the baseline was measured, reference included
+    slow = {'p50_ms': 4.0, 'reference_ms': 0.4, 'peak_kib': 100.0}
+    assert at_speed_of(slow, budget) == {'p50_ms': 2.0, 'reference_ms': 0.2, 'peak_kib': 100.0}
+    # Baselines measured before references were recorded are compared as they are
+    assert at_speed_of(slow, {'p50_ms': 2.0, 'peak_kib': 100.0}) == slow
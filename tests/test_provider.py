@@ -0,0 +1,190 @@
+import threading
+import time
+
+import pytest
+
+from app import deadlines
+from app.provider import CircuitBreaker, CircuitOpen, ProviderClient, ProviderUnavailable
+from tests.provider_stub import HIT, StubProvider
+
+
+@pytest.fixture
+def stub():
+    with StubProvider(hits=[HIT]) as stub:
+        yield stub
+
+
+def _client(stub, **breaker):
+    breaker = CircuitBreaker(**{'window': 4, 'min_calls': 4, 'open_seconds': 0.2, **breaker})
+    return ProviderClient('stub', stub.url, timeout=2, max_concurrency=2, breaker=breaker)
+
+
+def _calls(client, n):
+    outcomes = []
+    for _ in range(n):
+        try:
+            client.post('/search', {'name': 'John Smith'})
+            outcomes.append('ok')
+        except CircuitOpen:
+            outcomes.append('open')
+        except ProviderUnavailable:
+            outcomes.append('failed')
+    return outcomes
+
+
+def test_opens_on_errors_and_recovers(stub):
+    client = _client(stub)
+    assert client.post('/search', {'name': 'John Smith'}) == {'hits': [HIT]}
+
+    stub.error_rate = 1
+    assert _calls(client, 3) == ['failed'] * 3
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # Fails fast, without calling the provider
+    calls = len(stub.requests)
+    start = time.monotonic()
+    assert _calls(client, 10) == ['open'] * 10
+    assert time.monotonic() - start < 0.1
+    assert len(stub.requests) == calls
+
+    # A failed probe opens the circuit again...
+    time.sleep(0.2)
+    assert _calls(client, 2) == ['failed', 'open']
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    # ...and a successful one closes it
+    stub.error_rate = 0
+    time.sleep(0.2)
+    assert _calls(client, 3) == ['ok'] * 3
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_opens_on_slow_calls(stub):
+    stub.latency = 0.1
+    client = _client(stub, slow_call=0.05)
+    assert _calls(client, 5) == ['ok'] * 4 + ['open']
+
+
+def test_timeouts_count_as_failures(stub):
+    stub.latency = 0.3
+    client = _client(stub)
+    client.timeout = 0.05
+    assert _calls(client, 5) == ['failed'] * 4 + ['open']
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(window=2, min_calls=2, open_seconds=0)
+    breaker.after_call(False, True, 0)
+    breaker.after_call(False, True, 0)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    breaker.after_call(True, False, 0)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.before_call() is False
+
+
+def test_concurrency_limit(stub):
+    stub.latency = 0.5
+    client = _client(stub)
+    outcomes = []
+    threads = [threading.Thread(target=lambda: outcomes.extend(_calls(client, 1))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(outcomes) == ['failed', 'failed', 'ok', 'ok']
+    assert len(stub.requests) == 2
+    # Calls turned away by the limit say nothing about the provider
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_deadline_is_propagated(stub):
+    client = _client(stub)
+    with deadlines.within(1):
+        client.post('/search', {'name': 'John Smith'})
+    assert 900 < int(stub.headers[0][deadlines.HEADER]) <= 1000
+
+    stub.latency = 0.5
+    start = time.monotonic()
+    with deadlines.within(0.1), pytest.raises(ProviderUnavailable, match='within the deadline'):
+        client.post('/search', {'name': 'John Smith'})
+    assert time.monotonic() - start < 0.3
+
+    # Our deadline running out is not the provider failing
+    assert _calls(client, 3) == ['ok'] * 3
+    with deadlines.within(0), pytest.raises(ProviderUnavailable, match='Deadline exceeded'):
+        client.post('/search', {'name': 'John Smith'})
+    assert len(stub.requests) == 5
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_deadline_timeouts_open_breaker(stub):
+    client = _client(stub)
+    stub.latency = 0.5
+    for _ in range(4):
+        with deadlines.within(0.05), pytest.raises(ProviderUnavailable, match='within the deadline'):
+            client.post('/search', {'name': 'John Smith'})
+
+    # Counted as slow calls, even though none reached `slow_call`
+    assert client.breaker.state == CircuitBreaker.OPEN
+    with deadlines.within(0.05), pytest.raises(CircuitOpen):
+        client.post('/search', {'name': 'John Smith'})
+
+
+def test_hedged_call(stub):
+    latencies = iter([1, 0, 1, 0])
+    stub.latency = lambda: next(latencies)
+    client = _client(stub)
+    client.hedge, client.hedge_after = True, 0.05
+
+    start = time.monotonic()
+    assert client.post('/search', {'name': 'John Smith'}, idempotent=True) == {'hits': [HIT]}
+    assert time.monotonic() - start < 0.5
+    assert len(stub.requests) == 2
+
+    # Only idempotent calls are hedged
+    start = time.monotonic()
+    client.post('/search', {'name': 'John Smith'})
+    assert time.monotonic() - start >= 1
+    assert len(stub.requests) == 3
+
+
+def test_hedge_delay_follows_response_times(stub):
+    client = _client(stub)
+    client.hedge = True
+    assert client.hedge_delay() is None
+
+    client._latencies.extend(i / 100 for i in range(100))
+    assert client.hedge_delay() == 0.95
+
+
+def test_screening_through_provider(screen, stub, monkeypatch):
+    client = _client(stub)
+    monkeypatch.setattr('app.screening._provider', client)
+
+    res = screen()
+    assert [h['provider']['hit_id'] for h in res['check_output']['screening_hits']] == ['1']
+    assert stub.requests[0]['name'] == 'John Smith'
+
+    stub.error_rate = 1
+    for _ in range(3):
+        [error] = screen()['errors']
+        assert error['type'] == 'PROVIDER_CONNECTION'
+    assert error['message'].startswith('Provider request failed')
+
+    [error] = screen()['errors']
+    assert error == {'type': 'PROVIDER_CONNECTION', 'message': 'Provider circuit is open'}
+
+
+def test_poll_deadline(screen, stub, monkeypatch):
+    monkeypatch.setattr('app.screening._provider', _client(stub))
+    stub.latency = 1
+
+    start = time.monotonic()
+    [error] = screen(headers={deadlines.HEADER: '100'})['errors']
+    assert error == {'type': 'PROVIDER_CONNECTION', 'message': 'Provider did not respond within the deadline'}
+    assert time.monotonic() - start < 0.5
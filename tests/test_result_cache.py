@@ -0,0 +1,122 @@
+import threading
+import time
+from uuid import uuid4
+
+import pytest
+
+from app import metrics
+from app.individual import PROVIDER_ID
+from app.result_cache import ResultCache, cache_key
+from app.watchlist import WatchlistIndex, build_index
+
+
+def test_cache_key():
+    assert cache_key('a', {'x': 1, 'y': 2}) == cache_key('a', {'y': 2, 'x': 1})
+    assert cache_key('a', {'x': 1}) != cache_key('b', {'x': 1})
+
+
+def test_ttl_and_size_bounds(monkeypatch):
+    cache = ResultCache(ttl=60, max_bytes=10, name='test_bounds')
+    cache.put('a', b'12345')
+    cache.put('b', b'12345')
+    assert cache.get('a') == b'12345'
+
+    # Least recently used goes first
+    cache.put('c', b'12345')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'12345'
+
+    now = time.time()
+    monkeypatch.setattr('app.result_cache.time.time', lambda: now + 61)
+    assert cache.get('a') is None
+
+
+def test_shared_tier(tmp_path):
+    path = str(tmp_path / 'results.db')
+    worker_1 = ResultCache(ttl=60, max_bytes=2 ** 20, shared_path=path, name='test_shared')
+    worker_2 = ResultCache(ttl=60, max_bytes=2 ** 20, shared_path=path, name='test_shared')
+
+    worker_1.put('a', b'result')
+    assert worker_2.get('a') == b'result'
+    assert metrics.value('test_shared.hits.shared') == 1
+
+    # Promoted to the worker's own memory
+    assert worker_2.get('a') == b'result'
+    assert metrics.value('test_shared.hits.memory') == 1
+
+
+def test_single_flight():
+    cache = ResultCache(ttl=60, max_bytes=2 ** 20, name='test_flight')
+    started = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return b'result'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('a', compute)))
+               for _ in range(4)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == [b'result'] * 4
+
+
+def test_errors_are_not_cached():
+    cache = ResultCache(ttl=60, max_bytes=2 ** 20, name='test_errors')
+
+    def fail():
+        raise RuntimeError()
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('a', fail)
+    assert cache.get_or_compute('a', lambda: b'result') == b'result'
+
+
+def test_repeated_screening_is_cached(session, auth, tmp_path, monkeypatch):
+    path = str(tmp_path / 'list.idx')
+    build_index([{'id': '1', 'name': 'John Smith', 'type': 'SANCTION'}], path)
+    index = WatchlistIndex(path)
+    monkeypatch.setattr('app.screening._index', index)
+    cache = ResultCache(ttl=60, max_bytes=2 ** 20, name='test_screening')
+    monkeypatch.setattr('app.screening.screening_results', cache)
+
+    def poll(name, commercial_relationship='DIRECT'):
+        check_id = uuid4()
+        r = session.post(f'http://app/individual/checks/{check_id}/poll', json={
+            'id': str(check_id),
+            'provider_id': PROVIDER_ID,
+            'reference': str(check_id),
+            'commercial_relationship': commercial_relationship,
+            'provider_config': {},
+            'custom_data': {'counter': 0, 'query': {'name': name}},
+        }, auth=auth())
+        assert r.status_code == 200
+        return str(check_id), r.json()
+
+    _, first = poll('John Smith')
+    check_id, second = poll('  JOHN smith', 'PASSFORT')
+    assert metrics.value('test_screening.misses') == 1
+    assert metrics.value('test_screening.hits.memory') == 1
+
+    # Cached hits, but the envelope belongs to each check
+    assert second['check_output']['screening_hits'] == first['check_output']['screening_hits']
+    assert second['reference'] == check_id
+    assert second['charges'] == [{'amount': 100, 'reference': check_id}]
+
+    # A new build of the index isn't answered from the cache
+    index.version = 'rebuilt'
+    poll('John Smith')
+    assert metrics.value('test_screening.misses') == 2
+
+    r = session.get('http://app/metrics', auth=auth())
+    assert r.json()['metrics']['test_screening.hit_ratio'] == pytest.approx(1 / 3)
+    index.close()
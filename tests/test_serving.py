@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+from app import serving
+
+
+def test_profiles(monkeypatch):
+    monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+
+    sync = serving.settings('sync', cpu_count=4)
+    assert (sync['worker_class'], sync['workers']) == ('sync', 9)
+    assert sync['preload_app']
+
+    gthread = serving.settings('gthread', cpu_count=4)
+    assert (gthread['worker_class'], gthread['workers'], gthread['threads']) == ('gthread', 5, 4)
+    assert 0 < gthread['max_requests_jitter'] < gthread['max_requests']
+
+    monkeypatch.setenv('WEB_CONCURRENCY', '2')
+    assert serving.settings('gthread', cpu_count=4)['workers'] == 2
+
+    with pytest.raises(ValueError):
+        serving.settings('eventlet')
+
+
+def test_recycle_on_memory(monkeypatch):
+    class Worker:
+        pid = 1
+        alive = True
+
+    worker = Worker()
+    monkeypatch.setattr(serving, 'WORKER_MAX_RSS', 2 ** 40)
+    serving.post_request(worker, None, {}, None)
+    assert worker.alive
+
+    monkeypatch.setattr(serving, 'WORKER_MAX_RSS', 2 ** 20)
+    serving.post_request(worker, None, {}, None)
+    assert not worker.alive
+
+
+def test_hit_log_shared_by_workers(tmp_path, monkeypatch):
+    for name in ('HIT_LOG_PATH', 'JOB_QUEUE_PATH'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('SHARED_STORE_DIR', str(tmp_path))
+
+    serving.share_hit_log(1)
+    assert 'HIT_LOG_PATH' not in os.environ
+    serving.share_hit_log(3)
+    assert os.environ['HIT_LOG_PATH'] == str(tmp_path / 'hit_log.db')
+
+    monkeypatch.delenv('HIT_LOG_PATH')
+    monkeypatch.setenv('JOB_QUEUE_PATH', str(tmp_path / 'jobs.db'))
+    serving.share_hit_log(3)
+    assert 'HIT_LOG_PATH' not in os.environ
@@ -0,0 +1,164 @@
+import hashlib
+import multiprocessing
+import os
+
+import pytest
+
+from app.shared_store import SharedStore, build_store, open_store
+
+PAYLOAD_SIZE = 2 ** 20
+PAYLOAD_COUNT = 32
+
+
+def test_get(tmp_path):
+    path = str(tmp_path / 'test.store')
+    assert build_store([('a', b'first'), ('b', b''), ('c', b'x' * 1000)], path) == 3
+
+    store = SharedStore(path)
+    assert len(store) == 3
+    assert sorted(store.keys()) == ['a', 'b', 'c']
+    assert store.get('a') == b'first'
+    assert store.get('b') == b''
+    assert store.get('missing') is None
+
+    value = store.get('c')
+    assert isinstance(value, memoryview) and value.readonly
+    assert value.tobytes() == b'x' * 1000
+    value.release()
+    store.close()
+
+
+def test_open_store_builds_once(tmp_path):
+    calls = []
+
+    def items():
+        calls.append(1)
+        return [('a', b'first')]
+
+    open_store(str(tmp_path), 'test', 'v1', items).close()
+    store = open_store(str(tmp_path), 'test', 'v1', items)
+    assert calls == [1]
+    assert store.get('a') == b'first'
+
+    # A new fingerprint replaces the old store
+    open_store(str(tmp_path), 'test', 'v2', lambda: [('a', b'second')]).close()
+    assert sorted(os.listdir(str(tmp_path))) == ['test-v2.store']
+    # ...while processes that had it open keep reading it
+    assert store.get('a') == b'first'
+    store.close()
+
+
+def _memory() -> dict:
+    # kB, from the kernel's per-process accounting
+    values = {}
+    with open('/proc/self/smaps_rollup') as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values
+
+
+def _read_all(path, barrier, results):
+    before = _memory()
+    store = SharedStore(path)
+    for key in store.keys():
+        value = store.get(key)
+        hashlib.sha256(value).digest()
+        value.release()
+
+    # Every worker has mapped the whole store before any measures it
+    barrier.wait()
+    after = _memory()
+    results.put({name: after[name] - before[name] for name in ('Rss', 'Pss', 'Anonymous')})
+    barrier.wait()
+    store.close()
+
+
+def _per_worker(path, workers):
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=_read_all, args=(path, barrier, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measured = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join()
+    return measured
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/smaps_rollup'), reason='needs Linux memory accounting')
+def test_memory_per_worker(tmp_path):
+    path = str(tmp_path / 'payloads.store')
+    build_store(((f'payload-{i}', bytes([i]) * PAYLOAD_SIZE) for i in range(PAYLOAD_COUNT)), path)
+    store_kb = PAYLOAD_COUNT * PAYLOAD_SIZE // 1024
+
+    [single] = _per_worker(path, 1)
+    several = _per_worker(path, 4)
+    print(f'\n1 worker:  {single}\n4 workers: {several}')
+
+    # Each worker maps all of the store (RSS counts shared pages) ...
+    assert single['Rss'] >= 0.9 * store_kb
+    assert all(worker['Rss'] >= 0.9 * store_kb for worker in several)
+    # ... but none of it is private: the pages are counted once across workers
+    assert all(worker['Anonymous'] < 0.1 * store_kb for worker in [single] + several)
+    assert sum(worker['Pss'] for worker in several) < 1.5 * store_kb
+
+
+def test_open_value_file(tmp_path):
+    path = str(tmp_path / 'test.store')
+    build_store([('a', b'first'), ('b', b'second')], path)
+    store = SharedStore(path)
+
+    file = store.open('a')
+    assert file.length == 5
+    assert file.read(3) == b'fir'
+    assert file.read() == b'st'
+    assert file.read() == b''
+    file.close()
+    assert store.open('missing') is None
+
+    os.remove(path)
+    assert store.open('a') is None
+    store.close()
+
+
+def test_demo_result_sent_as_file(auth):
+    from requests import Request
+
+    from main import app
+
+    class FileWrapper:
+        # Stands in for gunicorn's, which sends the file with sendfile(2)
+        wrapped = []
+
+        def __init__(self, file, block_size=8192):
+            self.file = file
+            self.wrapped.append(file)
+
+        def __iter__(self):
+            return iter(lambda: self.file.read(8192), b'')
+
+    body = {
+        'id': '9a1d4d4c-a3d2-4a63-9b2f-8cd0bca52ea4',
+        'provider_id': 'f3b5d3a2-6b5e-4a2e-9e2e-0d8e7f5b3c11',
+        'reference': 'ref', 'demo_result': 'ALL_DATA', 'commercial_relationship': 'DIRECT',
+        'provider_config': {}, 'custom_data': {'counter': 0},
+    }
+    url = f"http://app/individual/checks/{body['id']}/poll"
+    signed = Request('POST', url, json=body, auth=auth()).prepare()
+
+    r = app.test_client().post(f"/individual/checks/{body['id']}/poll", data=signed.body,
+                               headers=dict(signed.headers), environ_overrides={'wsgi.file_wrapper': FileWrapper})
+    assert r.status_code == 200
+    assert len(FileWrapper.wrapped) == 1
+    assert int(r.headers['Content-Length']) == len(r.data)
+    assert r.get_json()['errors'] == []
+
+
+@pytest.mark.parametrize('provider_config', [{}, {'partial_results': True}])
+def test_invalid_demo_result_rejected(poll_check, provider_config):
+    r = poll_check(demo_result='../../etc/passwd', provider_config=provider_config)
+    assert r.status_code == 400
+    assert r.text == 'Invalid demo request'
@@ -0,0 +1,102 @@
+import io
+import json
+
+import pytest
+
+from app import tracing
+from app.provider import CircuitBreaker, ProviderClient
+from app.tracing import FileExporter
+from tests.provider_stub import StubProvider
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+PARENT_ID = '00f067aa0ba902b7'
+
+
+@pytest.fixture
+def spans(tmp_path, monkeypatch):
+    path = tmp_path / 'spans.jsonl'
+    exporter = FileExporter(str(path))
+    exporter.FLUSH_INTERVAL = 0.01
+    monkeypatch.setattr('app.tracing.exporter', exporter)
+
+    def exported():
+        exporter.flush()
+        if not path.exists():
+            return []
+        return [json.loads(line) for line in path.read_text().splitlines()]
+    return exported
+
+
+@pytest.fixture
+def poll(poll_check):
+    def poll(headers=None, **body):
+        r = poll_check(headers=headers, **{'demo_result': 'SCREEN_SINGLE_SANCTION', **body})
+        assert r.status_code == 200
+        return r
+    return poll
+
+
+def test_request_spans(poll, spans):
+    poll()
+    exported = spans()
+    by_name = {span['name']: span for span in exported}
+    assert set(by_name) == {
+        'request', 'authenticate', 'validate_models', 'handler', 'demo_result', 'encode_response',
+        'log_request', 'log_response',
+    }
+    root = by_name['request']
+    assert root['parent_id'] is None and root['attributes']['status'] == 200
+    assert {span['trace_id'] for span in exported} == {root['trace_id']}
+    assert by_name['demo_result']['parent_id'] == by_name['handler']['span_id']
+    assert by_name['handler']['parent_id'] == by_name['authenticate']['parent_id'] == root['span_id']
+    # Children finish within their parent
+    assert by_name['handler']['duration_ms'] <= root['duration_ms']
+
+
+def test_joins_callers_trace(poll, spans):
+    poll(headers={'traceparent': f'00-{TRACE_ID}-{PARENT_ID}-01'})
+    [root] = [span for span in spans() if span['name'] == 'request']
+    assert (root['trace_id'], root['parent_id']) == (TRACE_ID, PARENT_ID)
+
+    # Not sampled by the caller
+    poll(headers={'traceparent': f'00-{TRACE_ID}-{PARENT_ID}-00'})
+    assert len([span for span in spans() if span['name'] == 'request']) == 1
+
+
+def test_head_sampling(poll, spans, monkeypatch):
+    monkeypatch.setattr('app.tracing.sample_rate', 0)
+    poll()
+    assert spans() == []
+    assert tracing.span('anything').__enter__() is None
+
+
+def test_propagated_to_provider(poll, spans, monkeypatch):
+    with StubProvider() as stub:
+        client = ProviderClient('stub', stub.url, timeout=2, breaker=CircuitBreaker())
+        monkeypatch.setattr('app.screening._provider', client)
+        poll(custom_data={'counter': 0, 'query': {'name': 'John Smith'}})
+
+    by_name = {span['name']: span for span in spans()}
+    call = by_name['provider.call']
+    assert call['parent_id'] == by_name['screening']['span_id']
+    assert call['attributes'] == {'status': 200}
+    assert stub.headers[0]['traceparent'] == f"00-{call['trace_id']}-{call['span_id']}-01"
+
+
+def test_show(poll, spans, tmp_path):
+    poll()
+    spans()
+    out = io.StringIO()
+    tracing._show(str(tmp_path / 'spans.jsonl'), out=out)
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith('trace ')
+    assert lines[1].split()[2:4] == ['request', 'method=POST']
+    assert any(line.split()[2] == 'demo_result' for line in lines[1:])
+
+
+def test_exporter_must_send():
+    class Unfinished(tracing.SpanExporter):
+        pass
+
+    with pytest.raises(TypeError):
+        Unfinished()
@@ -0,0 +1,89 @@
+import json
+from uuid import uuid4
+
+from app.individual import PROVIDER_ID
+from app.watchlist import WatchlistIndex, build_index, load_entries, normalize_name
+
+
+def test_normalize_name():
+    assert normalize_name('  Vladimír  IVANOV-Petrov ') == 'vladimir ivanov petrov'
+
+
+def test_search(watchlist_index):
+    assert len(watchlist_index) == 3
+
+    [match] = watchlist_index.search('SMITH, Johnny')
+    assert match.entry['id'] == '1'
+    assert match.matched_name == 'Johnny Smith'
+    assert match.score == 1.0
+
+    [match] = watchlist_index.search('vladimir ivanov')
+    assert match.entry['pep_role'] == 'Minister of Finance'
+
+    assert watchlist_index.search('John Smith', entity_type='COMPANY') == []
+    assert watchlist_index.search('Jane Doe') == []
+
+
+def test_search_json_source(tmp_path):
+    source = tmp_path / 'list.json'
+    source.write_text(json.dumps([{'id': 7, 'name': 'Acme Holdings', 'aliases': ['Acme Group']}]))
+    path = str(tmp_path / 'list.idx')
+    build_index(load_entries(str(source)), path)
+
+    index = WatchlistIndex(path)
+    [match] = index.search('acme group')
+    assert match.entry == {'id': '7', 'name': 'Acme Holdings', 'aliases': ['Acme Group'], 'type': 'SANCTION'}
+    index.close()
+
+
+def test_individual_check_screens_index(session, auth, watchlist_index):
+    check_id = uuid4()
+    r = session.post('http://app/individual/checks', json={
+        'id': str(check_id),
+        'check_input': {
+            'entity_type': 'INDIVIDUAL',
+            'personal_details': {
+                'name': {'given_names': ['John'], 'family_name': 'Smith'},
+                'dob': '1970-01-01',
+            },
+        },
+        'commercial_relationship': 'DIRECT',
+        'provider_config': {},
+    }, auth=auth())
+    assert r.status_code == 200
+    start = r.json()
+    assert start['errors'] == []
+
+    r = session.post(f'http://app/individual/checks/{check_id}/poll', json={
+        'id': str(check_id),
+        'provider_id': PROVIDER_ID,
+        'reference': start['reference'],
+        'commercial_relationship': 'DIRECT',
+        'provider_config': {},
+        'custom_data': start['custom_data'],
+    }, auth=auth())
+    assert r.status_code == 200
+
+    res = r.json()
+    assert res['errors'] == []
+    [hit] = res['check_output']['screening_hits']
+    assert hit['provider']['hit_id'] == '1'
+    assert hit['flags'] == [{'type': 'SANCTION'}]
+    assert hit['data']['sanctions'][0]['list'] == {'name': 'UK HM Treasury'}
+    assert hit['data']['dates'] == [{'type': 'DOB', 'date': '1970-01-01'}]
+
+
+def test_company_check_missing_name(session, auth, watchlist_index):
+    r = session.post('http://app/company/checks', json={
+        'id': str(uuid4()),
+        'check_input': {'entity_type': 'COMPANY', 'metadata': {'number': '09565115'}},
+        'commercial_relationship': 'DIRECT',
+        'provider_config': {},
+    }, auth=auth())
+    assert r.status_code == 200
+
+    assert r.json()['errors'] == [{
+        'type': 'MISSING_CHECK_INPUT',
+        'data': {'field': 'COMPANY_NAME'},
+        'message': 'Missing required field (COMPANY_NAME)',
+    }]
@@ -0,0 +1,100 @@
+import json
+import os
+
+import pytest
+
+from app.watchlist import WatchlistIndex
+from app.watchlist_store import WatchlistGeneration, WatchlistStore, load_delta
+
+ENTRIES = [
+    {'id': '1', 'name': 'John Smith', 'type': 'SANCTION'},
+    {'id': '2', 'name': 'Vladimir Ivanov', 'type': 'PEP'},
+    {'id': '3', 'name': 'Acme Trading LLC', 'type': 'SANCTION'},
+]
+
+
+def _ids(store, name):
+    return sorted(m.entry['id'] for m in store.search(name, threshold=0.5))
+
+
+def test_apply_delta(tmp_path):
+    directory = str(tmp_path / 'store')
+    writer = WatchlistStore(directory)
+    reader = WatchlistStore(directory, reload_interval=0)
+
+    assert writer.rebuild(ENTRIES) == 1
+    assert _ids(reader, 'John Smith') == ['1']
+    with reader.searching() as first_generation:
+        delta = tmp_path / 'delta.jsonl'
+        delta.write_text('\n'.join(json.dumps(change) for change in [
+            {'op': 'remove', 'id': '1'},
+            {'op': 'modify', 'entry': {'id': '2', 'name': 'Vladimir Petrov'}},
+            {'op': 'add', 'entry': {'id': '4', 'name': 'Jane Smith', 'type': 'PEP'}},
+        ]))
+        assert writer.apply_delta(load_delta(str(delta))) == 2
+
+        assert reader.current().generation == 2
+        assert _ids(reader, 'John Smith') == ['4']
+        assert _ids(reader, 'Vladimir Ivanov') == ['2']
+        assert reader.search('Vladimir Petrov')[0].entry['name'] == 'Vladimir Petrov'
+        assert _ids(reader, 'Acme Trading') == ['3']
+
+        # Searches holding on to the old generation keep working
+        assert [m.entry['id'] for m in first_generation.search('John Smith')] == ['1']
+    # ...and it is closed once they are done
+    assert first_generation.segments[0]._mmap.closed
+
+    assert writer.merge() == 3
+    assert len(reader.current().segments) == 1
+    assert _ids(reader, 'John Smith') == ['4']
+    assert sorted(e['id'] for e in reader.current().entries()) == ['2', '3', '4']
+    assert sorted(f for f in (tmp_path / 'store').iterdir() if f.name.startswith('seg-')) == \
+        [tmp_path / 'store' / 'seg-000003.idx']
+
+
+def test_merges_after_max_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr('app.watchlist_store.MAX_SEGMENTS', 2)
+    store = WatchlistStore(str(tmp_path), reload_interval=0)
+    store.rebuild(ENTRIES)
+
+    store.apply_delta([('add', '4', {'id': '4', 'name': 'Jane Doe', 'type': 'PEP'})])
+    assert len(store.current().segments) == 2
+
+    store.apply_delta([('remove', '3', None)])
+    assert len(store.current().segments) == 1
+    assert _ids(store, 'Acme Trading') == []
+    assert _ids(store, 'Jane Doe') == ['4']
+
+
+def test_no_manifest_yet(tmp_path):
+    directory = tmp_path / 'store'
+    directory.mkdir()
+    reader = WatchlistStore(str(directory), reload_interval=0)
+    assert reader.current().generation == 0
+    assert reader.search('John Smith') == []
+
+    assert WatchlistStore(str(directory)).rebuild(ENTRIES) == 1
+    assert _ids(reader, 'John Smith') == ['1']
+
+
+def test_closes_replaced_generations(tmp_path, monkeypatch):
+    closed = []
+    monkeypatch.setattr(WatchlistIndex, 'close', lambda self: closed.append(os.path.basename(self.path)))
+    directory = str(tmp_path / 'store')
+    writer = WatchlistStore(directory)
+    reader = WatchlistStore(directory, reload_interval=0)
+
+    writer.rebuild(ENTRIES)
+    assert _ids(reader, 'John Smith') == ['1']
+    writer.apply_delta([('remove', '1', None)])
+    assert _ids(reader, 'John Smith') == []
+    assert closed == ['seg-000001.idx']
+
+    # Segments opened before one that a merge removed are closed too
+    closed.clear()
+    with pytest.raises(FileNotFoundError):
+        WatchlistGeneration(directory, {'generation': 3, 'segments': [
+            {'file': 'seg-000000.idx', 'masks': []}, {'file': 'seg-000001.idx', 'masks': []},
+            {'file': 'seg-000002.idx', 'masks': []},
+        ]})
+    assert sorted(closed) == ['seg-000001.idx', 'seg-000002.idx']
@@ -0,0 +1,93 @@
+import os
+import time
+from uuid import uuid4
+
+import pytest
+
+from app.individual import PROVIDER_ID
+from app.watchlist import WatchlistIndex, build_index
+from app.workers import Overloaded, PoolBroken, TaskTimeout, WorkerPool
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(processes=1, max_queued=0)
+    yield pool
+    pool.shutdown()
+
+
+def test_run(pool):
+    assert pool.run(10, pow, 2, 10) == 1024
+
+
+def test_timeout_and_backpressure(pool):
+    with pytest.raises(TaskTimeout):
+        pool.run(0.1, time.sleep, 1)
+
+    # The timed out task is still running, so there is no capacity left
+    with pytest.raises(Overloaded):
+        pool.run(10, pow, 2, 10)
+
+    time.sleep(1)
+    assert pool.run(10, pow, 2, 10) == 1024
+
+
+def test_recovers_from_dead_process(pool):
+    with pytest.raises(PoolBroken):
+        pool.run(10, os._exit, 1)
+
+    # A new pool, with the dead task's capacity back
+    assert pool.run(10, pow, 2, 10) == 1024
+
+
+def test_heavy_screening_runs_in_pool(session, auth, tmp_path, monkeypatch, pool):
+    path = str(tmp_path / 'list.idx')
+    build_index([{'id': '1', 'name': 'John Smith', 'type': 'SANCTION'}], path)
+    monkeypatch.setattr('app.screening._index', WatchlistIndex(path))
+    monkeypatch.setattr('app.screening._pool', pool)
+    monkeypatch.setattr('app.screening.HEAVY_SCREENING_COST', 0)
+
+    check_id = uuid4()
+    r = session.post(f'http://app/individual/checks/{check_id}/poll', json={
+        'id': str(check_id),
+        'provider_id': PROVIDER_ID,
+        'reference': str(check_id),
+        'commercial_relationship': 'PASSFORT',
+        'provider_config': {},
+        'custom_data': {'counter': 0, 'query': {'name': 'John Smith'}},
+    }, auth=auth())
+    assert r.status_code == 200
+    assert r.headers['content-type'] == 'application/json'
+
+    res = r.json()
+    assert res['errors'] == []
+    assert [h['provider']['hit_id'] for h in res['check_output']['screening_hits']] == ['1']
+    assert res['charges'] == [{'amount': 100, 'reference': str(check_id)}]
+
+
+def test_screening_timeout_is_an_error(session, auth, tmp_path, monkeypatch):
+    path = str(tmp_path / 'list.idx')
+    build_index([{'id': '1', 'name': 'John Smith', 'type': 'SANCTION'}], path)
+    monkeypatch.setattr('app.screening._index', WatchlistIndex(path))
+    monkeypatch.setattr('app.screening.HEAVY_SCREENING_COST', 0)
+    monkeypatch.setattr('app.screening.screening_timeout', 0.1)
+
+    class SlowPool:
+        def run(self, timeout, fn, *args):
+            raise TaskTimeout()
+
+    monkeypatch.setattr('app.screening._pool', SlowPool())
+
+    check_id = uuid4()
+    r = session.post(f'http://app/individual/checks/{check_id}/poll', json={
+        'id': str(check_id),
+        'provider_id': PROVIDER_ID,
+        'reference': str(check_id),
+        'commercial_relationship': 'DIRECT',
+        'provider_config': {},
+        'custom_data': {'counter': 0, 'query': {'name': 'John Smith'}},
+    }, auth=auth())
+    assert r.json()['errors'] == [{
+        'type': 'PROVIDER_CONNECTION',
+        'message': 'Screening did not finish within 0.1 seconds.',
+    }]